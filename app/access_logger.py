@@ -0,0 +1,104 @@
+import logging
+import os
+import random
+from typing import Any, Dict, Optional
+
+from app.logger import logger
+
+# bodies of these types are never logged, only their size
+UNLOGGED_BODY_MIMETYPES = ("multipart/form-data", "application/octet-stream", "text/csv")
+UNLOGGED_BODY_MIMETYPE_PREFIXES = ("image/", "audio/", "video/")
+
+
+class LoggedBody:
+    """
+    formats a request or response body only if and when the log record is written
+    """
+
+    def __init__(self, mimetype: Optional[str], content_length: Optional[int], data: bytes):
+        self.mimetype = mimetype
+        self.content_length = content_length
+        self.data = data
+
+    def __str__(self) -> str:
+        if not self.data:
+            return f"<{self.content_length or 0} bytes of {self.mimetype}>"
+
+        text = self.data.decode("utf-8", "replace")
+        if self.content_length is not None and self.content_length > len(self.data):
+            return f"{text}... <{self.content_length} bytes>"
+        return text
+
+    __repr__ = __str__
+
+
+class AccessLogger:
+    """
+    writes one line per request, after the response is ready
+    a sample of the successful requests is logged, server errors always are. bodies are capped
+    at max_body_bytes and binary or file bodies are left out, nothing is formatted unless the
+    line is actually logged
+    """
+
+    def __init__(self, sample_rate: float, max_body_bytes: int):
+        self.sample_rate = sample_rate
+        self.max_body_bytes = max_body_bytes
+
+    @classmethod
+    def from_environment(cls) -> "AccessLogger":
+        return cls(
+            sample_rate=float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "1")),
+            max_body_bytes=int(os.getenv("ACCESS_LOG_MAX_BODY_BYTES", "1024")),
+        )
+
+    def should_log(self, status_code: int) -> bool:
+        if not logger.isEnabledFor(logging.INFO):
+            return False
+        return status_code >= 500 or random.random() < self.sample_rate
+
+    def is_body_logged(self, mimetype: Optional[str], content_length: Optional[int]) -> bool:
+        if self.max_body_bytes <= 0 or not content_length:
+            return False
+        mimetype = mimetype or ""
+        return mimetype not in UNLOGGED_BODY_MIMETYPES and not mimetype.startswith(
+            UNLOGGED_BODY_MIMETYPE_PREFIXES
+        )
+
+    def get_body(
+        self, mimetype: Optional[str], content_length: Optional[int], data: Optional[bytes]
+    ) -> LoggedBody:
+        """
+        data is only looked at when the body may be logged, callers pass None when they could
+        not read it without buffering it
+        """
+        if data is None or not self.is_body_logged(mimetype, content_length):
+            data = b""
+        return LoggedBody(
+            mimetype=mimetype, content_length=content_length, data=data[: self.max_body_bytes]
+        )
+
+    def log(
+        self,
+        method: str,
+        url: str,
+        status_code: int,
+        duration_seconds: float,
+        request_body: Optional[LoggedBody] = None,
+        response_body: Optional[LoggedBody] = None,
+    ) -> None:
+        access_record: Dict[str, Any] = {
+            "method": method,
+            "url": url,
+            "status_code": status_code,
+            "duration_ms": round(duration_seconds * 1000, 2),
+        }
+        # empty bodies are left out
+        if request_body is not None and (request_body.content_length or request_body.data):
+            access_record["request_body"] = request_body
+        if response_body is not None and (response_body.content_length or response_body.data):
+            access_record["response_body"] = response_body
+
+        logger.info("Access: %s", access_record)
+
+
+access_logger = AccessLogger.from_environment()
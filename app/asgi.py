@@ -0,0 +1,24 @@
+"""
+async serving mode, the flask app behind an ASGI adapter so that any ASGI server can run it,
+e.g. uvicorn app.asgi:application
+asgiref's WsgiToAsgi reads the request body on the event loop, spooling a large upload to a
+temporary file, and sends the response to the client chunk by chunk as the app yields it, so a
+slow client only holds a coroutine while its body is sent or received. the app runs in a worker
+thread, with every route, error handler and metric it has under run.py
+"""
+
+from typing import Any
+
+
+def create_application() -> Any:
+    try:
+        from asgiref.wsgi import WsgiToAsgi
+    except ImportError as e:
+        raise RuntimeError("the asgi serving mode needs the asgiref package") from e
+
+    from app.main import app
+
+    return WsgiToAsgi(app)
+
+
+application = create_application()
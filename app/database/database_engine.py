@@ -1,33 +1,147 @@
-from typing import Optional
-from sqlalchemy import create_engine, Engine
+from typing import Any, Dict, Optional
+from sqlalchemy import create_engine, event, Engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import StaticPool
 import os
 from dotenv import load_dotenv
 
 
 class DatabaseEngine:
+    """
+    the app talks to the database through two engines with their own connection pools
+    writes and reads that must see them go through the write engine, polling and downloads go
+    through the read engine so that they never wait for a connection held by ingestion
+    both point at DATABASE_URL unless DATABASE_READ_URL names a replica
+
+    SQLite files are put in WAL mode, which lets readers run while the single writer commits
+    """
+
     engine: Optional[Engine] = None
+    read_engine: Optional[Engine] = None
 
     @classmethod
-    def create_mysql_db_engine(cls) -> Engine:
-        if cls.engine is not None:
-            return cls.engine
-
+    def get_database_url(cls) -> str:
         load_dotenv()
 
+        database_url = os.getenv("DATABASE_URL")
+        if database_url:
+            return database_url
+
         environment = os.getenv("ENVIRONMENT")
 
         if environment == "TEST":
             # Use in-memory SQLite for testing environment
-            cls.engine = create_engine("sqlite:///:memory:", echo=True)
+            return "sqlite:///:memory:"
+
+        # Ensure the database is in the root of the project
+        project_root = os.path.dirname(
+            os.path.abspath(__file__)
+        )  # Get the current script's directory
+        db_file = os.getenv(f"{environment}_DATABASE_PATH", "sqlite.db")
+        db_path = os.path.join(project_root, db_file)
+
+        # Use a file-based SQLite database in the root of the project directory
+        return f"sqlite:///{db_path}"
+
+    @classmethod
+    def get_engine_options(cls, database_url: str, pool_size: int) -> Dict[str, Any]:
+        url = make_url(database_url)
+        options: Dict[str, Any] = {
+            "echo": os.getenv("DATABASE_ECHO", "false").lower() == "true",
+        }
+
+        if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+            # one shared connection, otherwise every pooled connection gets its own empty database
+            options["poolclass"] = StaticPool
+            options["connect_args"] = {"check_same_thread": False}
+            return options
+
+        options.update(
+            pool_size=pool_size,
+            max_overflow=int(os.getenv("DATABASE_MAX_OVERFLOW", "10")),
+            pool_timeout=float(os.getenv("DATABASE_POOL_TIMEOUT_SECONDS", "30")),
+            pool_recycle=int(os.getenv("DATABASE_POOL_RECYCLE_SECONDS", "1800")),
+            pool_pre_ping=url.get_backend_name() != "sqlite",
+        )
+        if url.get_backend_name() == "sqlite":
+            options["connect_args"] = {
+                "check_same_thread": False,
+                "timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")) / 1000,
+            }
+        return options
+
+    @classmethod
+    def apply_sqlite_pragmas(cls, engine: Engine, read_only: bool) -> None:
+        """
+        sets the pragmas on every new connection of a SQLite engine
+        """
+        if engine.dialect.name != "sqlite":
+            return
+
+        pragmas = [
+            f"PRAGMA busy_timeout = {int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))}",
+            f"PRAGMA synchronous = {os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')}",
+            f"PRAGMA cache_size = {int(os.getenv('SQLITE_CACHE_SIZE_KB', '65536')) * -1}",
+            f"PRAGMA mmap_size = {int(os.getenv('SQLITE_MMAP_SIZE_BYTES', str(256 * 1024 * 1024)))}",
+            "PRAGMA temp_store = MEMORY",
+        ]
+        if read_only:
+            pragmas.append("PRAGMA query_only = ON")
         else:
-            # Ensure the database is in the root of the project
-            project_root = os.path.dirname(
-                os.path.abspath(__file__)
-            )  # Get the current script's directory
-            db_file = os.getenv(f"{environment}_DATABASE_PATH", "sqlite.db")
-            db_path = os.path.join(project_root, db_file)
+            # the journal mode is stored in the file, the write engine sets it for everyone
+            pragmas.insert(0, f"PRAGMA journal_mode = {os.getenv('SQLITE_JOURNAL_MODE', 'WAL')}")
+
+        @event.listens_for(engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection: Any, connection_record: Any) -> None:
+            cursor = dbapi_connection.cursor()
+            try:
+                for pragma in pragmas:
+                    cursor.execute(pragma)
+            finally:
+                cursor.close()
+
+    @classmethod
+    def create_mysql_db_engine(cls) -> Engine:
+        """
+        the write engine, the name is kept from when the app was meant to run on MySQL
+        """
+        if cls.engine is not None:
+            return cls.engine
 
-            # Use a file-based SQLite database in the root of the project directory
-            cls.engine = create_engine(f"sqlite:///{db_path}", echo=True)
+        database_url = cls.get_database_url()
+        engine = create_engine(
+            database_url,
+            **cls.get_engine_options(
+                database_url=database_url,
+                pool_size=int(os.getenv("DATABASE_POOL_SIZE", "5")),
+            ),
+        )
+        cls.apply_sqlite_pragmas(engine=engine, read_only=False)
 
+        cls.engine = engine
         return cls.engine
+
+    @classmethod
+    def create_read_db_engine(cls) -> Engine:
+        if cls.read_engine is not None:
+            return cls.read_engine
+
+        write_engine = cls.create_mysql_db_engine()
+        database_url = os.getenv("DATABASE_READ_URL") or cls.get_database_url()
+
+        if isinstance(write_engine.pool, StaticPool):
+            # an in-memory database only exists on the write engine's connection
+            cls.read_engine = write_engine
+            return cls.read_engine
+
+        read_engine = create_engine(
+            database_url,
+            **cls.get_engine_options(
+                database_url=database_url,
+                pool_size=int(os.getenv("DATABASE_READ_POOL_SIZE", "10")),
+            ),
+        )
+        cls.apply_sqlite_pragmas(engine=read_engine, read_only=True)
+
+        cls.read_engine = read_engine
+        return cls.read_engine
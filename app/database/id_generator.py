@@ -0,0 +1,87 @@
+"""
+ids of the models are a token and a truncated hash of their identifiers, like product_18d0267860
+
+the identifiers are joined once, each followed by ID_DELIMITER, and hashed in one call.
+ID_HASH_ALGORITHM picks the hash, sha256 by default or blake2b, which costs a little less per short id but gives every row another
+id than sha256 did, so it is only meant for a fresh database
+
+a short id keeps ID_HASH_LENGTH hex characters, 40 bits, and two of a million rows share one
+about every other time. callers that can meet a collision, a short id already taken by other
+identifiers, fall back to the long id of the identifiers, see get_long_id
+"""
+
+import hashlib
+import os
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+ID_DELIMITER = "|"
+ID_HASH_LENGTH = 10
+LONG_ID_HASH_LENGTH = 64
+
+# every algorithm builds a new hash object for ids of a given number of hex characters
+ID_HASH_ALGORITHMS: Dict[str, Callable[[int], Any]] = {
+    "sha256": lambda length: hashlib.sha256(),
+    # blake2b computes a digest of the asked size instead of truncating a longer one
+    "blake2b": lambda length: hashlib.blake2b(digest_size=(length + 1) // 2),
+}
+
+
+@lru_cache(maxsize=None)
+def get_hash_algorithm() -> str:
+    # read once, every id of a process is hashed the same way and an env lookup per id costs
+    # about as much as the hash
+    algorithm = os.getenv("ID_HASH_ALGORITHM", "sha256")
+    if algorithm not in ID_HASH_ALGORITHMS:
+        raise ValueError(
+            f"ID_HASH_ALGORITHM {algorithm} is not one of {sorted(ID_HASH_ALGORITHMS)}"
+        )
+    return algorithm
+
+
+def hash_bytes(data: bytes, length: int = ID_HASH_LENGTH) -> str:
+    content_hash = ID_HASH_ALGORITHMS[get_hash_algorithm()](length)
+    content_hash.update(data)
+    return content_hash.hexdigest()[:length]
+
+
+def join_identifiers(identifiers: Sequence[Any]) -> bytes:
+    # the same string the ids were always hashed from, every identifier followed by the delimiter
+    return "".join([str(identifier) + ID_DELIMITER for identifier in identifiers]).encode("utf-8")
+
+
+def generate_id(token: str, identifiers: Sequence[Any], length: int = ID_HASH_LENGTH) -> str:
+    return token + "_" + hash_bytes(join_identifiers(identifiers), length)
+
+
+def generate_ids(
+    token: str, identifier_rows: Iterable[Sequence[Any]], length: int = ID_HASH_LENGTH
+) -> List[str]:
+    """
+    ids of many rows at once, the hash is looked up once and not per row
+    """
+    new_hash = ID_HASH_ALGORITHMS[get_hash_algorithm()]
+    prefix = token + "_"
+    ids = []
+    for identifiers in identifier_rows:
+        content_hash = new_hash(length)
+        content_hash.update(join_identifiers(identifiers))
+        ids.append(prefix + content_hash.hexdigest()[:length])
+    return ids
+
+
+def get_long_id(token: str, identifiers: Sequence[Any]) -> str:
+    """
+    the id given to identifiers whose short id is taken by other identifiers
+    """
+    return generate_id(token, identifiers, length=LONG_ID_HASH_LENGTH)
+
+
+def is_collision(known_identifiers: Optional[Sequence[Any]], identifiers: Sequence[Any]) -> bool:
+    """
+    whether an id that is already known for known_identifiers, or not known at all when they are
+    None, was computed from other identifiers
+    """
+    return known_identifiers is not None and tuple(map(str, known_identifiers)) != tuple(
+        map(str, identifiers)
+    )
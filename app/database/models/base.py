@@ -1,27 +1,15 @@
 from abc import abstractmethod
 from datetime import datetime
-import hashlib
 from typing import Any, List
 from sqlalchemy import DateTime, ForeignKey, String, Text, Boolean, Integer
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import Mapped, mapped_column
 
+from app.database import id_generator
 
-def get_delimiter() -> str:
-    return "|"
-
-
-def calculate_sha256_hash_first_ten(input_string: str) -> str:
-    # Create a new SHA-256 hash object
-    sha256_hash = hashlib.sha256()
 
-    # Update the hash object with the input string
-    sha256_hash.update(input_string.encode("utf-8"))
-
-    # Get the hexadecimal representation of the hash
-    hashed_string: str = sha256_hash.hexdigest()
-
-    return hashed_string[0:10]
+def get_delimiter() -> str:
+    return id_generator.ID_DELIMITER
 
 
 class Base(DeclarativeBase):
@@ -41,8 +29,8 @@ class Base(DeclarativeBase):
         pass
 
     def compute_and_get_id(self) -> str:
-        identifier_string: str = ""
-        for identifier in self.get_identifiers():
-            identifier_string += str(identifier) + get_delimiter()
+        return id_generator.generate_id(self.token(), self.get_identifiers())
 
-        return self.token() + "_" + calculate_sha256_hash_first_ten(identifier_string)
+    def compute_and_get_long_id(self) -> str:
+        # the id to use when compute_and_get_id collides with the id of other identifiers
+        return id_generator.get_long_id(self.token(), self.get_identifiers())
@@ -0,0 +1,56 @@
+from dataclasses import asdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from sqlalchemy import JSON, ForeignKey, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database.query_models.catalog_query_model import CreateCatalogQueryModel
+
+
+from app.database import id_generator
+from ..models.base import Base
+
+
+class CatalogModel(Base):
+    """
+    the catalogue of a supplier, whose products live in CATALOG_PRODUCTS keyed on supplier and
+    s_no instead of on the file they came from, every delta upload of the supplier is applied to
+    it in turn
+    """
+
+    id: Mapped[str] = mapped_column("ID", String(100), primary_key=True, index=True)
+    supplier_id: Mapped[str] = mapped_column(
+        "SUPPLIER_ID", String(100), nullable=False, unique=True
+    )
+    # the last file applied to the catalogue
+    csv_file_id: Mapped[Optional[str]] = mapped_column(
+        "CSV_FILE_ID", String(100), ForeignKey("CSV_FILES.ID"), nullable=True
+    )
+    # id of the job applying a file right now, only one job changes a catalogue at a time
+    lease_owner: Mapped[Optional[str]] = mapped_column("LEASE_OWNER", String(100), nullable=True)
+
+    meta_data: Mapped[Dict[Any, Any]] = mapped_column("METADATA", JSON, nullable=False, default={})
+
+    __tablename__ = "CATALOGS"
+
+    def __init__(self, create_catalog_request_model: CreateCatalogQueryModel):
+        current_time = datetime.now()
+
+        kw = asdict(create_catalog_request_model)
+
+        kwargs = {key: value for key, value in kw.items() if key in self.__annotations__}
+
+        super().__init__(**kwargs, created_at=current_time, updated_at=current_time)
+
+        super().__init__(id=self.compute_and_get_id())
+
+    def token(self) -> str:
+        return "catalog"
+
+    def get_identifiers(self) -> List[Any]:
+        return [self.supplier_id]
+
+    @classmethod
+    def get_id_for_supplier(cls, supplier_id: str) -> str:
+        # same id compute_and_get_id gives, without building the model
+        return id_generator.generate_id("catalog", [supplier_id])
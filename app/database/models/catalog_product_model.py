@@ -0,0 +1,77 @@
+import json
+from typing import Any, Dict, Iterable, List, Tuple
+from sqlalchemy import JSON, Boolean, ForeignKey, Index, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+
+from app.database import id_generator
+from ..models.base import Base
+
+# hex characters of the content fingerprint of a product
+FINGERPRINT_LENGTH = 32
+
+
+class CatalogProductModel(Base):
+    """
+    a product of a supplier's catalogue, there is one row per supplier and s_no whichever file
+    it came from. the row keeps the fingerprint of its content, so that a delta upload only
+    writes the products whose fingerprint changed, and a product missing from the latest upload
+    is kept as a tombstone, is_deleted, instead of being deleted
+    rows are only written as insert parameters, by CsvDeltaUploadService
+    """
+
+    id: Mapped[str] = mapped_column("ID", String(100), primary_key=True, index=True)
+    supplier_id: Mapped[str] = mapped_column("SUPPLIER_ID", String(100), nullable=False)
+    # the file that last inserted, changed or tombstoned the product
+    csv_file_id: Mapped[str] = mapped_column(
+        "CSV_FILE_ID", String(100), ForeignKey("CSV_FILES.ID"), nullable=False
+    )
+
+    s_no: Mapped[str] = mapped_column("PRODUCT_SL_NO", String(255), nullable=False)
+    product_name: Mapped[str] = mapped_column("PRODUCT_NAME", String(255), nullable=False)
+    input_image_urls: Mapped[List[str]] = mapped_column(
+        "INPUT_PRODUCT_IMAGE_URLS", JSON, nullable=False
+    )
+    output_image_urls: Mapped[List[str]] = mapped_column(
+        "OUTPUT_PRODUCT_IMAGE_URLS", JSON, nullable=False
+    )
+    fingerprint: Mapped[str] = mapped_column("FINGERPRINT", String(64), nullable=False)
+    is_deleted: Mapped[bool] = mapped_column("IS_DELETED", Boolean, nullable=False, default=False)
+
+    meta_data: Mapped[Dict[Any, Any]] = mapped_column("METADATA", JSON, nullable=False, default={})
+
+    __tablename__ = "CATALOG_PRODUCTS"
+    # the diff of a batch looks its products up by s_no, downloads seek through a catalogue by id
+    __table_args__ = (
+        Index(
+            "ix_CATALOG_PRODUCTS_SUPPLIER_ID_PRODUCT_SL_NO",
+            "SUPPLIER_ID",
+            "PRODUCT_SL_NO",
+            unique=True,
+        ),
+        Index("ix_CATALOG_PRODUCTS_SUPPLIER_ID_ID", "SUPPLIER_ID", "ID"),
+    )
+
+    def token(self) -> str:
+        return "catalog_product"
+
+    def get_identifiers(self) -> List[Any]:
+        return [self.supplier_id, self.s_no]
+
+    @classmethod
+    def get_ids_for_catalog_products(cls, identifier_rows: Iterable[Tuple[str, str]]) -> List[str]:
+        """
+        :param identifier_rows: supplier_id and s_no of every product
+        """
+        return id_generator.generate_ids("catalog_product", identifier_rows)
+
+    @classmethod
+    def get_long_id_for_catalog_product(cls, supplier_id: str, s_no: str) -> str:
+        return id_generator.get_long_id("catalog_product", [supplier_id, s_no])
+
+    @classmethod
+    def get_fingerprint(cls, product_name: str, input_image_urls: List[str]) -> str:
+        # json keeps a delimiter inside a name or url from making two products look the same
+        return id_generator.hash_bytes(
+            json.dumps([product_name, input_image_urls]).encode("utf-8"), FINGERPRINT_LENGTH
+        )
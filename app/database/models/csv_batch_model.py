@@ -0,0 +1,52 @@
+from dataclasses import asdict
+from datetime import datetime
+from typing import Any, Dict, List
+from sqlalchemy import JSON, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database.query_models.csv_batch_query_model import CreateCsvBatchQueryModel
+
+
+from ..models.base import Base
+
+
+class CsvBatchModel(Base):
+    """
+    files uploaded together, in one request or one archive, each file keeps its own csv row and
+    job, the batch only lists them so that their progress can be polled as one
+    """
+
+    id: Mapped[str] = mapped_column("ID", String(100), primary_key=True, index=True)
+    # file_name and csv_file_id of every file, a file uploaded twice in a batch is listed twice
+    csv_files: Mapped[List[Dict[str, str]]] = mapped_column("CSV_FILES", JSON, nullable=False)
+    file_count: Mapped[int] = mapped_column("FILE_COUNT", Integer, nullable=False)
+
+    meta_data: Mapped[Dict[Any, Any]] = mapped_column("METADATA", JSON, nullable=False, default={})
+
+    __tablename__ = "CSV_BATCHES"
+
+    def __init__(self, create_csv_batch_request_model: CreateCsvBatchQueryModel):
+        current_time = datetime.now()
+
+        kw = asdict(create_csv_batch_request_model)
+
+        kwargs = {key: value for key, value in kw.items() if key in self.__annotations__}
+
+        super().__init__(
+            **kwargs,
+            file_count=len(create_csv_batch_request_model.csv_files),
+            created_at=current_time,
+            updated_at=current_time,
+        )
+
+        super().__init__(id=self.compute_and_get_id())
+
+    def token(self) -> str:
+        return "batch"
+
+    def get_identifiers(self) -> List[Any]:
+        # the same files in the same order are the same batch
+        return self.get_csv_file_ids()
+
+    def get_csv_file_ids(self) -> List[str]:
+        return [csv_file["csv_file_id"] for csv_file in self.csv_files]
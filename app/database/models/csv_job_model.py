@@ -0,0 +1,79 @@
+from dataclasses import asdict
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, List, Optional
+from sqlalchemy import JSON, DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database.query_models.csv_job_query_model import CreateCsvJobQueryModel
+
+
+from app.database import id_generator
+from ..models.base import Base
+
+
+class CsvJobStatus(str, Enum):
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    COMPLETED = "COMPLETED"
+    FAILED = "FAILED"
+
+
+class CsvJobModel(Base):
+    id: Mapped[str] = mapped_column("ID", String(100), primary_key=True, index=True)
+    csv_file_id: Mapped[str] = mapped_column(
+        "CSV_FILE_ID", String(100), ForeignKey("CSV_FILES.ID"), nullable=False, unique=True
+    )
+    status: Mapped[str] = mapped_column("STATUS", String(20), nullable=False, index=True)
+
+    # a worker owns a RUNNING job only until lease_expires_at, after that any worker may claim it
+    # this is how jobs that were in flight when a worker died get picked up again
+    lease_owner: Mapped[Optional[str]] = mapped_column("LEASE_OWNER", String(100), nullable=True)
+    lease_expires_at: Mapped[Optional[datetime]] = mapped_column(
+        "LEASE_EXPIRES_AT", DateTime, nullable=True
+    )
+    attempts: Mapped[int] = mapped_column("ATTEMPTS", Integer, nullable=False, default=0)
+    error: Mapped[Optional[str]] = mapped_column("ERROR", Text, nullable=True)
+
+    # progress counters, kept up to date by the worker after every batch so polling stays cheap
+    total_rows: Mapped[int] = mapped_column("TOTAL_ROWS", Integer, nullable=False, default=0)
+    processed_rows: Mapped[int] = mapped_column(
+        "PROCESSED_ROWS", Integer, nullable=False, default=0
+    )
+    failed_rows: Mapped[int] = mapped_column("FAILED_ROWS", Integer, nullable=False, default=0)
+    in_flight_rows: Mapped[int] = mapped_column(
+        "IN_FLIGHT_ROWS", Integer, nullable=False, default=0
+    )
+    # data rows at the start of the file whose batches are committed, committed in the same
+    # transaction as the batch itself so a retried job resumes right after it
+    checkpoint_rows: Mapped[int] = mapped_column(
+        "CHECKPOINT_ROWS", Integer, nullable=False, default=0
+    )
+    started_at: Mapped[Optional[datetime]] = mapped_column("STARTED_AT", DateTime, nullable=True)
+    finished_at: Mapped[Optional[datetime]] = mapped_column("FINISHED_AT", DateTime, nullable=True)
+
+    meta_data: Mapped[Dict[Any, Any]] = mapped_column("METADATA", JSON, nullable=False, default={})
+
+    __tablename__ = "CSV_JOBS"
+
+    def __init__(self, create_csv_job_request_model: CreateCsvJobQueryModel):
+        current_time = datetime.now()
+
+        kw = asdict(create_csv_job_request_model)
+
+        kwargs = {key: value for key, value in kw.items() if key in self.__annotations__}
+
+        super().__init__(**kwargs, created_at=current_time, updated_at=current_time)
+
+        super().__init__(id=self.compute_and_get_id())
+
+    def token(self) -> str:
+        return "job"
+
+    def get_identifiers(self) -> List[Any]:
+        return [self.csv_file_id]
+
+    @classmethod
+    def get_id_for_csv_file(cls, csv_file_id: str) -> str:
+        # same id compute_and_get_id gives, without building the model
+        return id_generator.generate_id("job", [csv_file_id])
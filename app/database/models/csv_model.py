@@ -1,7 +1,7 @@
 from dataclasses import asdict
 from datetime import datetime
 from typing import Any, Dict, List, Optional
-from sqlalchemy import BLOB, JSON, Boolean, ForeignKey, String, Text
+from sqlalchemy import JSON, BigInteger, Boolean, ForeignKey, Integer, String, Text
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.database.query_models.csv_query_model import CreateCsvQueryModel
@@ -12,12 +12,17 @@ from ..models.base import Base
 
 class CsvModel(Base):
     id: Mapped[str] = mapped_column("ID", String(100), primary_key=True, index=True)
-    csv_file: Mapped[Optional[bytes]] = mapped_column(
-        "csv_file", BLOB, nullable=True
-    )  # Column to store the CSV file as binary data
+    # the file itself lives in the blob store, the row only keeps what is needed to find it
+    blob_key: Mapped[str] = mapped_column("BLOB_KEY", String(64), nullable=False, index=True)
+    size_bytes: Mapped[int] = mapped_column("SIZE_BYTES", BigInteger, nullable=False)
+    row_count: Mapped[int] = mapped_column(
+        "ROW_COUNT", Integer, nullable=False
+    )  # number of data rows, the header not included
     is_processed: Mapped[bool] = mapped_column(
         "is_processed", Boolean, default=False
     )  # Column to store whether the CSV has been processed
+    # set for delta uploads, which are applied to the supplier's catalogue, see CatalogModel
+    supplier_id: Mapped[Optional[str]] = mapped_column("SUPPLIER_ID", String(100), nullable=True)
 
     meta_data: Mapped[Dict[Any, Any]] = mapped_column("METADATA", JSON, nullable=False, default={})
 
@@ -38,4 +43,7 @@ class CsvModel(Base):
         return "csv"
 
     def get_identifiers(self) -> List[Any]:
-        return [self.csv_file]
+        # the same content sent for a catalogue is another file than the plain upload of it
+        if self.supplier_id:
+            return [self.blob_key, self.supplier_id]
+        return [self.blob_key]
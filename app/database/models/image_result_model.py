@@ -0,0 +1,53 @@
+from dataclasses import asdict
+from datetime import datetime
+from typing import Any, Iterable, List
+from sqlalchemy import DateTime, String, Text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import id_generator
+from app.database.query_models.image_result_query_model import CreateImageResultQueryModel
+
+
+from ..models.base import Base
+
+
+class ImageResultModel(Base):
+    # keyed on the long id of the input url, a cache must never serve another url's result
+    id: Mapped[str] = mapped_column("ID", String(100), primary_key=True, index=True)
+    input_url: Mapped[str] = mapped_column("INPUT_URL", Text, nullable=False)
+    output_url: Mapped[str] = mapped_column("OUTPUT_URL", Text, nullable=False)
+    expires_at: Mapped[datetime] = mapped_column("EXPIRES_AT", DateTime, nullable=False, index=True)
+
+    __tablename__ = "IMAGE_RESULTS"
+
+    def __init__(self, create_image_result_request_model: CreateImageResultQueryModel):
+        current_time = datetime.now()
+
+        kw = asdict(create_image_result_request_model)
+
+        kwargs = {key: value for key, value in kw.items() if key in self.__annotations__}
+
+        super().__init__(**kwargs, created_at=current_time, updated_at=current_time)
+
+        super().__init__(id=self.compute_and_get_id())
+
+    def token(self) -> str:
+        return "image"
+
+    def get_identifiers(self) -> List[Any]:
+        return [self.input_url]
+
+    def compute_and_get_id(self) -> str:
+        return self.get_id_for_input_url(self.input_url)
+
+    @classmethod
+    def get_id_for_input_url(cls, input_url: str) -> str:
+        return cls.get_ids_for_input_urls([input_url])[0]
+
+    @classmethod
+    def get_ids_for_input_urls(cls, input_urls: Iterable[str]) -> List[str]:
+        return id_generator.generate_ids(
+            "image",
+            ([input_url] for input_url in input_urls),
+            length=id_generator.LONG_ID_HASH_LENGTH,
+        )
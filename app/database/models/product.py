@@ -1,12 +1,13 @@
 from dataclasses import asdict
 from datetime import datetime
-from typing import Any, Dict, List, Optional
-from sqlalchemy import JSON, ForeignKey, String, Text
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import JSON, ForeignKey, Index, Integer, String, Text
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.database.query_models.product_query_model import CreateProductQueryModel
 
 
+from app.database import id_generator
 from ..models.base import Base
 
 
@@ -37,10 +38,18 @@ class ProductModel(Base):
         JSON,
         nullable=False,
     )
+    # the data row of the file the product was read from, counted from 1, keeps the file order
+    row_number: Mapped[int] = mapped_column("ROW_NUMBER", Integer, nullable=False, default=0)
 
     meta_data: Mapped[Dict[Any, Any]] = mapped_column("METADATA", JSON, nullable=False, default={})
 
     __tablename__ = "PRODUCTS"
+    # let downloads seek through one file's products in file order, and the products api by
+    # s_no, without sorting them
+    __table_args__ = (
+        Index("ix_PRODUCTS_CSV_FILE_ID_ROW_NUMBER", "CSV_FILE_ID", "ROW_NUMBER", "ID"),
+        Index("ix_PRODUCTS_CSV_FILE_ID_PRODUCT_SL_NO", "CSV_FILE_ID", "PRODUCT_SL_NO"),
+    )
 
     def __init__(self, create_product_request_model: CreateProductQueryModel):
         current_time = datetime.now()
@@ -58,3 +67,104 @@ class ProductModel(Base):
 
     def get_identifiers(self) -> List[Any]:
         return [self.s_no, self.csv_file_id]
+
+    @classmethod
+    def get_id_for_product(cls, s_no: str, csv_file_id: str) -> str:
+        # same id compute_and_get_id gives, without building the model
+        return id_generator.generate_id("product", [s_no, csv_file_id])
+
+    @classmethod
+    def get_ids_for_products(cls, identifier_rows: Iterable[Tuple[str, str]]) -> List[str]:
+        """
+        :param identifier_rows: s_no and csv_file_id of every product
+        """
+        return id_generator.generate_ids("product", identifier_rows)
+
+    @classmethod
+    def get_long_id_for_product(cls, s_no: str, csv_file_id: str) -> str:
+        return id_generator.get_long_id("product", [s_no, csv_file_id])
+
+
+class ProductInsertRow:
+    """
+    a product on the ingestion path, written with upsert_rows without ever becoming a
+    ProductModel. building a ProductModel copies the fields through asdict, runs the model's
+    __init__ twice and sets every field through SQLAlchemy's instrumentation, which is most of
+    the cost of a row. the api paths keep using ProductModel
+    """
+
+    __slots__ = (
+        "id",
+        "csv_file_id",
+        "s_no",
+        "product_name",
+        "input_image_urls",
+        "output_image_urls",
+        "created_at",
+        "row_number",
+    )
+
+    def __init__(
+        self,
+        s_no: str,
+        csv_file_id: str,
+        product_name: str,
+        input_image_urls: List[str],
+        created_at: datetime,
+        product_id: Optional[str] = None,
+    ):
+        """
+        :param product_id: the id when it was already generated with the ids of a whole batch
+        """
+        self.id = product_id or ProductModel.get_id_for_product(s_no=s_no, csv_file_id=csv_file_id)
+        self.csv_file_id = csv_file_id
+        self.s_no = s_no
+        self.product_name = product_name
+        self.input_image_urls = input_image_urls
+        # filled in once the images of the row are processed
+        self.output_image_urls: List[str] = []
+        self.created_at = created_at
+        # numbered once the row's place in the file is known, see split_product_batch
+        self.row_number = 0
+
+    def __reduce__(self) -> Any:
+        # pickled as a plain tuple when it comes back from a parse worker
+        return (
+            restore_product_insert_row,
+            (
+                self.id,
+                self.csv_file_id,
+                self.s_no,
+                self.product_name,
+                self.input_image_urls,
+                self.output_image_urls,
+                self.created_at,
+                self.row_number,
+            ),
+        )
+
+    def get_identifiers(self) -> Tuple[str, str]:
+        return (self.s_no, self.csv_file_id)
+
+    def to_insert_parameters(self) -> Dict[str, Any]:
+        """
+        the same insert parameters get_column_values_of_object returns for the ProductModel
+        """
+        return {
+            "id": self.id,
+            "csv_file_id": self.csv_file_id,
+            "s_no": self.s_no,
+            "product_name": self.product_name,
+            "input_image_urls": self.input_image_urls,
+            "output_image_urls": self.output_image_urls,
+            "row_number": self.row_number,
+            "created_at": self.created_at,
+            "updated_at": self.created_at,
+        }
+
+
+def restore_product_insert_row(*field_values: Any) -> ProductInsertRow:
+    product_insert_row = ProductInsertRow.__new__(ProductInsertRow)
+    for field_name, field_value in zip(ProductInsertRow.__slots__, field_values):
+        setattr(product_insert_row, field_name, field_value)
+    return product_insert_row
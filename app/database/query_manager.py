@@ -1,42 +1,265 @@
-from typing import Any, List, Optional, Type, TypeVar, Union
+import copy
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Type, TypeVar, Union
 
 import sqlalchemy
+from sqlalchemy.engine import Engine
 from app.logger import logger
+from app.metrics import timed_query
 from app.database.database_engine import DatabaseEngine
 from app.database.models.base import Base
+from app.database import schema_migration
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, delete, func, insert, select, tuple_, update
 from sqlalchemy.sql.expression import ColumnElement, BinaryExpression, UnaryExpression
 
-
 database_engine = DatabaseEngine.create_mysql_db_engine()
+# reads that may lag behind the latest writes, e.g. polling and downloads, pass read_only=True
+read_database_engine = DatabaseEngine.create_read_db_engine()
 from .models.product import ProductModel
 from .models.csv_model import CsvModel
+from .models.csv_job_model import CsvJobModel
+from .models.image_result_model import ImageResultModel
+from .models.csv_batch_model import CsvBatchModel
+from .models.catalog_model import CatalogModel
+from .models.catalog_product_model import CatalogProductModel
 
 Base.metadata.create_all(database_engine)
+schema_migration.migrate(database_engine)
 
 T = TypeVar("T")
 
+# session of the unit of work open in the current thread or task, if any
+_unit_of_work_session: ContextVar[Optional[Session]] = ContextVar(
+    "unit_of_work_session", default=None
+)
+
+
+@contextmanager
+def unit_of_work() -> Iterator[Session]:
+    """
+    every query_manager call made inside the block, on the same thread or task, shares one
+    session and one transaction, which is committed when the block exits and rolled back when
+    it raises. a block opened inside another one joins it
+    objects are not expired on commit, so what was written can be used without reading it back
+    """
+    session = _unit_of_work_session.get()
+    if session is not None:
+        yield session
+        return
+
+    session = Session(database_engine, expire_on_commit=False)
+    token = _unit_of_work_session.set(session)
+    try:
+        yield session
+        session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        _unit_of_work_session.reset(token)
+        session.close()
+
+
+@contextmanager
+def session_scope(engine: Optional[Engine] = None) -> Iterator[Session]:
+    """
+    yields the session of the open unit of work, or else a session of its own that is
+    committed on exit, engine only matters for the latter
+    """
+    session = _unit_of_work_session.get()
+    if session is not None:
+        yield session
+        return
+
+    with Session(engine or database_engine, expire_on_commit=False) as session:
+        yield session
+        session.commit()
+
+
+@timed_query
+def insert_single_object(db_object: T) -> T:
+    """
+    inserts the object, or replaces the row with the same primary key, in a single statement
+    and returns the object itself, with column defaults filled in, instead of reading it back
+    """
+    apply_column_defaults(db_object)
+    try:
+        upsert_rows(model=type(db_object), rows=[get_column_values_of_object(db_object)])
+    except sqlalchemy.exc.IntegrityError as e:
+        logger.error(f"Error in inserting object to database. {e.args}")
+        raise e
+
+    return db_object
+
+
+def apply_column_defaults(db_object: Any) -> None:
+    """
+    sets the scalar column defaults, and None for nullable columns, on every column attribute
+    the object does not have yet, so it matches the row it is inserted as
+    """
+    for column_attribute in sqlalchemy.inspect(type(db_object)).column_attrs:
+        if column_attribute.key in db_object.__dict__:
+            continue
 
-def insert_single_object(db_object: Any) -> None:
-    with Session(database_engine) as session:
+        column = column_attribute.columns[0]
+        if column.default is not None and column.default.is_scalar:
+            setattr(db_object, column_attribute.key, copy.copy(column.default.arg))
+        elif column.nullable:
+            setattr(db_object, column_attribute.key, None)
+
+
+def get_column_values_of_object(db_object: Any) -> Dict[str, Any]:
+    """
+    returns the mapped column values that are set on the object, keyed by attribute name
+    columns that are not set are left out so that their column defaults apply on insert
+    """
+    column_keys = sqlalchemy.inspect(type(db_object)).column_attrs.keys()
+    object_state = db_object.__dict__
+    return {key: object_state[key] for key in column_keys if key in object_state}
+
+
+def bulk_insert_objects(db_objects: List[Any]) -> None:
+    """
+    inserts all objects of the same model with a single multi-row INSERT in one transaction
+    unlike insert_single_object this does not replace existing rows
+    """
+    if not db_objects:
+        return
+
+    bulk_insert_rows(
+        model=type(db_objects[0]),
+        rows=[get_column_values_of_object(db_object) for db_object in db_objects],
+    )
+
+
+@timed_query
+def bulk_insert_rows(model: Type[T], rows: List[Dict[str, Any]]) -> None:
+    """
+    same as bulk_insert_objects for rows that are already insert parameters keyed by attribute name
+    """
+    if not rows:
+        return
+
+    with session_scope() as session:
         try:
-            session.merge(db_object)
-            session.commit()
+            session.execute(insert(model), rows)
         except sqlalchemy.exc.IntegrityError as e:
-            logger.error(f"Error in inserting object to database. {e.args}")
+            logger.error(f"Error in bulk inserting objects to database. {e.args}")
             raise e
 
 
-def query_by_id(model: Type[T], object_id: str) -> T:
-    with Session(database_engine) as session:
+def get_dialect_insert(model: Type[T]) -> Any:
+    """
+    returns an INSERT for the model that supports the dialect's conflict clauses
+    """
+    dialect_name = database_engine.dialect.name
+    if dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect_name in ("mysql", "mariadb"):
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+    else:
+        raise RuntimeError(f"conflict clauses are not supported for dialect = {dialect_name}")
+
+    return dialect_insert(model)
+
+
+@timed_query
+def bulk_insert_rows_ignoring_conflicts(model: Type[T], rows: List[Dict[str, Any]]) -> None:
+    """
+    multi-row insert that silently skips rows whose primary key already exists
+    """
+    if not rows:
+        return
+
+    statement = get_dialect_insert(model)
+    if database_engine.dialect.name in ("mysql", "mariadb"):
+        statement = statement.prefix_with("IGNORE")
+    else:
+        statement = statement.on_conflict_do_nothing()
+
+    with session_scope() as session:
+        try:
+            session.execute(statement, rows)
+        except Exception as e:
+            logger.error(f"Error in bulk inserting objects to database. {e.args}")
+            raise e
+
+
+@timed_query
+def upsert_rows(
+    model: Type[T], rows: List[Dict[str, Any]], update_columns: Optional[List[str]] = None
+) -> None:
+    """
+    multi-row insert where a row whose primary key already exists updates the existing row
+    instead, update_columns are attribute names and default to every non primary key column
+    """
+    if not rows:
+        return
+
+    mapper = sqlalchemy.inspect(model)
+    column_attributes = [
+        column_attribute
+        for column_attribute in mapper.column_attrs
+        if not column_attribute.columns[0].primary_key
+        and (update_columns is None or column_attribute.key in update_columns)
+    ]
+
+    statement = get_dialect_insert(model)
+    if database_engine.dialect.name in ("mysql", "mariadb"):
+        statement = statement.on_duplicate_key_update(
+            {
+                column_attribute.columns[0].name: statement.inserted[
+                    column_attribute.columns[0].key
+                ]
+                for column_attribute in column_attributes
+            }
+        )
+    else:
+        statement = statement.on_conflict_do_update(
+            index_elements=[column.name for column in mapper.primary_key],
+            set_={
+                column_attribute.columns[0].name: statement.excluded[
+                    column_attribute.columns[0].key
+                ]
+                for column_attribute in column_attributes
+            },
+        )
+
+    with session_scope() as session:
         try:
-            result = session.query(model).filter(model.id == object_id).one_or_none()  # type: ignore[attr-defined]
-            value = result
+            session.execute(statement, rows)
+        except Exception as e:
+            logger.error(f"Error in upserting objects to database. {e.args}")
+            raise e
+
+
+@timed_query
+def bulk_update_rows(model: Type[T], rows: List[Dict[str, Any]]) -> None:
+    """
+    updates many rows by primary key, every row holds its primary key and the values to set,
+    keyed by attribute name, rows with the same keys are sent as one executemany
+    """
+    if not rows:
+        return
+
+    with session_scope() as session:
+        try:
+            session.execute(update(model), rows)
+        except Exception as e:
+            logger.error(f"Error in bulk updating objects in database. {e.args}")
+            raise e
 
-            session.expunge_all()
-            session.commit()
 
+@timed_query
+def query_by_id(model: Type[T], object_id: str) -> T:
+    with session_scope() as session:
+        try:
+            # a unit of work may hold an older copy of the object, the row is read regardless
+            value = session.get(model, object_id, populate_existing=True)
         except Exception as e:
             raise RuntimeError(f"error in fetching object for id = {object_id}. Error = {e.args}")
 
@@ -48,6 +271,7 @@ def query_by_id(model: Type[T], object_id: str) -> T:
     return value
 
 
+@timed_query
 def query_with_filter(
     filters: Union[ColumnElement[bool], BinaryExpression[bool]],
     model: Type[T],
@@ -55,9 +279,10 @@ def query_with_filter(
     limit: Optional[int] = None,
     offset: int = 0,
     is_dict_response: bool = False,
+    read_only: bool = False,
 ) -> List[T]:
     values = []
-    with Session(database_engine) as session:
+    with session_scope(read_database_engine if read_only else database_engine) as session:
         try:
             query = session.query(model).filter(filters).order_by(order_by)
 
@@ -82,36 +307,192 @@ def query_with_filter(
     return values
 
 
-def get_attributes_of_object(obj: T) -> List[str]:
-    attributes: List[str] = [
-        attr for attr in dir(obj) if not callable(getattr(obj, attr)) and not attr.startswith("_")
+@timed_query
+def count_with_filter(
+    filters: Union[ColumnElement[bool], BinaryExpression[bool]],
+    model: Type[T],
+    read_only: bool = False,
+) -> int:
+    with session_scope(read_database_engine if read_only else database_engine) as session:
+        try:
+            count = session.query(func.count()).select_from(model).filter(filters).scalar()
+        except Exception as e:
+            logger.error(f"Error in counting objects in database. {e.args}")
+            raise e
+
+    return count or 0
+
+
+@timed_query
+def count_grouped_by(
+    column: Any,
+    model: Type[T],
+    filters: Optional[Union[ColumnElement[bool], BinaryExpression[bool]]] = None,
+    read_only: bool = False,
+) -> Dict[Any, int]:
+    """
+    counts the rows per value of column in a single GROUP BY query, values without rows are
+    left out
+    """
+    with session_scope(read_database_engine if read_only else database_engine) as session:
+        try:
+            query = session.query(column, func.count()).select_from(model)
+            if filters is not None:
+                query = query.filter(filters)
+            counts = query.group_by(column).all()
+        except Exception as e:
+            logger.error(f"Error in counting objects in database. {e.args}")
+            raise e
+
+    return {value: count for value, count in counts}
+
+
+@timed_query
+def query_columns_by_keyset(
+    filters: Union[ColumnElement[bool], BinaryExpression[bool]],
+    columns: List[Any],
+    key_columns: List[Any],
+    after_key: Optional[Tuple[Any, ...]] = None,
+    limit: int = 1000,
+    read_only: bool = False,
+) -> List[Any]:
+    """
+    returns one page of rows holding only the selected columns, ordered by key_columns
+    the page starts right after after_key, the key of the last row of the previous page, so an
+    index on the key columns finds it directly and a deep page costs the same as the first one
+    rows are plain Row tuples, not ORM objects tracked by the session
+    after_key is read by the caller from the key columns of the last row, which are selected too
+    key columns that the filters pin to one value, like csv_file_id, are best left out, a
+    single key column is compared on its own, which every database can seek on
+    """
+    query = select(*columns).where(filters)
+    if after_key is not None and len(key_columns) == 1:
+        query = query.where(key_columns[0] > after_key[0])
+    elif after_key is not None:
+        query = query.where(tuple_(*key_columns) > tuple_(*after_key))
+    query = query.order_by(*key_columns).limit(limit)
+
+    with session_scope(read_database_engine if read_only else database_engine) as session:
+        try:
+            return list(session.execute(query).all())
+        except Exception as e:
+            logger.error(f"Error in reading objects from database. {e.args}")
+            raise e
+
+
+def iter_columns_by_keyset(
+    filters: Union[ColumnElement[bool], BinaryExpression[bool]],
+    columns: List[Any],
+    key_columns: List[Any],
+    page_size: int = 1000,
+    read_only: bool = False,
+) -> Iterator[Any]:
+    """
+    yields the rows of query_columns_by_keyset page after page until the last one
+    the connection is given back between pages so slow consumers do not hold it
+    key_columns must be selected too, anywhere among the columns
+    """
+    key_positions = [
+        next(position for position, column in enumerate(columns) if column is key_column)
+        for key_column in key_columns
     ]
-    return attributes
+    last_key: Optional[Tuple[Any, ...]] = None
+    while True:
+        rows = query_columns_by_keyset(
+            filters=filters,
+            columns=columns,
+            key_columns=key_columns,
+            after_key=last_key,
+            limit=page_size,
+            read_only=read_only,
+        )
+
+        yield from rows
+
+        if len(rows) < page_size:
+            return
+        last_key = tuple(rows[-1][position] for position in key_positions)
 
 
+@timed_query
 def update_single_object(model: Type[T], updated_object: T) -> T:
-    with Session(database_engine) as session:
+    """
+    writes the column values of the object to the row with the same id in a single UPDATE
+    and returns the object itself instead of reading the row back
+    """
+    column_values = get_column_values_of_object(updated_object)
+    object_id = column_values.pop("id")
+
+    updated = update_with_filter(
+        filters=and_(model.id == object_id),  # type: ignore[attr-defined]
+        model=model,
+        values=column_values,
+    )
+    if updated == 0:
+        raise ValueError(f"No object found for model = {model} with id = {object_id}")
+
+    return updated_object
+
+
+@timed_query
+def update_with_filter(
+    filters: Union[ColumnElement[bool], BinaryExpression[bool]],
+    model: Type[T],
+    values: Dict[str, Any],
+) -> int:
+    """
+    updates every row matching the filters in a single statement and returns the number of rows
+    that matched, which makes it usable as a compare-and-set
+    """
+    with session_scope() as session:
         try:
-            database_object = (
-                session.query(model)
-                .filter(and_(model.id == updated_object.id))  # type: ignore[attr-defined]
-                .one_or_none()
+            result = session.execute(
+                update(model)
+                .where(filters)
+                .values(**values)
+                .execution_options(synchronize_session=False)
             )
+        except Exception as e:
+            logger.error(f"Error in updating objects in database. {e.args}")
+            raise e
 
-            if database_object is None:
-                raise ValueError(
-                    f"No object found for model = {model} with id = {updated_object.id}"  # type: ignore[attr-defined]
-                )
+    return result.rowcount
 
-            object_attributes = get_attributes_of_object(updated_object)
 
-            for attribute in object_attributes:
-                if hasattr(updated_object, attribute):
-                    setattr(database_object, attribute, getattr(updated_object, attribute))
+@timed_query
+def upsert_rows_if_updated(
+    model: Type[T],
+    rows: List[Dict[str, Any]],
+    update_model: Type[Any],
+    filters: Union[ColumnElement[bool], BinaryExpression[bool]],
+    values: Dict[str, Any],
+    update_columns: Optional[List[str]] = None,
+) -> int:
+    """
+    runs update_with_filter and upsert_rows in one transaction, the rows are only written when the
+    update matched exactly one row, otherwise nothing is written and 0 is returned
+    """
+    with unit_of_work():
+        if update_with_filter(filters=filters, model=update_model, values=values) != 1:
+            # an update that matched no row changed nothing, so there is nothing to roll back
+            return 0
+        upsert_rows(model=model, rows=rows, update_columns=update_columns)
+
+    return 1
 
-            session.commit()
+
+@timed_query
+def delete_with_filter(
+    filters: Union[ColumnElement[bool], BinaryExpression[bool]],
+    model: Type[T],
+) -> int:
+    with session_scope() as session:
+        try:
+            result = session.execute(
+                delete(model).where(filters).execution_options(synchronize_session=False)
+            )
         except Exception as e:
-            logger.error(f"Error in updating object in database. {e.args}")
+            logger.error(f"Error in deleting objects from database. {e.args}")
             raise e
 
-    return query_by_id(model=model, object_id=updated_object.id)  # type: ignore[attr-defined]
+    return result.rowcount
@@ -0,0 +1,8 @@
+from dataclasses import dataclass
+from dataclasses_json import LetterCase, Undefined, dataclass_json
+
+
+@dataclass_json(undefined=Undefined.EXCLUDE, letter_case=LetterCase.CAMEL)
+@dataclass
+class CreateCatalogQueryModel:
+    supplier_id: str
@@ -0,0 +1,35 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from dataclasses_json import LetterCase, Undefined, dataclass_json
+
+
+@dataclass_json(undefined=Undefined.EXCLUDE, letter_case=LetterCase.CAMEL)
+@dataclass
+class CreateCsvBatchQueryModel:
+    # file_name and csv_file_id of every file of the batch, in upload order
+    csv_files: List[Dict[str, str]]
+
+
+@dataclass_json(undefined=Undefined.EXCLUDE, letter_case=LetterCase.CAMEL)
+@dataclass
+class CsvBatchFileStatus:
+    file_name: str
+    csv_file_id: str
+    status: str
+    count_rows: int
+    count_rows_inserted: int
+    count_rows_failed: int
+
+
+@dataclass_json(undefined=Undefined.EXCLUDE, letter_case=LetterCase.CAMEL)
+@dataclass
+class CsvBatchPollingResponse:
+    count_files: int
+    count_files_by_status: Dict[str, int]
+    count_rows: int
+    count_rows_inserted: int
+    count_rows_failed: int
+    count_rows_in_flight: int
+    status: str
+    rows_per_second: Optional[float]
+    files: List[CsvBatchFileStatus]
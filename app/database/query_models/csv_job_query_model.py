@@ -0,0 +1,12 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict
+from dataclasses_json import LetterCase, Undefined, dataclass_json
+
+
+@dataclass_json(undefined=Undefined.EXCLUDE, letter_case=LetterCase.CAMEL)
+@dataclass
+class CreateCsvJobQueryModel:
+    csv_file_id: str
+    status: str
+    total_rows: int
+    meta_data: Dict[str, Any] = field(default_factory=dict)
@@ -6,7 +6,10 @@ from dataclasses_json import LetterCase, Undefined, dataclass_json
 @dataclass_json(undefined=Undefined.EXCLUDE, letter_case=LetterCase.CAMEL)
 @dataclass
 class CreateCsvQueryModel:
-    csv_file: bytes
+    blob_key: str
+    size_bytes: int
+    row_count: int
+    supplier_id: Optional[str] = None
 
 
 @dataclass_json(undefined=Undefined.EXCLUDE, letter_case=LetterCase.CAMEL)
@@ -14,3 +17,8 @@ class CreateCsvQueryModel:
 class CsvPollingResponse:
     count_rows: int
     count_rows_inserted: int
+    count_rows_failed: int
+    count_rows_in_flight: int
+    status: str
+    rows_per_second: Optional[float]
+    eta_seconds: Optional[float]
@@ -0,0 +1,11 @@
+from dataclasses import dataclass
+from datetime import datetime
+from dataclasses_json import LetterCase, Undefined, dataclass_json
+
+
+@dataclass_json(undefined=Undefined.EXCLUDE, letter_case=LetterCase.CAMEL)
+@dataclass
+class CreateImageResultQueryModel:
+    input_url: str
+    output_url: str
+    expires_at: datetime
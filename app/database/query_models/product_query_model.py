@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from dataclasses_json import LetterCase, Undefined, dataclass_json
 
 
@@ -11,3 +11,10 @@ class CreateProductQueryModel:
     product_name: str
     input_image_urls: List[str]
     output_image_urls: List[str]
+
+
+@dataclass_json(undefined=Undefined.EXCLUDE, letter_case=LetterCase.CAMEL)
+@dataclass
+class ProductsPageResponse:
+    products: List[Dict[str, Any]]
+    next_cursor: Optional[str]
@@ -0,0 +1,101 @@
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from sqlalchemy import and_
+
+from app.database import query_manager
+from app.database.models.catalog_model import CatalogModel
+from app.database.models.csv_job_model import CsvJobModel, CsvJobStatus
+from app.database.query_models.catalog_query_model import CreateCatalogQueryModel
+from app.database.repository.object_repository import ObjectRepository
+from app.logger import logger
+
+
+class CatalogRepository:
+    @classmethod
+    def get_catalog(cls, supplier_id: str) -> Optional[CatalogModel]:
+        catalogs = query_manager.query_with_filter(
+            model=CatalogModel, filters=CatalogModel.supplier_id == supplier_id, limit=1
+        )
+        return catalogs[0] if catalogs else None
+
+    @classmethod
+    def get_or_create_catalog(cls, supplier_id: str) -> CatalogModel:
+        catalog_model = CatalogModel(
+            create_catalog_request_model=CreateCatalogQueryModel(supplier_id=supplier_id)
+        )
+        # two uploads may create the catalogue at once, the second insert is a no-op
+        query_manager.bulk_insert_rows_ignoring_conflicts(
+            model=CatalogModel,
+            rows=[
+                {
+                    "id": catalog_model.id,
+                    "supplier_id": supplier_id,
+                    "meta_data": {},
+                    "created_at": catalog_model.created_at,
+                    "updated_at": catalog_model.updated_at,
+                }
+            ],
+        )
+        catalog = cls.get_catalog(supplier_id=supplier_id)
+        if catalog is None:
+            # the short id is taken by the catalogue of another supplier
+            logger.warning(f"catalog id {catalog_model.id} collides, using the long id")
+            catalog_model.id = catalog_model.compute_and_get_long_id()
+            return ObjectRepository.insert_single_object(object_to_be_inserted=catalog_model)
+        return catalog
+
+    @classmethod
+    def acquire_catalog(cls, supplier_id: str, csv_job: CsvJobModel) -> bool:
+        """
+        makes the job the one job that changes the supplier's catalogue, returns False while
+        another job holds it
+        the catalogue is held by a job and not by a worker, a job that failed an attempt, or
+        whose worker died, keeps it until it is claimed again and finishes. a job that is
+        neither PENDING nor RUNNING, one that gave up, loses it to the next job
+        """
+        catalog = cls.get_or_create_catalog(supplier_id=supplier_id)
+        if catalog.lease_owner not in (None, csv_job.id):
+            holding_jobs = query_manager.query_with_filter(
+                model=CsvJobModel, filters=CsvJobModel.id == catalog.lease_owner, limit=1
+            )
+            if holding_jobs and holding_jobs[0].status in (
+                CsvJobStatus.PENDING.value,
+                CsvJobStatus.RUNNING.value,
+            ):
+                return False
+
+        # compare-and-set on the owner that was read, like claiming a job
+        acquired = query_manager.update_with_filter(
+            model=CatalogModel,
+            filters=and_(
+                CatalogModel.id == catalog.id,
+                (
+                    CatalogModel.lease_owner.is_(None)
+                    if catalog.lease_owner is None
+                    else CatalogModel.lease_owner == catalog.lease_owner
+                ),
+            ),
+            values={"lease_owner": csv_job.id, "updated_at": datetime.now()},
+        )
+        return acquired == 1
+
+    @classmethod
+    def release_catalog(
+        cls, supplier_id: str, csv_job: CsvJobModel, applied_csv_file_id: Optional[str] = None
+    ) -> bool:
+        """
+        :param applied_csv_file_id: the file the job applied to the catalogue, None when the job
+        did not finish
+        """
+        values: Dict[str, Any] = {"lease_owner": None, "updated_at": datetime.now()}
+        if applied_csv_file_id is not None:
+            values["csv_file_id"] = applied_csv_file_id
+        released = query_manager.update_with_filter(
+            model=CatalogModel,
+            filters=and_(
+                CatalogModel.supplier_id == supplier_id, CatalogModel.lease_owner == csv_job.id
+            ),
+            values=values,
+        )
+        return released == 1
@@ -0,0 +1,288 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Type
+
+from sqlalchemy import and_, func, or_
+
+from app.database import query_manager
+from app.database.models.csv_job_model import CsvJobModel, CsvJobStatus
+from app.database.query_models.csv_job_query_model import CreateCsvJobQueryModel
+from app.database.repository.object_repository import ObjectRepository
+from app.logger import logger
+
+CLAIM_CANDIDATES_LIMIT = 5
+
+
+class CsvJobRepository:
+    @classmethod
+    def get_job_for_csv_file(cls, csv_file_id: str) -> Optional[CsvJobModel]:
+        jobs = query_manager.query_with_filter(
+            model=CsvJobModel, filters=CsvJobModel.csv_file_id == csv_file_id, limit=1
+        )
+        return jobs[0] if jobs else None
+
+    @classmethod
+    def count_jobs_by_status(cls) -> Dict[str, int]:
+        """
+        the number of jobs of every status, 0 for the statuses no job has
+        """
+        counts = query_manager.count_grouped_by(
+            column=CsvJobModel.status, model=CsvJobModel, read_only=True
+        )
+        return {status.value: counts.get(status.value, 0) for status in CsvJobStatus}
+
+    @classmethod
+    def enqueue_csv_file(
+        cls,
+        csv_file_id: str,
+        total_rows: int,
+        meta_data: Optional[Dict[str, Any]] = None,
+        requeue_completed: bool = False,
+    ) -> CsvJobModel:
+        """
+        :param csv_file_id:
+        :param total_rows: number of data rows in the file, counted once at upload time
+        :param meta_data: merged into the METADATA of a new or re-queued job
+        :param requeue_completed: queue a COMPLETED job again, from the first row
+        :return:
+
+        creates a PENDING job for the csv file
+        an existing job is returned as is, unless it FAILED, then it is queued again and resumes
+        from its checkpoint
+        """
+        existing_job = cls.get_job_for_csv_file(csv_file_id=csv_file_id)
+
+        if existing_job is None:
+            csv_job = CsvJobModel(
+                create_csv_job_request_model=CreateCsvJobQueryModel(
+                    csv_file_id=csv_file_id,
+                    status=CsvJobStatus.PENDING.value,
+                    total_rows=total_rows,
+                    meta_data=dict(meta_data or {}),
+                )
+            )
+            if query_manager.query_with_filter(
+                model=CsvJobModel, filters=CsvJobModel.id == csv_job.id, limit=1
+            ):
+                # the short id is taken by the job of another file
+                csv_job.id = csv_job.compute_and_get_long_id()
+            return ObjectRepository.insert_single_object(object_to_be_inserted=csv_job)
+
+        if existing_job.status == CsvJobStatus.COMPLETED.value and requeue_completed:
+            restart_values: Dict[str, Any] = {
+                "processed_rows": 0,
+                "failed_rows": 0,
+                "in_flight_rows": 0,
+                "checkpoint_rows": 0,
+                "started_at": None,
+                "finished_at": None,
+            }
+        elif existing_job.status == CsvJobStatus.FAILED.value:
+            restart_values = {}
+        else:
+            return existing_job
+
+        query_manager.update_with_filter(
+            model=CsvJobModel,
+            filters=and_(
+                CsvJobModel.id == existing_job.id,
+                CsvJobModel.status == existing_job.status,
+            ),
+            values={
+                "status": CsvJobStatus.PENDING.value,
+                "lease_owner": None,
+                "lease_expires_at": None,
+                "attempts": 0,
+                "error": None,
+                "meta_data": {**(existing_job.meta_data or {}), **(meta_data or {})},
+                "updated_at": datetime.now(),
+                **restart_values,
+            },
+        )
+        return ObjectRepository.get_object_by_id(model=CsvJobModel, object_id=existing_job.id)
+
+    @classmethod
+    def claim_next_job(
+        cls,
+        lease_owner: str,
+        lease_seconds: int,
+        max_attempts: int,
+        skip_job_ids: Optional[List[str]] = None,
+    ) -> Optional[CsvJobModel]:
+        """
+        :param lease_owner: id of the worker claiming the job
+        :param skip_job_ids: jobs not to claim, like the ones the worker just deferred
+        :return: the claimed job or None when nothing is claimable
+
+        a job is claimable when it is PENDING or when it is RUNNING with an expired lease
+        the claim is a conditional update, so when two workers race for the same job
+        exactly one of them sees a matched row
+        """
+        current_time = datetime.now()
+        claimable = or_(
+            CsvJobModel.status == CsvJobStatus.PENDING.value,
+            and_(
+                CsvJobModel.status == CsvJobStatus.RUNNING.value,
+                CsvJobModel.lease_expires_at < current_time,
+            ),
+        )
+
+        candidates = query_manager.query_with_filter(
+            model=CsvJobModel,
+            filters=(
+                and_(claimable, CsvJobModel.id.notin_(skip_job_ids)) if skip_job_ids else claimable
+            ),
+            order_by=CsvJobModel.created_at.asc(),
+            limit=CLAIM_CANDIDATES_LIMIT,
+        )
+
+        for candidate in candidates:
+            if candidate.attempts >= max_attempts:
+                logger.error(f"csv job {candidate.id} gave up after {candidate.attempts} attempts")
+                query_manager.update_with_filter(
+                    model=CsvJobModel,
+                    filters=and_(CsvJobModel.id == candidate.id, claimable),
+                    values={
+                        "status": CsvJobStatus.FAILED.value,
+                        "lease_owner": None,
+                        "updated_at": current_time,
+                    },
+                )
+                continue
+
+            claimed = query_manager.update_with_filter(
+                model=CsvJobModel,
+                filters=and_(CsvJobModel.id == candidate.id, claimable),
+                values={
+                    "status": CsvJobStatus.RUNNING.value,
+                    "lease_owner": lease_owner,
+                    "lease_expires_at": current_time + timedelta(seconds=lease_seconds),
+                    "attempts": CsvJobModel.attempts + 1,
+                    # every attempt resumes from the checkpoint, the counters already match it
+                    "in_flight_rows": 0,
+                    "started_at": func.coalesce(CsvJobModel.started_at, current_time),
+                    "finished_at": None,
+                    "updated_at": current_time,
+                },
+            )
+            if claimed == 1:
+                return ObjectRepository.get_object_by_id(model=CsvJobModel, object_id=candidate.id)
+
+        return None
+
+    @classmethod
+    def record_progress(
+        cls,
+        job_id: str,
+        lease_owner: str,
+        lease_seconds: int,
+        processed_rows: int = 0,
+        failed_rows: int = 0,
+        in_flight_rows: int = 0,
+    ) -> bool:
+        """
+        adds the deltas to the job's progress counters and extends its lease in the same statement
+        returns False when the lease was lost to another worker
+        """
+        current_time = datetime.now()
+        recorded = query_manager.update_with_filter(
+            model=CsvJobModel,
+            filters=and_(
+                CsvJobModel.id == job_id,
+                CsvJobModel.lease_owner == lease_owner,
+                CsvJobModel.status == CsvJobStatus.RUNNING.value,
+            ),
+            values={
+                "processed_rows": CsvJobModel.processed_rows + processed_rows,
+                "failed_rows": CsvJobModel.failed_rows + failed_rows,
+                "in_flight_rows": CsvJobModel.in_flight_rows + in_flight_rows,
+                "lease_expires_at": current_time + timedelta(seconds=lease_seconds),
+                "updated_at": current_time,
+            },
+        )
+        return recorded == 1
+
+    @classmethod
+    def commit_batch(
+        cls,
+        job_id: str,
+        lease_owner: str,
+        lease_seconds: int,
+        model: Type[Any],
+        rows: List[Dict[str, Any]],
+        processed_rows: int = 0,
+        failed_rows: int = 0,
+        update_columns: Optional[List[str]] = None,
+    ) -> bool:
+        """
+        writes the rows of the job's next batch and moves its checkpoint past the batch in the
+        same transaction, the progress counters and the lease are updated like record_progress
+        returns False and writes nothing when the lease was lost to another worker
+        """
+        current_time = datetime.now()
+        committed = query_manager.upsert_rows_if_updated(
+            model=model,
+            rows=rows,
+            update_columns=update_columns,
+            update_model=CsvJobModel,
+            filters=and_(
+                CsvJobModel.id == job_id,
+                CsvJobModel.lease_owner == lease_owner,
+                CsvJobModel.status == CsvJobStatus.RUNNING.value,
+            ),
+            values={
+                "processed_rows": CsvJobModel.processed_rows + processed_rows,
+                "failed_rows": CsvJobModel.failed_rows + failed_rows,
+                "in_flight_rows": CsvJobModel.in_flight_rows - (processed_rows + failed_rows),
+                "checkpoint_rows": CsvJobModel.checkpoint_rows + processed_rows + failed_rows,
+                "lease_expires_at": current_time + timedelta(seconds=lease_seconds),
+                "updated_at": current_time,
+            },
+        )
+        return committed == 1
+
+    @classmethod
+    def finish_job(
+        cls, job_id: str, lease_owner: str, status: CsvJobStatus, error: Optional[str] = None
+    ) -> bool:
+        """
+        moves a job the worker still owns to its next status and drops the lease
+        """
+        current_time = datetime.now()
+        finished = query_manager.update_with_filter(
+            model=CsvJobModel,
+            filters=and_(CsvJobModel.id == job_id, CsvJobModel.lease_owner == lease_owner),
+            values={
+                "status": status.value,
+                "lease_owner": None,
+                "lease_expires_at": None,
+                "in_flight_rows": 0,
+                "error": error,
+                "finished_at": current_time if status == CsvJobStatus.COMPLETED else None,
+                "updated_at": current_time,
+            },
+        )
+        return finished == 1
+
+    @classmethod
+    def defer_job(cls, csv_job: CsvJobModel, lease_owner: str) -> bool:
+        """
+        hands a job the worker claimed but could not run yet back as PENDING, the attempt it was
+        claimed with is given back as well
+        """
+        current_time = datetime.now()
+        values: Dict[str, Any] = {
+            "status": CsvJobStatus.PENDING.value,
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "attempts": CsvJobModel.attempts - 1,
+            "updated_at": current_time,
+        }
+        if csv_job.processed_rows == 0 and csv_job.failed_rows == 0:
+            # the job has not started yet, its rate is measured from when it really does
+            values["started_at"] = None
+        deferred = query_manager.update_with_filter(
+            model=CsvJobModel,
+            filters=and_(CsvJobModel.id == csv_job.id, CsvJobModel.lease_owner == lease_owner),
+            values=values,
+        )
+        return deferred == 1
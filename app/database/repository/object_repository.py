@@ -11,15 +11,11 @@ class ObjectRepository:
     def insert_single_object(cls, object_to_be_inserted: T, user_id: Optional[str] = None) -> T:
         """
         :param object_to_be_inserted:
-        :return:
+        :return: the inserted object, it is not read back from the database
 
         """
 
-        query_manager.insert_single_object(object_to_be_inserted)
-
-        return cls.get_object_by_id(
-            model=type(object_to_be_inserted), object_id=object_to_be_inserted.id  # type: ignore
-        )
+        return query_manager.insert_single_object(object_to_be_inserted)
 
     @classmethod
     def get_object_by_id(cls, model: Type[T], object_id: str) -> T:
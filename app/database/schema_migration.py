@@ -0,0 +1,172 @@
+"""
+brings a database created by an older version of the app up to its current models
+
+Base.metadata.create_all creates the tables that are missing but never changes a table that
+already exists, so every column or index added to an existing table has a migration here. the
+migrations run in order on every start, each one looks at the schema before it changes it and
+leaves a database that is already up to date as it is
+"""
+
+import io
+from typing import Any, Callable, Dict, List, Set
+
+from sqlalchemy import Table, inspect, literal, text
+from sqlalchemy.engine import Connection, Engine
+
+from app.database.models.csv_model import CsvModel
+from app.database.models.product import ProductModel
+from app.logger import logger
+from app.services.csv_row_validator import CsvHeaderMapping
+from app.services.csv_stream_reader import CsvStreamReader
+from app.storage.blob_store import get_blob_store
+
+
+def get_column_names(connection: Connection, table: Table) -> Set[str]:
+    return {column["name"] for column in inspect(connection).get_columns(table.name)}
+
+
+def add_column(connection: Connection, table: Table, column_name: str, default: Any) -> None:
+    """
+    adds the column of the model to its table, the rows already there get default
+    """
+    column = table.columns[column_name]
+    preparer = connection.dialect.identifier_preparer
+    default_clause = literal(default).compile(
+        dialect=connection.dialect, compile_kwargs={"literal_binds": True}
+    )
+    not_null = "" if column.nullable else " NOT NULL"
+    connection.execute(
+        text(
+            f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.quote(column.name)} "
+            f"{column.type.compile(dialect=connection.dialect)}{not_null} DEFAULT {default_clause}"
+        )
+    )
+    logger.info(f"added column {column.name} to {table.name}")
+
+
+def create_index(connection: Connection, table: Table, index_name: str) -> None:
+    index = next(index for index in table.indexes if index.name == index_name)
+    index.create(bind=connection, checkfirst=True)
+
+
+def move_csv_files_to_blob_store(connection: Connection) -> None:
+    """
+    CSV_FILES used to keep every file in its csv_file column, the files are moved to the blob
+    store one at a time and the column is dropped. the ids of the moved rows are kept, they were
+    computed from the content and the products of the file point at them
+    """
+    table = CsvModel.__table__
+    column_names = get_column_names(connection, table)
+    for column_name, default in (("BLOB_KEY", ""), ("SIZE_BYTES", 0), ("ROW_COUNT", 0)):
+        if column_name not in column_names:
+            add_column(connection, table, column_name, default)
+    create_index(connection, table, "ix_CSV_FILES_BLOB_KEY")
+    if "csv_file" not in column_names:
+        return
+
+    blob_store = get_blob_store()
+    csv_file_ids: List[str] = list(
+        connection.execute(
+            text('SELECT "ID" FROM "CSV_FILES" WHERE csv_file IS NOT NULL')
+        ).scalars()
+    )
+    for csv_file_id in csv_file_ids:
+        csv_file: bytes = connection.execute(
+            text('SELECT csv_file FROM "CSV_FILES" WHERE "ID" = :csv_file_id'),
+            {"csv_file_id": csv_file_id},
+        ).scalar_one()
+        blob_info = blob_store.put_stream(io.BytesIO(csv_file))
+        # the header is a record too
+        row_count = max(CsvStreamReader.count_records(binary_stream=io.BytesIO(csv_file)) - 1, 0)
+        connection.execute(
+            text(
+                'UPDATE "CSV_FILES" SET "BLOB_KEY" = :blob_key, "SIZE_BYTES" = :size_bytes, '
+                '"ROW_COUNT" = :row_count, csv_file = NULL WHERE "ID" = :csv_file_id'
+            ),
+            {
+                "blob_key": blob_info.key,
+                "size_bytes": blob_info.size_bytes,
+                "row_count": row_count,
+                "csv_file_id": csv_file_id,
+            },
+        )
+    connection.execute(text('ALTER TABLE "CSV_FILES" DROP COLUMN csv_file'))
+    logger.info(f"moved {len(csv_file_ids)} csv files from CSV_FILES to the blob store")
+
+
+def number_products_in_file_order(connection: Connection) -> None:
+    """
+    PRODUCTS.ROW_NUMBER keeps the order of the products in their file. the products stored
+    before it existed are numbered by reading their file again, a product gets the first row of
+    its s_no, the row ingestion keeps. the first release stored the s_no as it was in the file.
+    products whose file cannot be read keep 0 and are downloaded before the numbered ones, in id
+    order
+    """
+    table = ProductModel.__table__
+    if "ROW_NUMBER" in get_column_names(connection, table):
+        return
+    add_column(connection, table, "ROW_NUMBER", 0)
+    create_index(connection, table, "ix_PRODUCTS_CSV_FILE_ID_ROW_NUMBER")
+
+    blob_store = get_blob_store()
+    csv_files = connection.execute(
+        text(
+            'SELECT "ID", "BLOB_KEY" FROM "CSV_FILES" WHERE "ID" IN '
+            '(SELECT DISTINCT "CSV_FILE_ID" FROM "PRODUCTS")'
+        )
+    ).all()
+    for csv_file_id, blob_key in csv_files:
+        try:
+            with blob_store.open(blob_key) as csv_file:
+                csv_rows = CsvStreamReader.iter_rows_from_stream(binary_stream=csv_file)
+                s_no_index = CsvHeaderMapping.from_header_row(next(csv_rows, None) or []).s_no_index
+                row_numbers: Dict[str, int] = {}
+                for row_number, csv_row in enumerate(csv_rows, start=1):
+                    if len(csv_row) > s_no_index:
+                        row_numbers.setdefault(csv_row[s_no_index], row_number)
+        except ValueError as e:
+            logger.warning(f"products of csv file {csv_file_id} are not numbered: {e}")
+            continue
+        if row_numbers:
+            connection.execute(
+                text(
+                    'UPDATE "PRODUCTS" SET "ROW_NUMBER" = :row_number '
+                    'WHERE "CSV_FILE_ID" = :csv_file_id AND "PRODUCT_SL_NO" = :s_no'
+                ),
+                [
+                    {"row_number": row_number, "csv_file_id": csv_file_id, "s_no": s_no}
+                    for s_no, row_number in row_numbers.items()
+                ],
+            )
+    logger.info(f"numbered the products of {len(csv_files)} csv files in file order")
+
+
+def index_products_by_s_no(connection: Connection) -> None:
+    # the products api pages through the products of a file by s_no
+    create_index(connection, ProductModel.__table__, "ix_PRODUCTS_CSV_FILE_ID_PRODUCT_SL_NO")
+
+
+def add_supplier_to_csv_files(connection: Connection) -> None:
+    """
+    CSV_FILES.SUPPLIER_ID marks the delta uploads of a supplier. the files uploaded before it
+    existed were all plain uploads and keep NULL, which is also what an upload of the same file
+    without a supplier is looked up by, see CsvService.insert_csv_blob
+    """
+    table = CsvModel.__table__
+    if "SUPPLIER_ID" not in get_column_names(connection, table):
+        add_column(connection, table, "SUPPLIER_ID", None)
+
+
+# in the order the schema changed
+MIGRATIONS: List[Callable[[Connection], None]] = [
+    move_csv_files_to_blob_store,
+    number_products_in_file_order,
+    index_products_by_s_no,
+    add_supplier_to_csv_files,
+]
+
+
+def migrate(engine: Engine) -> None:
+    with engine.begin() as connection:
+        for migration in MIGRATIONS:
+            migration(connection)
@@ -0,0 +1,9 @@
+from typing import List
+
+
+class NotAcceptableError(Exception):
+    # the representation asked for cannot be produced, supported_formats are the ones that can
+    def __init__(self, message: str, supported_formats: List[str]) -> None:
+        super().__init__(message)
+        self.message = message
+        self.supported_formats = supported_formats
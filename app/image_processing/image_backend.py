@@ -0,0 +1,124 @@
+import asyncio
+import hashlib
+from abc import abstractmethod
+from typing import Any, Optional
+
+
+class ImageProcessingError(RuntimeError):
+    """
+    an image that could not be processed, retrying it would not help or did not
+    """
+
+
+class ImageBackend:
+    """
+    does the actual work for one image: download it, compress it, upload it and return the new url
+    backends are driven by the AsyncImageProcessingEngine on its own event loop
+    """
+
+    async def open(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    @abstractmethod
+    async def process_image(self, image_url: str) -> str:
+        pass
+
+    def is_retryable(self, error: Exception) -> bool:
+        """
+        whether process_image may succeed when tried again after failing with error
+        """
+        return isinstance(error, (asyncio.TimeoutError, ConnectionError))
+
+
+class InProcessImageBackend(ImageBackend):
+    """
+    offline backend that never leaves the process, optionally sleeping to simulate network latency
+    """
+
+    def __init__(self, latency_seconds: float = 0.0):
+        self.latency_seconds = latency_seconds
+
+    async def process_image(self, image_url: str) -> str:
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+
+        return image_url + "output"
+
+
+class HttpImageBackend(ImageBackend):
+    """
+    downloads images over http and uploads them with a PUT to upload_base_url
+    all requests go through one pooled aiohttp session, aiohttp is only needed for this backend
+    """
+
+    def __init__(
+        self,
+        upload_base_url: str,
+        max_connections: int,
+        max_connections_per_host: int,
+        timeout_seconds: float,
+    ):
+        self.upload_base_url = upload_base_url.rstrip("/")
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout_seconds = timeout_seconds
+        self._session: Optional[Any] = None
+
+    async def open(self) -> None:
+        try:
+            import aiohttp
+        except ImportError as e:
+            raise RuntimeError("IMAGE_PROCESSOR_BACKEND=http needs the aiohttp package") from e
+
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self.max_connections, limit_per_host=self.max_connections_per_host
+            ),
+            timeout=aiohttp.ClientTimeout(total=self.timeout_seconds),
+        )
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def is_retryable(self, error: Exception) -> bool:
+        """
+        timeouts, connection errors, 5xx and 429 responses are retried, any other response, like
+        a 404, fails the same way every time
+        """
+        import aiohttp
+
+        if isinstance(error, aiohttp.ClientResponseError):
+            return error.status >= 500 or error.status == 429
+        return isinstance(error, aiohttp.ClientConnectionError) or super().is_retryable(error)
+
+    def compress(self, image_content: bytes) -> bytes:
+        """
+        runs in the default executor so that cpu bound compression does not block the loop
+        """
+        return image_content
+
+    async def process_image(self, image_url: str) -> str:
+        if self._session is None:
+            raise RuntimeError("HttpImageBackend used before open()")
+
+        source_url = image_url if "://" in image_url else "https://" + image_url
+        async with self._session.get(source_url) as response:
+            response.raise_for_status()
+            image_content = await response.read()
+
+        image_content = await asyncio.get_running_loop().run_in_executor(
+            None, self.compress, image_content
+        )
+
+        upload_url = (
+            f"{self.upload_base_url}/{hashlib.sha256(image_url.encode('utf-8')).hexdigest()}"
+        )
+        async with self._session.put(upload_url, data=image_content) as response:
+            response.raise_for_status()
+
+        return upload_url
@@ -0,0 +1,329 @@
+import asyncio
+import os
+import random
+import threading
+from abc import abstractmethod
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Union
+from urllib.parse import urlsplit
+
+from app.image_processing.image_backend import (
+    HttpImageBackend,
+    ImageBackend,
+    ImageProcessingError,
+    InProcessImageBackend,
+)
+from app.image_processing.image_result_cache import ImageResultCache, get_image_result_cache
+from app.logger import logger
+
+# the output image urls of one list of input image urls, or the error of the first of its images
+# that failed
+ImageUrlsResult = Union[List[str], ImageProcessingError]
+
+
+class ImageProcessor:
+    """
+    turns lists of input image urls into lists of output image urls
+    submit_batch is non blocking so that callers can keep several batches in flight
+    an image that fails only fails its own list, the batch future fails for errors of the
+    processor itself
+    """
+
+    @abstractmethod
+    def submit_batch(self, image_url_lists: List[List[str]]) -> "Future[List[ImageUrlsResult]]":
+        pass
+
+    def process_image_urls(self, image_urls: List[str]) -> List[str]:
+        output_urls = self.submit_batch([image_urls]).result()[0]
+        if isinstance(output_urls, ImageProcessingError):
+            raise output_urls
+        return output_urls
+
+    def flush(self) -> None:
+        """
+        persists what the processor buffered, e.g. the results of a cache, run once a job is done
+        """
+
+    def shutdown(self) -> None:
+        pass
+
+
+class AsyncImageProcessingEngine(ImageProcessor):
+    """
+    runs an asyncio loop on a background thread and processes every image of a batch concurrently
+    concurrency is capped per host and in total, images that fail with an error the backend
+    deems retryable are retried with backoff
+    """
+
+    def __init__(
+        self,
+        backend: ImageBackend,
+        max_in_flight: int = 256,
+        max_connections_per_host: int = 8,
+        max_retries: int = 3,
+        retry_backoff_seconds: float = 0.5,
+    ):
+        self.backend = backend
+        self.max_in_flight = max_in_flight
+        self.max_connections_per_host = max_connections_per_host
+        self.max_retries = max_retries
+        self.retry_backoff_seconds = retry_backoff_seconds
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._in_flight: Optional[asyncio.Semaphore] = None
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is not None:
+                return self._loop
+
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(
+                target=loop.run_forever, name="image-processing-loop", daemon=True
+            )
+            thread.start()
+            asyncio.run_coroutine_threadsafe(self._open(), loop).result()
+
+            self._loop = loop
+            self._thread = thread
+            return loop
+
+    async def _open(self) -> None:
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        await self.backend.open()
+
+    def _get_host_semaphore(self, image_url: str) -> asyncio.Semaphore:
+        host = urlsplit(image_url if "://" in image_url else "//" + image_url).netloc
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.max_connections_per_host)
+        return self._host_semaphores[host]
+
+    async def _process_image(self, image_url: str) -> str:
+        assert self._in_flight is not None
+
+        attempt = 0
+        while True:
+            try:
+                async with self._in_flight, self._get_host_semaphore(image_url):
+                    return await self.backend.process_image(image_url)
+            except Exception as e:
+                attempt += 1
+                if attempt > self.max_retries or not self.backend.is_retryable(e):
+                    raise ImageProcessingError(
+                        f"image {image_url} failed after {attempt} attempts. Error = {e.args}"
+                    ) from e
+                backoff = self.retry_backoff_seconds * 2 ** (attempt - 1)
+                logger.warning(f"retrying image {image_url} in {backoff:.2f}s. Error = {e.args}")
+                # the slots are given back during the backoff, so that the images of other hosts,
+                # and the other images of this one, are not held up by an image that is failing
+                await asyncio.sleep(backoff + random.uniform(0, backoff))
+
+    async def _process_image_urls(self, image_urls: List[str]) -> ImageUrlsResult:
+        output_urls = await asyncio.gather(
+            *(self._process_image(image_url) for image_url in image_urls), return_exceptions=True
+        )
+        errors = [output_url for output_url in output_urls if isinstance(output_url, BaseException)]
+        for error in errors:
+            if not isinstance(error, ImageProcessingError):
+                raise error
+        return errors[0] if errors else list(output_urls)
+
+    async def _process_batch(self, image_url_lists: List[List[str]]) -> List[ImageUrlsResult]:
+        return list(
+            await asyncio.gather(
+                *(self._process_image_urls(image_urls) for image_urls in image_url_lists)
+            )
+        )
+
+    def submit_batch(self, image_url_lists: List[List[str]]) -> "Future[List[ImageUrlsResult]]":
+        loop = self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(self._process_batch(image_url_lists), loop)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._loop is None:
+                return
+
+            asyncio.run_coroutine_threadsafe(self.backend.close(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            if self._thread is not None:
+                self._thread.join()
+            self._loop = None
+            self._thread = None
+            self._host_semaphores = {}
+
+
+class CachingImageProcessor(ImageProcessor):
+    """
+    serves urls from the ImageResultCache and only hands the misses to the wrapped processor
+    a url repeated within a batch, or already in flight for an earlier batch, is processed once
+    every miss is handed over as a list of its own so that it fails alone, failures are not cached
+    """
+
+    def __init__(self, image_processor: ImageProcessor, image_result_cache: ImageResultCache):
+        self.image_processor = image_processor
+        self.image_result_cache = image_result_cache
+        self._in_flight: Dict[str, "Future[str]"] = {}
+        self._lock = threading.Lock()
+
+    def submit_batch(self, image_url_lists: List[List[str]]) -> "Future[List[ImageUrlsResult]]":
+        self.image_result_cache.flush()
+
+        unique_urls = list(
+            dict.fromkeys(image_url for image_urls in image_url_lists for image_url in image_urls)
+        )
+        url_futures: Dict[str, "Future[str]"] = {}
+
+        with self._lock:
+            for image_url in unique_urls:
+                if image_url in self._in_flight:
+                    url_futures[image_url] = self._in_flight[image_url]
+
+        cached_urls = self.image_result_cache.get_many(
+            [image_url for image_url in unique_urls if image_url not in url_futures]
+        )
+        for image_url, output_url in cached_urls.items():
+            url_futures[image_url] = Future()
+            url_futures[image_url].set_result(output_url)
+
+        missed_urls: List[str] = []
+        with self._lock:
+            for image_url in unique_urls:
+                if image_url in url_futures:
+                    continue
+                if image_url in self._in_flight:
+                    url_futures[image_url] = self._in_flight[image_url]
+                    continue
+                url_futures[image_url] = self._in_flight[image_url] = Future()
+                missed_urls.append(image_url)
+
+        if missed_urls:
+            self.image_processor.submit_batch(
+                [[image_url] for image_url in missed_urls]
+            ).add_done_callback(
+                lambda processed: self._resolve_missed_urls(missed_urls, url_futures, processed)
+            )
+
+        return self._gather(image_url_lists, url_futures)
+
+    def _resolve_missed_urls(
+        self,
+        missed_urls: List[str],
+        url_futures: Dict[str, "Future[str]"],
+        processed: "Future[List[ImageUrlsResult]]",
+    ) -> None:
+        with self._lock:
+            for image_url in missed_urls:
+                self._in_flight.pop(image_url, None)
+
+        error = processed.exception()
+        if error is not None:
+            for image_url in missed_urls:
+                url_futures[image_url].set_exception(error)
+            return
+
+        output_urls: Dict[str, str] = {}
+        for image_url, output_url_list in zip(missed_urls, processed.result()):
+            if isinstance(output_url_list, ImageProcessingError):
+                url_futures[image_url].set_exception(output_url_list)
+            else:
+                output_urls[image_url] = output_url_list[0]
+        self.image_result_cache.put_many(output_urls)
+        for image_url, output_url in output_urls.items():
+            url_futures[image_url].set_result(output_url)
+
+    def _gather(
+        self, image_url_lists: List[List[str]], url_futures: Dict[str, "Future[str]"]
+    ) -> "Future[List[ImageUrlsResult]]":
+        batch_future: "Future[List[ImageUrlsResult]]" = Future()
+        remaining = [len(url_futures)]
+        remaining_lock = threading.Lock()
+
+        def get_image_urls_result(image_urls: List[str]) -> ImageUrlsResult:
+            for image_url in image_urls:
+                error = url_futures[image_url].exception()
+                if error is not None:
+                    return error  # type: ignore[return-value]
+            return [url_futures[image_url].result() for image_url in image_urls]
+
+        def on_url_done(url_future: "Future[str]") -> None:
+            error = url_future.exception()
+            if error is not None and not isinstance(error, ImageProcessingError):
+                if not batch_future.done():
+                    batch_future.set_exception(error)
+                return
+
+            with remaining_lock:
+                remaining[0] -= 1
+                is_last = remaining[0] == 0
+            if is_last and not batch_future.done():
+                batch_future.set_result(
+                    [get_image_urls_result(image_urls) for image_urls in image_url_lists]
+                )
+
+        if not url_futures:
+            batch_future.set_result([[] for _ in image_url_lists])
+        for url_future in list(url_futures.values()):
+            url_future.add_done_callback(on_url_done)
+
+        return batch_future
+
+    def flush(self) -> None:
+        self.image_result_cache.flush()
+
+    def shutdown(self) -> None:
+        self.image_processor.shutdown()
+        self.image_result_cache.flush()
+
+
+def create_image_processor_from_environment() -> ImageProcessor:
+    backend_name = os.getenv("IMAGE_PROCESSOR_BACKEND", "in_process")
+    max_connections_per_host = int(os.getenv("IMAGE_MAX_CONNECTIONS_PER_HOST", "8"))
+
+    backend: ImageBackend
+    if backend_name == "in_process":
+        backend = InProcessImageBackend(
+            latency_seconds=float(os.getenv("IMAGE_IN_PROCESS_LATENCY_SECONDS", "0"))
+        )
+    elif backend_name == "http":
+        backend = HttpImageBackend(
+            upload_base_url=os.environ["IMAGE_UPLOAD_BASE_URL"],
+            max_connections=int(os.getenv("IMAGE_MAX_CONNECTIONS", "100")),
+            max_connections_per_host=max_connections_per_host,
+            timeout_seconds=float(os.getenv("IMAGE_REQUEST_TIMEOUT_SECONDS", "30")),
+        )
+    else:
+        raise ValueError(f"unknown IMAGE_PROCESSOR_BACKEND = {backend_name}")
+
+    image_processor: ImageProcessor = AsyncImageProcessingEngine(
+        backend=backend,
+        max_in_flight=int(os.getenv("IMAGE_MAX_IN_FLIGHT", "256")),
+        max_connections_per_host=max_connections_per_host,
+        max_retries=int(os.getenv("IMAGE_MAX_RETRIES", "3")),
+        retry_backoff_seconds=float(os.getenv("IMAGE_RETRY_BACKOFF_SECONDS", "0.5")),
+    )
+
+    if os.getenv("IMAGE_CACHE_ENABLED", "true").lower() == "true":
+        image_processor = CachingImageProcessor(
+            image_processor=image_processor, image_result_cache=get_image_result_cache()
+        )
+
+    return image_processor
+
+
+_image_processor: Optional[ImageProcessor] = None
+_image_processor_lock = threading.Lock()
+
+
+def get_image_processor() -> ImageProcessor:
+    """
+    one processor per process, created on first use so that spawned workers build their own
+    """
+    global _image_processor
+    with _image_processor_lock:
+        if _image_processor is None:
+            _image_processor = create_image_processor_from_environment()
+        return _image_processor
@@ -0,0 +1,199 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, select
+
+from app.database import query_manager
+from app.database.models.image_result_model import ImageResultModel
+from app.database.query_models.image_result_query_model import CreateImageResultQueryModel
+from app.logger import logger
+from app.metrics import image_cache_lookups, register_gauge
+
+DATABASE_LOOKUP_CHUNK_SIZE = 500
+
+
+class ImageResultCache:
+    """
+    maps input image urls to the output urls they were processed into
+    an in-memory LRU sits in front of the IMAGE_RESULTS table, both tiers expire entries after
+    ttl_seconds and the table is trimmed back to max_database_rows, oldest entries first
+    """
+
+    def __init__(
+        self,
+        max_memory_entries: int,
+        ttl_seconds: int,
+        max_database_rows: int,
+        eviction_interval_seconds: int,
+    ):
+        self.max_memory_entries = max_memory_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_database_rows = max_database_rows
+        self.eviction_interval_seconds = eviction_interval_seconds
+
+        self._memory: "OrderedDict[str, Tuple[str, datetime]]" = OrderedDict()
+        self._pending_writes: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._last_eviction = time.monotonic()
+
+    @classmethod
+    def from_environment(cls) -> "ImageResultCache":
+        return cls(
+            max_memory_entries=int(os.getenv("IMAGE_CACHE_MEMORY_ENTRIES", "100000")),
+            ttl_seconds=int(os.getenv("IMAGE_CACHE_TTL_SECONDS", str(7 * 24 * 60 * 60))),
+            max_database_rows=int(os.getenv("IMAGE_CACHE_MAX_DATABASE_ROWS", "10000000")),
+            eviction_interval_seconds=int(
+                os.getenv("IMAGE_CACHE_EVICTION_INTERVAL_SECONDS", "300")
+            ),
+        )
+
+    def count_memory_entries(self) -> int:
+        with self._lock:
+            return len(self._memory)
+
+    def _remember(self, input_url: str, output_url: str, expires_at: datetime) -> None:
+        # callers hold the lock
+        self._memory[input_url] = (output_url, expires_at)
+        self._memory.move_to_end(input_url)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, input_urls: Iterable[str]) -> Dict[str, str]:
+        """
+        returns the cached output url of every input url that has one, misses are left out
+        """
+        current_time = datetime.now()
+        found: Dict[str, str] = {}
+        memory_misses: List[str] = []
+
+        with self._lock:
+            for input_url in input_urls:
+                entry = self._memory.get(input_url)
+                if entry is not None and entry[1] > current_time:
+                    self._memory.move_to_end(input_url)
+                    found[input_url] = entry[0]
+                else:
+                    memory_misses.append(input_url)
+
+        database_found = self._get_many_from_database(memory_misses, current_time)
+        image_cache_lookups.inc(len(found), result="memory_hit")
+        image_cache_lookups.inc(len(database_found), result="database_hit")
+        image_cache_lookups.inc(len(memory_misses) - len(database_found), result="miss")
+        found.update(database_found)
+
+        return found
+
+    def _get_many_from_database(
+        self, input_urls: List[str], current_time: datetime
+    ) -> Dict[str, str]:
+        found: Dict[str, str] = {}
+
+        for chunk_start in range(0, len(input_urls), DATABASE_LOOKUP_CHUNK_SIZE):
+            chunk = input_urls[chunk_start : chunk_start + DATABASE_LOOKUP_CHUNK_SIZE]
+            results = query_manager.query_with_filter(
+                model=ImageResultModel,
+                filters=and_(
+                    ImageResultModel.id.in_(ImageResultModel.get_ids_for_input_urls(chunk)),
+                    ImageResultModel.expires_at > current_time,
+                ),
+            )
+            with self._lock:
+                for image_result in results:
+                    found[image_result.input_url] = image_result.output_url
+                    self._remember(
+                        image_result.input_url, image_result.output_url, image_result.expires_at
+                    )
+
+        return found
+
+    def put_many(self, output_urls: Dict[str, str]) -> None:
+        """
+        stores results in memory right away, the database write happens on the next flush
+        so that it can be called from any thread, including the image processing loop
+        """
+        expires_at = datetime.now() + timedelta(seconds=self.ttl_seconds)
+        with self._lock:
+            for input_url, output_url in output_urls.items():
+                self._remember(input_url, output_url, expires_at)
+            self._pending_writes.update(output_urls)
+
+    def flush(self) -> None:
+        """
+        writes the results put since the last flush, called before every batch and once a job
+        is done, so that a crash loses at most the results of the job in progress
+        """
+        with self._lock:
+            pending_writes = self._pending_writes
+            self._pending_writes = {}
+
+        if pending_writes:
+            expires_at = datetime.now() + timedelta(seconds=self.ttl_seconds)
+            rows = [
+                query_manager.get_column_values_of_object(
+                    ImageResultModel(
+                        create_image_result_request_model=CreateImageResultQueryModel(
+                            input_url=input_url, output_url=output_url, expires_at=expires_at
+                        )
+                    )
+                )
+                for input_url, output_url in pending_writes.items()
+            ]
+            # an expired row of the same url may still be in the table until the next eviction,
+            # it is replaced, created_at included, so the refreshed row is evicted last
+            query_manager.upsert_rows(model=ImageResultModel, rows=rows)
+
+        if time.monotonic() - self._last_eviction >= self.eviction_interval_seconds:
+            self._last_eviction = time.monotonic()
+            self.evict()
+
+    def evict(self) -> None:
+        """
+        drops expired rows, then the oldest rows beyond max_database_rows
+        """
+        current_time = datetime.now()
+        expired = query_manager.delete_with_filter(
+            model=ImageResultModel, filters=ImageResultModel.expires_at <= current_time
+        )
+
+        overflow = (
+            query_manager.count_with_filter(
+                model=ImageResultModel, filters=ImageResultModel.id.isnot(None)
+            )
+            - self.max_database_rows
+        )
+        if overflow > 0:
+            oldest_ids = (
+                select(ImageResultModel.id)
+                .order_by(ImageResultModel.created_at.asc())
+                .limit(overflow)
+            )
+            query_manager.delete_with_filter(
+                model=ImageResultModel, filters=ImageResultModel.id.in_(oldest_ids)
+            )
+
+        logger.info(f"image result cache evicted {expired} expired and {max(overflow, 0)} old rows")
+
+
+_image_result_cache: Optional[ImageResultCache] = None
+_image_result_cache_lock = threading.Lock()
+
+
+def get_image_result_cache() -> ImageResultCache:
+    global _image_result_cache
+    with _image_result_cache_lock:
+        if _image_result_cache is None:
+            _image_result_cache = ImageResultCache.from_environment()
+        return _image_result_cache
+
+
+register_gauge(
+    "image_result_cache_memory_entries",
+    "image results held by the in-memory tier of the image result cache",
+    read_values=lambda: (
+        {(): _image_result_cache.count_memory_entries()} if _image_result_cache else {}
+    ),
+)
@@ -1,5 +1,8 @@
+import atexit
 import logging
 import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from typing import Any
 
 
@@ -19,8 +22,33 @@ c_format = logging.Formatter("%(name)s - %(levelname)s - %(message)s")
 c_handler.setFormatter(c_format)
 # f_handler.setFormatter(f_format)
 
+# records are put on a queue and written by a listener thread, so a slow stream never blocks
+# the thread that logs, the message is only formatted on the listener thread
+log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(
+    maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # the default prepare formats the message on the calling thread, the listener does it
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # dropping a log line is better than stalling a request
+            pass
+
+
+q_handler = NonBlockingQueueHandler(log_queue)
+log_listener = QueueListener(log_queue, c_handler, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
+
 # Add handlers to the logger
-logger.addHandler(c_handler)
+logger.addHandler(q_handler)
 # logger.addHandler(f_handler)
 
 # Get the logger for SQLAlchemy
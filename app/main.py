@@ -1,7 +1,9 @@
+import atexit
 import os
+import time
 from pathlib import Path
 from typing import List
-from flask import Flask, jsonify, request
+from flask import Flask, g, jsonify, request
 from flask_cors import CORS
 from flask_restx import Api
 
@@ -10,15 +12,23 @@ import traceback
 
 from requests import Response
 
+from app.access_logger import access_logger
+from app.metrics import PROMETHEUS_CONTENT_TYPE, http_request_seconds, registry
 from app.exceptions.forbidden_error import ForbiddenError
 from app.exceptions.invalid_argument_exception import InvalidArgumentException
+from app.exceptions.not_acceptable_error import NotAcceptableError
+from app.image_processing.image_processor import get_image_processor
+from app.request.streamed_upload_request import StreamedUploadRequest
 from app.routes.csv_routes import csv_api_ns
+from app.services.csv_job_service import csv_job_worker_pool
+from app.services.csv_service import CsvUploadService
 from .database import query_manager
 from app.logger import logger
 
-
 environment = os.getenv("ENVIRONMENT")
 app = Flask(__name__)
+# uploaded files are streamed into the blob store while the request body is parsed
+app.request_class = StreamedUploadRequest
 
 
 app.config["PROPAGATE_EXCEPTIONS"] = True
@@ -30,6 +40,12 @@ CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
 api = Api(app)
 api.add_namespace(csv_api_ns)
 
+# background workers that process the uploaded csv files
+# atexit runs last in first out, so the workers stop before the image processor they use
+atexit.register(lambda: get_image_processor().shutdown())
+csv_job_worker_pool.start(job_handler=CsvUploadService.process_csv_job)
+atexit.register(csv_job_worker_pool.shutdown)
+
 
 @app.errorhandler(InvalidArgumentException)
 def handle_invalid_argument_exception(error):
@@ -59,6 +75,19 @@ def handle_value_error(error) -> Response:
     return response
 
 
+@app.errorhandler(NotAcceptableError)
+def handle_not_acceptable_error(error):
+    response = jsonify(
+        {
+            "error": "NOT_ACCEPTABLE",
+            "message": error.args[0],
+            "data": {"supportedFormats": error.supported_formats},
+        }
+    )
+    response.status_code = 406  # Not Acceptable
+    return response
+
+
 # Custom 404 error handler
 @app.errorhandler(404)
 def page_not_found(error):
@@ -99,18 +128,49 @@ def is_forbidden_url(url: str, forbidden_list: List[str]):
 
 @app.before_request
 def before():
-    if "swagger" not in request.url:
-        logger.info(
-            "Request :%s",
-            {"url": request.url, "header": request.headers, "body": request.get_data()},
-        )
+    g.request_started_at = time.perf_counter()
+
+
+@app.route("/metrics")
+def metrics():
+    return app.response_class(registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
 
 
 @app.after_request
 def after(response):
-    if response.json is not None and "swagger" not in request.url:
-        logger.info(
-            "Response: %s",
-            {"url": request.url, "status_code": response.status, "data": response.json},
-        )
+    duration_seconds = time.perf_counter() - g.get("request_started_at", time.perf_counter())
+    http_request_seconds.observe(
+        duration_seconds,
+        method=request.method,
+        route=request.url_rule.rule if request.url_rule is not None else "unmatched",
+        status=response.status_code,
+    )
+
+    if "swagger" in request.url or not access_logger.should_log(response.status_code):
+        return response
+
+    # only bodies of a known length small enough to read are looked at, a chunked request has
+    # no content length and reading it could buffer a body of any size
+    request_data = None
+    if (
+        request.content_length is not None
+        and request.content_length <= access_logger.max_body_bytes
+    ):
+        request_data = request.get_data(cache=True)
+    response_data = None
+    if not response.is_streamed and not response.direct_passthrough:
+        response_data = response.get_data()
+
+    access_logger.log(
+        method=request.method,
+        url=request.url,
+        status_code=response.status_code,
+        duration_seconds=duration_seconds,
+        request_body=access_logger.get_body(
+            mimetype=request.mimetype, content_length=request.content_length, data=request_data
+        ),
+        response_body=access_logger.get_body(
+            mimetype=response.mimetype, content_length=response.content_length, data=response_data
+        ),
+    )
     return response
@@ -0,0 +1,285 @@
+"""
+in-process metrics rendered in the Prometheus text format by the /metrics endpoint
+every process keeps its own values, with CSV_WORKER_POOL_KIND=process the ingestion metrics of
+the worker processes are not part of the serving process's /metrics
+"""
+
+import functools
+import threading
+from abc import ABC, abstractmethod
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Tuple, TypeVar
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+DEFAULT_LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+def format_labels(label_names: Tuple[str, ...], label_values: Tuple[str, ...]) -> str:
+    if not label_names:
+        return ""
+    pairs = []
+    for name, value in zip(label_names, label_values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Metric(ABC):
+    metric_type = ""
+
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self._lock = threading.Lock()
+
+    def get_label_values(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"metric {self.name} takes labels {self.label_names}, got {labels}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    @abstractmethod
+    def render_samples(self) -> List[str]:
+        pass
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.metric_type}"]
+        lines.extend(self.render_samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    metric_type = "counter"
+
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...] = ()):
+        super().__init__(name, description, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        label_values = self.get_label_values(labels)
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render_samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [
+            f"{self.name}{format_labels(self.label_names, label_values)} {value}"
+            for label_values, value in values
+        ]
+
+
+class Gauge(Metric):
+    """
+    the value is read from a callback when the metrics are rendered
+    """
+
+    metric_type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        read_values: Callable[[], Dict[Tuple[str, ...], float]],
+        label_names: Tuple[str, ...] = (),
+    ):
+        super().__init__(name, description, label_names)
+        self.read_values = read_values
+
+    def render_samples(self) -> List[str]:
+        return [
+            f"{self.name}{format_labels(self.label_names, label_values)} {value}"
+            for label_values, value in self.read_values().items()
+        ]
+
+
+class Histogram(Metric):
+    metric_type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        label_names: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS,
+    ):
+        super().__init__(name, description, label_names)
+        self.buckets = buckets
+        # per label values: one count per bucket plus +Inf, then the sum of the observations
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        label_values = self.get_label_values(labels)
+        bucket_index = bisect_left(self.buckets, value)
+        with self._lock:
+            if label_values not in self._values:
+                self._values[label_values] = ([0] * (len(self.buckets) + 1), [0.0])
+            bucket_counts, total = self._values[label_values]
+            bucket_counts[bucket_index] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, **labels)
+
+    def render_samples(self) -> List[str]:
+        with self._lock:
+            values = [
+                (label_values, list(bucket_counts), total[0])
+                for label_values, (bucket_counts, total) in self._values.items()
+            ]
+
+        lines = []
+        label_names = self.label_names + ("le",)
+        for label_values, bucket_counts, total in values:
+            cumulative = 0
+            for upper_bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                cumulative += bucket_count
+                le = "+Inf" if upper_bound == float("inf") else repr(upper_bound)
+                labels = format_labels(label_names, label_values + (le,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Any:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        rendered = []
+        for metric in metrics:
+            try:
+                rendered.append(metric.render())
+            except Exception as e:
+                # one broken gauge callback must not take the endpoint down
+                rendered.append(f"# {metric.name} could not be read. Error = {e.args}")
+        return "\n".join(rendered) + "\n"
+
+
+registry = MetricsRegistry()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+http_request_seconds: Histogram = registry.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "time to build the response of a request, per route",
+        label_names=("method", "route", "status"),
+    )
+)
+query_manager_call_seconds: Histogram = registry.register(
+    Histogram(
+        "query_manager_call_duration_seconds",
+        "time spent in query_manager calls",
+        label_names=("function",),
+    )
+)
+query_manager_errors: Counter = registry.register(
+    Counter(
+        "query_manager_errors_total",
+        "query_manager calls that raised",
+        label_names=("function",),
+    )
+)
+ingestion_stage_seconds: Histogram = registry.register(
+    Histogram(
+        "csv_ingestion_stage_duration_seconds",
+        "time spent per ingestion stage, parse and image_wait per batch, insert per commit",
+        label_names=("stage",),
+    )
+)
+ingestion_rows: Counter = registry.register(
+    Counter("csv_ingestion_rows_total", "csv rows ingested", label_names=("outcome",))
+)
+csv_jobs: Counter = registry.register(
+    Counter("csv_jobs_total", "csv jobs run by this process", label_names=("outcome",))
+)
+image_cache_lookups: Counter = registry.register(
+    Counter(
+        "image_result_cache_lookups_total",
+        "image urls looked up in the image result cache, per tier that had them or miss",
+        label_names=("result",),
+    )
+)
+
+
+def register_gauge(
+    name: str,
+    description: str,
+    read_values: Callable[[], Dict[Tuple[str, ...], float]],
+    label_names: Tuple[str, ...] = (),
+) -> Gauge:
+    return registry.register(Gauge(name, description, read_values, label_names))
+
+
+def timed_query(function: F) -> F:
+    """
+    records the duration, and failures, of a query_manager function
+    """
+    function_name = function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        started_at = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        except Exception:
+            query_manager_errors.inc(function=function_name)
+            raise
+        finally:
+            query_manager_call_seconds.observe(
+                time.perf_counter() - started_at, function=function_name
+            )
+
+    return wrapper  # type: ignore[return-value]
+
+
+def iter_timed(items: Iterator[Any], stage: str) -> Iterator[Any]:
+    """
+    yields the items of a lazy iterator and records how long producing each one took
+    """
+    while True:
+        started_at = time.perf_counter()
+        try:
+            item = next(items)
+        except StopIteration:
+            return
+        ingestion_stage_seconds.observe(time.perf_counter() - started_at, stage=stage)
+        yield item
@@ -1,4 +1,4 @@
-from flask_restx import Namespace, reqparse
+from flask_restx import Namespace, inputs, reqparse
 from werkzeug.datastructures import FileStorage
 
 
@@ -14,4 +14,72 @@ class CsvApiRequests:
             required=True,
             help="CSV file to upload",
         )
+        parser.add_argument(
+            "profile",
+            type=inputs.boolean,
+            location="args",
+            default=False,
+            help="run the ingestion job under cProfile",
+        )
+        parser.add_argument(
+            "supplier",
+            type=str,
+            location="args",
+            help="apply the csv to this supplier's catalogue, "
+            "only the changed products are written",
+        )
+        return parser
+
+    @classmethod
+    def get_batch_upload_request_parser(cls, namespace: Namespace):
+        parser = namespace.parser()
+        parser.add_argument(
+            "csv",
+            type=FileStorage,
+            location="files",
+            action="append",
+            default=[],
+            help="CSV files to upload, the part may be repeated",
+        )
+        parser.add_argument(
+            "archive",
+            type=FileStorage,
+            location="files",
+            help="zip, tar, tar.gz or gzip archive of CSV files",
+        )
+        parser.add_argument(
+            "profile",
+            type=inputs.boolean,
+            location="args",
+            default=False,
+            help="run the ingestion jobs under cProfile",
+        )
+        return parser
+
+    @classmethod
+    def get_products_request_parser(cls, namespace: Namespace):
+        parser = namespace.parser()
+        parser.add_argument(
+            "limit", type=int, location="args", default=100, help="number of products per page"
+        )
+        parser.add_argument(
+            "cursor", type=str, location="args", help="next_cursor of the previous page"
+        )
+        parser.add_argument(
+            "fields",
+            type=str,
+            location="args",
+            help="comma separated product fields to return, all of them when left out",
+        )
+        return parser
+
+    @classmethod
+    def get_download_request_parser(cls, namespace: Namespace):
+        parser = namespace.parser()
+        parser.add_argument(
+            "format",
+            type=str,
+            location="args",
+            help="csv, ndjson, arrow or parquet, the Accept header decides when left out",
+        )
         return parser
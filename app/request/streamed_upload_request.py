@@ -0,0 +1,23 @@
+from typing import IO, Optional
+
+from flask import Request
+
+from app.services.csv_stream_reader import CsvUploadStream
+from app.storage.blob_store import get_blob_store
+
+
+class StreamedUploadRequest(Request):
+    """
+    werkzeug spools uploaded files to memory or a temporary file before the view sees them,
+    here they are parsed straight into the blob store instead, so an upload is hashed and its
+    rows are counted while it arrives and only a parser buffer of it is ever in memory
+    """
+
+    def _get_file_stream(
+        self,
+        total_content_length: Optional[int],
+        content_type: Optional[str],
+        filename: Optional[str] = None,
+        content_length: Optional[int] = None,
+    ) -> IO[bytes]:
+        return CsvUploadStream(blob_store=get_blob_store())  # type: ignore
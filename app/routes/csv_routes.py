@@ -2,11 +2,20 @@ import csv
 from dataclasses import asdict
 import io
 from flask_restx import Namespace, Resource
+from app.database.models.csv_batch_model import CsvBatchModel
 from app.database.models.csv_model import CsvModel
+from app.database.query_models.csv_batch_query_model import CsvBatchPollingResponse
 from app.database.query_models.csv_query_model import CsvPollingResponse
+from app.database.query_models.product_query_model import ProductsPageResponse
 from app.request.csv_api_requests import CsvApiRequests
-from app.services.csv_service import CsvDownloadService, CsvPollService, CsvService
-from flask import send_file
+from app.services.csv_error_report_service import CsvErrorReportService
+from app.services.csv_export_service import CsvExportArtifactService
+from app.services.product_export_service import ProductExportFormat, ProductExportService
+from app.services.csv_download_service import CsvDownloadService
+from app.services.csv_poll_service import CsvPollService
+from app.services.csv_product_service import CsvProductService
+from app.services.csv_service import CsvBatchService, CsvService
+from flask import Response, request, send_file, stream_with_context
 
 csv_api_ns = Namespace("csv", description="APIs for handling csv")
 
@@ -21,12 +30,43 @@ class CsvApiUpload(Resource):
         args = self.upload_csv_parser.parse_args()
         csv_file = args["csv"]  # This is a FileStorage object
         if csv_file:
-            inserted_csv: CsvModel = CsvService.handle_csv(csv_file=csv_file)
+            inserted_csv: CsvModel = CsvService.handle_csv(
+                csv_file=csv_file, profile=args["profile"], supplier_id=args["supplier"]
+            )
             return {"message": "File uploaded successfully", "fileId": inserted_csv.id}, 201
 
         return {"message": "No file uploaded"}, 400
 
 
+@csv_api_ns.route("/batch")
+class CsvBatchUpload(Resource):
+    batch_upload_parser = CsvApiRequests.get_batch_upload_request_parser(namespace=csv_api_ns)
+
+    @csv_api_ns.expect(batch_upload_parser)
+    def post(self):
+        args = self.batch_upload_parser.parse_args()
+        if not args["csv"] and not args["archive"]:
+            return {"message": "No file uploaded"}, 400
+
+        csv_batch: CsvBatchModel = CsvBatchService.handle_batch(
+            csv_files=args["csv"], archive=args["archive"], profile=args["profile"]
+        )
+        return {
+            "message": "Files uploaded successfully",
+            "batchId": csv_batch.id,
+            "fileIds": csv_batch.get_csv_file_ids(),
+        }, 201
+
+
+@csv_api_ns.route("/batch/<batch_id>")
+class CsvBatchPoll(Resource):
+    def get(self, batch_id: str):
+        polling_status: CsvBatchPollingResponse = CsvBatchService.get_batch_upload_status(
+            batch_id=batch_id
+        )
+        return {"data": asdict(polling_status)}, 200
+
+
 @csv_api_ns.route("/<csv_file_id>")
 class CsvApiPoll(Resource):
     def get(self, csv_file_id: str):
@@ -38,10 +78,98 @@ class CsvApiPoll(Resource):
         return {"data": asdict(polling_status)}, 200
 
 
+@csv_api_ns.route("/<csv_file_id>/products")
+class CsvProducts(Resource):
+    products_parser = CsvApiRequests.get_products_request_parser(namespace=csv_api_ns)
+
+    @csv_api_ns.expect(products_parser)
+    def get(self, csv_file_id: str):
+        args = self.products_parser.parse_args()
+        products_page: ProductsPageResponse = CsvProductService.get_products_page(
+            csv_file_id=csv_file_id,
+            limit=args["limit"],
+            cursor=args["cursor"],
+            fields=(
+                [field.strip() for field in args["fields"].split(",")] if args["fields"] else None
+            ),
+        )
+
+        return {"data": asdict(products_page)}, 200
+
+
+@csv_api_ns.route("/<csv_file_id>/errors")
+class CsvErrors(Resource):
+    def get(self, csv_file_id: str):
+        # the rows of the file that were not ingested, see CsvErrorReportService
+        return send_file(
+            CsvErrorReportService.open(csv_file_id=csv_file_id),
+            as_attachment=True,
+            download_name="errors.csv",
+            mimetype="text/csv",
+        )
+
+
 @csv_api_ns.route("download/<csv_file_id>")
 class CsvDownload(Resource):
+    download_parser = CsvApiRequests.get_download_request_parser(namespace=csv_api_ns)
+
+    @csv_api_ns.expect(download_parser)
     def get(self, csv_file_id: str):
-        result = CsvDownloadService.download_uploaded_csv(csv_file_id=csv_file_id)
-        return send_file(
-            path_or_file=result, as_attachment=True, download_name="output.csv", mimetype="text/csv"
+        args = self.download_parser.parse_args()
+        export_format = ProductExportService.negotiate_format(
+            format_name=args["format"], accept_header=request.headers.get("Accept")
         )
+        if export_format != ProductExportFormat.CSV:
+            # columnar and json exports are streamed from the products table
+            response = Response(
+                stream_with_context(
+                    CsvDownloadService.download_products(
+                        csv_file_id=csv_file_id, export_format=export_format
+                    )
+                ),
+                mimetype=ProductExportService.get_media_type(export_format),
+                headers={
+                    "Content-Disposition": "attachment; "
+                    f"filename={ProductExportService.get_download_name(export_format)}"
+                },
+            )
+            response.vary.add("Accept")
+            return response
+
+        artifact = CsvDownloadService.get_export_artifact(csv_file_id=csv_file_id)
+
+        if artifact is None:
+            # job still running, the products written so far are streamed live
+            csv_chunks = CsvDownloadService.download_uploaded_csv(csv_file_id=csv_file_id)
+            return Response(
+                stream_with_context(csv_chunks),
+                mimetype="text/csv",
+                headers={"Content-Disposition": "attachment; filename=output.csv"},
+            )
+
+        if request.accept_encodings["gzip"]:
+            # the gzip artifact is sent as is, send_file handles If-None-Match and Range
+            response = send_file(
+                path_or_file=artifact.path,
+                as_attachment=True,
+                download_name="output.csv",
+                mimetype="text/csv",
+                conditional=True,
+                etag=artifact.etag,
+                last_modified=artifact.last_modified,
+            )
+            response.headers["Content-Encoding"] = "gzip"
+        else:
+            response = Response(
+                stream_with_context(CsvExportArtifactService.iter_decompressed(artifact)),
+                mimetype="text/csv",
+                headers={"Content-Disposition": "attachment; filename=output.csv"},
+            )
+            # a different representation of the same artifact needs its own etag
+            response.set_etag(f"{artifact.etag}-identity")
+            response.last_modified = artifact.last_modified
+            response = response.make_conditional(request)
+
+        response.vary.add("Accept-Encoding")
+        response.vary.add("Accept")
+        return response
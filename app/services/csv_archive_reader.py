@@ -0,0 +1,111 @@
+import gzip
+import os
+import tarfile
+import zipfile
+import zlib
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+ZIP_MAGIC = b"PK\x03\x04"
+GZIP_MAGIC = b"\x1f\x8b"
+TAR_BLOCK_SIZE = 512
+# a tar header carries its magic at this offset of its first block
+TAR_MAGIC_OFFSET = 257
+TAR_MAGIC = b"ustar"
+# raised while a truncated or corrupt archive is read
+ARCHIVE_READ_ERRORS = (
+    EOFError,
+    zlib.error,
+    gzip.BadGzipFile,
+    tarfile.TarError,
+    zipfile.BadZipFile,
+)
+
+
+class CsvArchiveReader:
+    """
+    yields the csv files of an uploaded zip, tar, tar.gz or gzip archive one at a time, each as
+    a stream that decompresses while it is read, so no member is ever held in memory
+    tar and tar.gz archives are read front to back without seeking, zip archives need the
+    seekable upload stream for their central directory
+    members that are not .csv files, directories and files of macOS resource forks are skipped,
+    a gzip archive holds a single file whatever its name
+    """
+
+    @classmethod
+    def is_csv_member(cls, member_name: str) -> bool:
+        file_name = os.path.basename(member_name)
+        return (
+            member_name.lower().endswith(".csv")
+            and not file_name.startswith(".")
+            and not member_name.startswith("__MACOSX/")
+        )
+
+    @classmethod
+    def iter_csv_members(
+        cls, archive_stream: BinaryIO, archive_name: Optional[str] = None
+    ) -> Iterator[Tuple[str, BinaryIO]]:
+        """
+        a member stream is only valid until the next member is yielded
+        raises ValueError for anything that is not one of the supported archives, reading a
+        corrupt archive raises one of ARCHIVE_READ_ERRORS
+        """
+        archive_stream.seek(0)
+        head = archive_stream.read(TAR_BLOCK_SIZE)
+        archive_stream.seek(0)
+
+        if head.startswith(ZIP_MAGIC):
+            yield from cls.iter_zip_members(archive_stream)
+        elif head.startswith(GZIP_MAGIC):
+            with gzip.GzipFile(fileobj=archive_stream, mode="rb") as gzip_file:
+                is_tar = cls.is_tar_header(gzip_file.read(TAR_BLOCK_SIZE))
+            archive_stream.seek(0)
+            if is_tar:
+                yield from cls.iter_tar_members(archive_stream, mode="r|gz")
+            else:
+                with gzip.GzipFile(fileobj=archive_stream, mode="rb") as gzip_file:
+                    yield cls.get_gzip_member_name(archive_name), gzip_file
+        elif cls.is_tar_header(head):
+            yield from cls.iter_tar_members(archive_stream, mode="r|")
+        else:
+            raise ValueError(f"{archive_name or 'archive'} is not a zip, tar, tar.gz or gzip file")
+
+    @classmethod
+    def is_tar_header(cls, block: bytes) -> bool:
+        return block[TAR_MAGIC_OFFSET : TAR_MAGIC_OFFSET + len(TAR_MAGIC)] == TAR_MAGIC
+
+    @classmethod
+    def get_gzip_member_name(cls, archive_name: Optional[str]) -> str:
+        if archive_name and archive_name.lower().endswith(".gz"):
+            return archive_name[: -len(".gz")]
+        return archive_name or "archive.csv"
+
+    @classmethod
+    def iter_zip_members(cls, archive_stream: BinaryIO) -> Iterator[Tuple[str, BinaryIO]]:
+        try:
+            zip_archive = zipfile.ZipFile(archive_stream)
+        except zipfile.BadZipFile as e:
+            raise ValueError(f"invalid zip archive, {e}")
+
+        with zip_archive:
+            for member in zip_archive.infolist():
+                if member.is_dir() or not cls.is_csv_member(member.filename):
+                    continue
+                with zip_archive.open(member) as member_stream:
+                    yield member.filename, member_stream
+
+    @classmethod
+    def iter_tar_members(
+        cls, archive_stream: BinaryIO, mode: str
+    ) -> Iterator[Tuple[str, BinaryIO]]:
+        try:
+            tar_archive = tarfile.open(fileobj=archive_stream, mode=mode)
+        except tarfile.TarError as e:
+            raise ValueError(f"invalid tar archive, {e}")
+
+        with tar_archive:
+            for member in tar_archive:
+                if not member.isfile() or not cls.is_csv_member(member.name):
+                    continue
+                member_stream = tar_archive.extractfile(member)
+                if member_stream is not None:
+                    yield member.name, member_stream
@@ -0,0 +1,476 @@
+from datetime import datetime
+from contextlib import contextmanager
+from functools import partial
+from itertools import chain
+from operator import getitem, setitem
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple, Union
+from sqlalchemy import and_
+from app.database import query_manager
+from app.database.models.catalog_product_model import CatalogProductModel
+from app.database.models.csv_job_model import CsvJobModel
+from app.database.models.csv_model import CsvModel
+from app.database.repository.catalog_repository import CatalogRepository
+from app.logger import logger
+from app.metrics import ingestion_rows, ingestion_stage_seconds, iter_timed
+from app.services.csv_ingestion_service import CsvIngestionService, ImageBatch
+from app.services.csv_job_service import CsvJobDeferred, CsvJobProgress, csv_job_worker_pool
+from app.services.csv_row_validator import CsvHeaderMapping, CsvRowError, CsvRowValidator
+from app.services.csv_shard_service import CsvShardService
+from app.services.csv_stream_reader import CsvStreamReader
+from app.storage.blob_store import get_blob_store
+
+# columns a changed product of a catalogue overwrites, created_at stays the one of its insert
+CATALOG_PRODUCT_UPDATE_COLUMNS = [
+    "csv_file_id",
+    "product_name",
+    "input_image_urls",
+    "output_image_urls",
+    "fingerprint",
+    "is_deleted",
+    "updated_at",
+]
+
+
+class CsvDeltaUploadService:
+    """
+    delta uploads re-send the whole catalogue of a supplier, every day or so, and only a few of
+    its products change. the products of such a file are not inserted per file but applied to
+    the supplier's catalogue, CATALOG_PRODUCTS, keyed on supplier and s_no
+    every batch of the file is diffed in bulk, one lookup of the stored fingerprints of its
+    s_nos, and only the products that are new, changed or came back after being tombstoned get
+    their images processed and are written. once the file is read, the products of the
+    catalogue the file no longer has are tombstoned. an unchanged product costs its parse, its
+    fingerprint and its share of the lookup, so a file that changes 1% of a catalogue costs a
+    small fraction of a full ingest
+    the s_nos of the file are held in memory until it is done, for the duplicates and the
+    tombstones, roughly 100 bytes a row
+    """
+
+    @classmethod
+    def get_supplier_id_max_length(cls) -> int:
+        return CatalogProductModel.supplier_id.type.length  # type: ignore[attr-defined]
+
+    @classmethod
+    def normalise_supplier_id(cls, supplier_id: Optional[str]) -> Optional[str]:
+        """
+        a blank supplier_id is no supplier, the upload is not a delta upload
+        """
+        supplier_id = (supplier_id or "").strip()
+        if not supplier_id:
+            return None
+        if len(supplier_id) > cls.get_supplier_id_max_length():
+            raise ValueError(
+                f"supplier id is {len(supplier_id)} characters long, at most "
+                f"{cls.get_supplier_id_max_length()} fit"
+            )
+        return supplier_id
+
+    @classmethod
+    @contextmanager
+    def hold_catalog(cls, csv_model: CsvModel, csv_job: CsvJobModel) -> Iterator[None]:
+        """
+        makes the job the only one changing the catalogue of the file's supplier for the block,
+        raises CsvJobDeferred while another job holds it, files without a supplier hold nothing
+        a block that raises keeps the catalogue held, the job is retried and resumes, and no
+        other file is applied on top of the half applied one
+        """
+        supplier_id = csv_model.supplier_id
+        if not supplier_id:
+            yield
+            return
+
+        if not CatalogRepository.acquire_catalog(supplier_id=supplier_id, csv_job=csv_job):
+            raise CsvJobDeferred(f"the catalog of supplier {supplier_id} is held by another job")
+        yield
+        CatalogRepository.release_catalog(
+            supplier_id=supplier_id, csv_job=csv_job, applied_csv_file_id=csv_model.id
+        )
+        # jobs deferred behind this one wait for the next poll otherwise
+        csv_job_worker_pool.notify()
+
+    @classmethod
+    def apply_csv_to_catalog(
+        cls, csv_model: CsvModel, progress: Optional[CsvJobProgress] = None, skip_rows: int = 0
+    ) -> None:
+        """
+        diffs the file against its supplier's catalogue and writes what changed, batches are
+        pipelined through the image processor, see CsvIngestionService.write_image_batches
+        the first skip_rows data rows were committed by an earlier attempt, they are still read
+        for their s_nos, but not diffed again
+        """
+        csv_file_id = csv_model.id
+        supplier_id = csv_model.supplier_id
+        if not supplier_id:
+            raise ValueError(f"csv file {csv_file_id} is not a delta upload")
+
+        header_mapping, validated_batches = cls.iter_validated_batches(csv_model=csv_model)
+        # every s_no of the file so far, of valid rows and of rows that failed, a product whose
+        # row failed validation is kept as it is, not tombstoned
+        file_s_nos: Set[str] = set()
+        # ids given to new products of the batches that are not committed yet
+        pending_catalog_product_ids: Set[str] = set()
+
+        def iter_image_batches() -> Iterator[ImageBatch]:
+            last_row_number = 0
+            for validated_batch in iter_timed(iter(validated_batches), stage="parse"):
+                first_row_number = last_row_number + 1
+                last_row_number += len(validated_batch)
+                if first_row_number <= skip_rows:
+                    committed_row_count = min(
+                        skip_rows - first_row_number + 1, len(validated_batch)
+                    )
+                    file_s_nos.update(
+                        cls.iter_row_s_nos(validated_batch[:committed_row_count], header_mapping)
+                    )
+                    validated_batch = validated_batch[committed_row_count:]
+                    first_row_number += committed_row_count
+                    if not validated_batch:
+                        continue
+
+                if progress is not None:
+                    progress.rows_started(row_count=len(validated_batch))
+
+                changed_rows, changed_row_numbers, unchanged_count, failed_rows = (
+                    cls.diff_catalog_batch(
+                        supplier_id=supplier_id,
+                        csv_file_id=csv_file_id,
+                        validated_batch=validated_batch,
+                        first_row_number=first_row_number,
+                        header_mapping=header_mapping,
+                        file_s_nos=file_s_nos,
+                        pending_catalog_product_ids=pending_catalog_product_ids,
+                    )
+                )
+                pending_catalog_product_ids.update(
+                    changed_row["id"] for changed_row in changed_rows
+                )
+                # unchanged products keep their output images, only the changed ones are processed
+                yield ImageBatch(
+                    products=changed_rows,
+                    row_numbers=changed_row_numbers,
+                    failed_rows=failed_rows,
+                    unchanged_count=unchanged_count,
+                )
+
+        def write_batch(image_batch: ImageBatch, changed_rows: List[Dict[str, Any]]) -> None:
+            pending_catalog_product_ids.difference_update(
+                changed_row["id"] for changed_row in image_batch.products
+            )
+            # a product one of whose images failed is not in changed_rows, it keeps what the
+            # catalogue has
+            if progress is None:
+                query_manager.upsert_rows(
+                    model=CatalogProductModel,
+                    rows=changed_rows,
+                    update_columns=CATALOG_PRODUCT_UPDATE_COLUMNS,
+                )
+            else:
+                # a batch without changes still moves the checkpoint
+                progress.commit_rows(
+                    model=CatalogProductModel,
+                    rows=changed_rows,
+                    processed_row_count=len(changed_rows) + image_batch.unchanged_count,
+                    failed_row_count=len(image_batch.failed_rows),
+                    update_columns=CATALOG_PRODUCT_UPDATE_COLUMNS,
+                )
+
+        CsvIngestionService.write_image_batches(
+            image_batches=iter_image_batches(),
+            write_batch=write_batch,
+            csv_file_id=csv_file_id,
+            get_field=getitem,
+            set_field=setitem,
+        )
+
+        with ingestion_stage_seconds.time(stage="tombstone"):
+            cls.tombstone_missing_products(
+                supplier_id=supplier_id,
+                csv_file_id=csv_file_id,
+                file_s_nos=file_s_nos,
+                progress=progress,
+            )
+
+    @classmethod
+    def validate_rows(
+        cls, csv_rows: List[List[str]], csv_file_id: str, row_validator: CsvRowValidator
+    ) -> List[Union[List[str], CsvRowError]]:
+        # rows transformer of the parallel parse, the rows are only validated, unchanged
+        # products never need a ProductInsertRow or a product id
+        return row_validator.validate_batch(csv_rows)
+
+    @classmethod
+    def iter_validated_batches(
+        cls, csv_model: CsvModel
+    ) -> Tuple[CsvHeaderMapping, Iterator[List[Union[List[str], CsvRowError]]]]:
+        """
+        every data row of the file, normalised or failed, see CsvRowValidator.validate_batch, in
+        batches of PRODUCT_INSERT_BATCH_SIZE. large files are parsed by a process pool, like in
+        CsvUploadService.create_products_from_csv_in_parallel
+        :return: the header mapping of the file and the batches
+        """
+        batch_size = CsvIngestionService.get_product_insert_batch_size()
+
+        csv_rows = CsvStreamReader.iter_rows_from_csv_model(csv_model=csv_model)
+        header_mapping = CsvIngestionService.get_header_mapping(next(csv_rows, None))
+        row_validator = CsvRowValidator(header_mapping=header_mapping)
+        if not CsvShardService.should_parse_in_parallel(size_bytes=csv_model.size_bytes):
+            return header_mapping, (
+                row_validator.validate_batch(rows_batch)
+                for rows_batch in CsvStreamReader.iter_batches(csv_rows, batch_size=batch_size)
+            )
+
+        csv_rows.close()
+        validated_rows = chain.from_iterable(
+            CsvShardService.iter_transformed_shards(
+                csv_path=get_blob_store().get_path(csv_model.blob_key),
+                csv_file_id=csv_model.id,
+                rows_transformer=partial(cls.validate_rows, row_validator=row_validator),
+            )
+        )
+        return header_mapping, CsvStreamReader.iter_batches(validated_rows, batch_size=batch_size)
+
+    @classmethod
+    def iter_row_s_nos(
+        cls,
+        validated_batch: List[Union[List[str], CsvRowError]],
+        header_mapping: CsvHeaderMapping,
+    ) -> Iterator[str]:
+        """
+        the s_no of every row that has one, a row that failed validation is read as it was sent
+        """
+        for validated_row in validated_batch:
+            if not isinstance(validated_row, CsvRowError):
+                yield validated_row[0]
+            elif len(validated_row.csv_row) > header_mapping.s_no_index:
+                s_no = validated_row.csv_row[header_mapping.s_no_index].strip()
+                if s_no:
+                    yield s_no
+
+    @classmethod
+    def get_catalog_products(
+        cls, supplier_id: str, s_nos: List[str]
+    ) -> Dict[str, Tuple[str, bool, str]]:
+        """
+        :return: fingerprint, is_deleted and id of the products of the catalogue with one of the
+        s_nos, by s_no
+        """
+        if not s_nos:
+            return {}
+        catalog_product_rows = query_manager.query_columns_by_keyset(
+            filters=and_(
+                CatalogProductModel.supplier_id == supplier_id,
+                CatalogProductModel.s_no.in_(s_nos),
+            ),
+            columns=[
+                CatalogProductModel.fingerprint,
+                CatalogProductModel.is_deleted,
+                CatalogProductModel.id,
+                CatalogProductModel.s_no,
+            ],
+            # ordered by s_no, so that the (supplier_id, s_no) index serves both the lookup and
+            # the order, ordered by id the whole catalogue would be scanned for every batch
+            key_columns=[CatalogProductModel.s_no],
+            limit=len(s_nos),
+        )
+        return {
+            s_no: (fingerprint, is_deleted, catalog_product_id)
+            for fingerprint, is_deleted, catalog_product_id, s_no in catalog_product_rows
+        }
+
+    @classmethod
+    def diff_catalog_batch(
+        cls,
+        supplier_id: str,
+        csv_file_id: str,
+        validated_batch: List[Union[List[str], CsvRowError]],
+        first_row_number: int,
+        header_mapping: CsvHeaderMapping,
+        file_s_nos: Set[str],
+        pending_catalog_product_ids: Set[str],
+    ) -> Tuple[List[Dict[str, Any]], List[int], int, List[Tuple[int, CsvRowError]]]:
+        """
+        compares the products of a batch, numbered from first_row_number, with the catalogue
+        a product is unchanged when the catalogue has it, not tombstoned, with the same
+        fingerprint. an s_no already in file_s_nos fails as a duplicate, the s_nos of the batch
+        are added to it
+        :return: the insert parameters of the new and changed products, with their output image
+        urls left empty, their row numbers, the number of unchanged products and the rows that
+        failed
+        """
+        current_time = datetime.now()
+        product_rows: List[List[str]] = []
+        product_row_numbers: List[int] = []
+        failed_rows: List[Tuple[int, CsvRowError]] = []
+        for row_number, validated_row in enumerate(validated_batch, start=first_row_number):
+            if isinstance(validated_row, CsvRowError):
+                failed_rows.append((row_number, validated_row))
+                file_s_nos.update(cls.iter_row_s_nos([validated_row], header_mapping))
+            elif validated_row[0] in file_s_nos:
+                failed_rows.append(
+                    (
+                        row_number,
+                        CsvIngestionService.build_duplicate_row_error(
+                            s_no=validated_row[0], csv_row=validated_row
+                        ),
+                    )
+                )
+            else:
+                file_s_nos.add(validated_row[0])
+                product_rows.append(validated_row)
+                product_row_numbers.append(row_number)
+
+        catalog_products = cls.get_catalog_products(
+            supplier_id=supplier_id, s_nos=[product_row[0] for product_row in product_rows]
+        )
+        changed_rows: List[Dict[str, Any]] = []
+        changed_row_numbers: List[int] = []
+        new_rows: List[Dict[str, Any]] = []
+        for row_number, (s_no, product_name, *input_image_urls) in zip(
+            product_row_numbers, product_rows
+        ):
+            fingerprint = CatalogProductModel.get_fingerprint(
+                product_name=product_name, input_image_urls=input_image_urls
+            )
+            stored_fingerprint, is_deleted, catalog_product_id = catalog_products.get(
+                s_no, (None, False, None)
+            )
+            if stored_fingerprint == fingerprint and not is_deleted:
+                continue
+
+            changed_row = {
+                "id": catalog_product_id,
+                "supplier_id": supplier_id,
+                "csv_file_id": csv_file_id,
+                "s_no": s_no,
+                "product_name": product_name,
+                "input_image_urls": input_image_urls,
+                "output_image_urls": [],
+                "fingerprint": fingerprint,
+                "is_deleted": False,
+                # only inserted, see CATALOG_PRODUCT_UPDATE_COLUMNS
+                "created_at": current_time,
+                "updated_at": current_time,
+            }
+            changed_rows.append(changed_row)
+            changed_row_numbers.append(row_number)
+            if catalog_product_id is None:
+                new_rows.append(changed_row)
+
+        cls.assign_new_catalog_product_ids(
+            supplier_id=supplier_id,
+            new_rows=new_rows,
+            pending_catalog_product_ids=pending_catalog_product_ids,
+        )
+        return (
+            changed_rows,
+            changed_row_numbers,
+            len(product_rows) - len(changed_rows),
+            failed_rows,
+        )
+
+    @classmethod
+    def assign_new_catalog_product_ids(
+        cls,
+        supplier_id: str,
+        new_rows: List[Dict[str, Any]],
+        pending_catalog_product_ids: Set[str],
+    ) -> None:
+        """
+        gives the new products of a batch their ids, the catalogue has none of their s_nos, so a
+        short id that is already taken, in the catalogue or by a product not committed yet, was
+        computed for another product and the long id is used instead
+        """
+        new_ids = CatalogProductModel.get_ids_for_catalog_products(
+            (supplier_id, new_row["s_no"]) for new_row in new_rows
+        )
+        if not new_ids:
+            return
+        taken_ids = set(
+            catalog_product_id
+            for (catalog_product_id,) in query_manager.query_columns_by_keyset(
+                filters=CatalogProductModel.id.in_(new_ids),
+                columns=[CatalogProductModel.id],
+                key_columns=[CatalogProductModel.id],
+                limit=len(new_ids),
+            )
+        )
+        taken_ids.update(pending_catalog_product_ids)
+
+        long_id_count = 0
+        for new_row, new_id in zip(new_rows, new_ids):
+            if new_id in taken_ids:
+                new_id = CatalogProductModel.get_long_id_for_catalog_product(
+                    supplier_id=supplier_id, s_no=new_row["s_no"]
+                )
+                long_id_count += 1
+            new_row["id"] = new_id
+            taken_ids.add(new_id)
+        if long_id_count:
+            logger.warning(f"{long_id_count} catalog product ids collided, using their long ids")
+
+    @classmethod
+    def tombstone_missing_products(
+        cls,
+        supplier_id: str,
+        csv_file_id: str,
+        file_s_nos: Set[str],
+        progress: Optional[CsvJobProgress] = None,
+    ) -> int:
+        """
+        marks the products of the catalogue that are not in the file as deleted, the catalogue
+        is read page by page and the tombstones of a page are written as one bulk update
+        tombstoning again what a failed attempt already tombstoned changes nothing
+        :return: the number of products tombstoned
+        """
+        page_size = CsvIngestionService.get_product_insert_batch_size()
+        tombstone_count = 0
+        tombstone_rows: List[Dict[str, Any]] = []
+
+        def write_tombstones() -> None:
+            query_manager.bulk_update_rows(model=CatalogProductModel, rows=tombstone_rows)
+            if progress is not None:
+                # nothing to count, this only renews the lease of a long pass
+                progress.rows_finished(processed_row_count=0)
+            tombstone_rows.clear()
+
+        current_time = datetime.now()
+        for s_no, catalog_product_id in query_manager.iter_columns_by_keyset(
+            filters=and_(
+                CatalogProductModel.supplier_id == supplier_id,
+                CatalogProductModel.is_deleted.is_(False),
+            ),
+            columns=[CatalogProductModel.s_no, CatalogProductModel.id],
+            key_columns=[CatalogProductModel.id],
+            page_size=page_size,
+        ):
+            if s_no in file_s_nos:
+                continue
+            tombstone_rows.append(
+                {
+                    "id": catalog_product_id,
+                    "is_deleted": True,
+                    "csv_file_id": csv_file_id,
+                    "updated_at": current_time,
+                }
+            )
+            tombstone_count += 1
+            if len(tombstone_rows) >= page_size:
+                write_tombstones()
+        if tombstone_rows:
+            write_tombstones()
+
+        if tombstone_count:
+            logger.info(f"{tombstone_count} products of supplier {supplier_id} tombstoned")
+        ingestion_rows.inc(tombstone_count, outcome="tombstoned")
+        return tombstone_count
+
+    @classmethod
+    def get_supplier_id_of_csv_file(cls, csv_file_id: str, read_only: bool = True) -> Optional[str]:
+        csv_file_rows = query_manager.query_columns_by_keyset(
+            filters=CsvModel.id == csv_file_id,
+            columns=[CsvModel.supplier_id, CsvModel.id],
+            key_columns=[CsvModel.id],
+            limit=1,
+            read_only=read_only,
+        )
+        return csv_file_rows[0][0] if csv_file_rows else None
@@ -0,0 +1,141 @@
+import csv
+from io import StringIO
+import os
+from typing import Any, Iterable, Iterator, List, Optional
+from sqlalchemy import and_
+from app.database import query_manager
+from app.database.models.catalog_product_model import CatalogProductModel
+from app.database.models.csv_job_model import CsvJobModel
+from app.database.models.product import ProductModel
+from app.services.csv_delta_upload_service import CsvDeltaUploadService
+from app.services.csv_export_service import CsvExportArtifact, CsvExportArtifactService
+from app.services.product_export_service import ProductExportFormat, ProductExportService
+
+
+class CsvDownloadService:
+    headers = [
+        "PRODUCT_SL_NO",
+        "PRODUCT_NAME",
+        "INPUT_PRODUCT_IMAGE_URLS",
+        "OUTPUT_PRODUCT_IMAGE_URLS",
+    ]
+
+    @classmethod
+    def get_download_page_size(cls) -> int:
+        return int(os.getenv("CSV_DOWNLOAD_PAGE_SIZE", "1000"))
+
+    @classmethod
+    def get_export_artifact(cls, csv_file_id: str) -> Optional[CsvExportArtifact]:
+        """
+        the precomputed export of a completed job, None while the job is still running
+        """
+        csv_jobs: List[CsvJobModel] = query_manager.query_with_filter(
+            model=CsvJobModel,
+            filters=CsvJobModel.csv_file_id == csv_file_id,
+            read_only=True,
+        )
+        return CsvExportArtifactService.get_artifact(csv_job=csv_jobs[0] if csv_jobs else None)
+
+    @classmethod
+    def download_uploaded_csv(cls, csv_file_id: str, read_only: bool = True) -> Iterator[bytes]:
+        """
+        streams the products of the file as csv, one encoded chunk per page of products
+        read_only=False reads from the write engine, for callers that must see their own writes
+        """
+        return cls.convert_products_to_csv(
+            product_rows=cls.iter_product_rows(csv_file_id=csv_file_id, read_only=read_only)
+        )
+
+    @classmethod
+    def download_products(
+        cls, csv_file_id: str, export_format: ProductExportFormat
+    ) -> Iterator[bytes]:
+        """
+        streams the products of the file as ndjson, arrow or parquet, see ProductExportService
+        """
+        return ProductExportService.iter_export(
+            export_format=export_format,
+            product_rows=cls.iter_product_rows(csv_file_id=csv_file_id),
+            page_size=cls.get_download_page_size(),
+        )
+
+    @classmethod
+    def iter_product_rows(cls, csv_file_id: str, read_only: bool = True) -> Iterator[Any]:
+        """
+        only the four exported columns are read and products are paged through in file order
+        a delta upload without an export yet reads the products its supplier's catalogue has now,
+        by s_no
+        """
+        supplier_id = CsvDeltaUploadService.get_supplier_id_of_csv_file(
+            csv_file_id=csv_file_id, read_only=read_only
+        )
+        if supplier_id:
+            return query_manager.iter_columns_by_keyset(
+                filters=and_(
+                    CatalogProductModel.supplier_id == supplier_id,
+                    CatalogProductModel.is_deleted.is_(False),
+                ),
+                columns=[
+                    CatalogProductModel.s_no,
+                    CatalogProductModel.product_name,
+                    CatalogProductModel.input_image_urls,
+                    CatalogProductModel.output_image_urls,
+                ],
+                key_columns=[CatalogProductModel.s_no],
+                page_size=cls.get_download_page_size(),
+                read_only=read_only,
+            )
+
+        return query_manager.iter_columns_by_keyset(
+            filters=ProductModel.csv_file_id == csv_file_id,
+            columns=[
+                ProductModel.s_no,
+                ProductModel.product_name,
+                ProductModel.input_image_urls,
+                ProductModel.output_image_urls,
+                ProductModel.row_number,
+                ProductModel.id,
+            ],
+            # products written before their row numbers were kept share row number 0
+            key_columns=[ProductModel.row_number, ProductModel.id],
+            page_size=cls.get_download_page_size(),
+            read_only=read_only,
+        )
+
+    @classmethod
+    def convert_products_to_csv(
+        cls, product_rows: Iterable[Any], rows_per_chunk: int = 1000
+    ) -> Iterator[bytes]:
+        """
+        Converts product rows into encoded CSV chunks, the header chunk comes first
+        """
+        csv_output = StringIO()
+        csv_writer = csv.writer(csv_output)
+
+        csv_writer.writerow(cls.headers)
+        yield cls.drain_csv_output(csv_output)
+
+        for index, (s_no, product_name, input_image_urls, output_image_urls, *_) in enumerate(
+            product_rows, start=1
+        ):
+            csv_writer.writerow(
+                [
+                    s_no,
+                    product_name,
+                    ", ".join(input_image_urls) if input_image_urls else "",
+                    ", ".join(output_image_urls) if output_image_urls else "",
+                ]
+            )
+            if index % rows_per_chunk == 0:
+                yield cls.drain_csv_output(csv_output)
+
+        remaining = cls.drain_csv_output(csv_output)
+        if remaining:
+            yield remaining
+
+    @classmethod
+    def drain_csv_output(cls, csv_output: StringIO) -> bytes:
+        chunk = csv_output.getvalue().encode("utf-8")
+        csv_output.seek(0)
+        csv_output.truncate()
+        return chunk
@@ -0,0 +1,62 @@
+import csv
+import os
+from typing import BinaryIO, List, Tuple
+
+from app.services.csv_row_validator import CsvRowError
+
+ERROR_REPORT_HEADER = ["RECORD_NUMBER", "FIELD", "ERROR", "ROW"]
+
+
+class CsvErrorReportService:
+    """
+    rows of a csv that could not be ingested are appended to a per file error report, a csv with
+    the record number of the row, the header being record 1, why it failed and its cells
+    lines are appended after their batch is committed, so a retried job does not report the rows
+    of the batches it already committed again
+    """
+
+    @classmethod
+    def get_report_directory(cls) -> str:
+        project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        return os.getenv("CSV_ERROR_REPORT_PATH", os.path.join(project_root, "error_reports"))
+
+    @classmethod
+    def get_report_path(cls, csv_file_id: str) -> str:
+        return os.path.join(cls.get_report_directory(), f"{csv_file_id}.csv")
+
+    @classmethod
+    def append(cls, csv_file_id: str, failed_rows: List[Tuple[int, CsvRowError]]) -> None:
+        """
+        :param failed_rows: data row number, the first row after the header being 1, and its error
+        """
+        if not failed_rows:
+            return
+
+        os.makedirs(cls.get_report_directory(), exist_ok=True)
+        report_path = cls.get_report_path(csv_file_id)
+        is_new_report = not os.path.exists(report_path)
+        with open(report_path, "a", newline="", encoding="utf-8") as report_file:
+            writer = csv.writer(report_file)
+            if is_new_report:
+                writer.writerow(ERROR_REPORT_HEADER)
+            writer.writerows(
+                [row_number + 1, row_error.field, row_error.message, *row_error.csv_row]
+                for row_number, row_error in failed_rows
+            )
+
+    @classmethod
+    def delete(cls, csv_file_id: str) -> None:
+        try:
+            os.remove(cls.get_report_path(csv_file_id))
+        except FileNotFoundError:
+            pass
+
+    @classmethod
+    def open(cls, csv_file_id: str) -> BinaryIO:
+        """
+        raises ValueError when no row of the file failed
+        """
+        try:
+            return open(cls.get_report_path(csv_file_id), "rb")
+        except FileNotFoundError:
+            raise ValueError(f"No error report found for csv file id = {csv_file_id}")
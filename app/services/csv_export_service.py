@@ -0,0 +1,133 @@
+import gzip
+import hashlib
+import os
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional
+
+from app.database import query_manager
+from app.database.models.csv_job_model import CsvJobModel, CsvJobStatus
+from app.logger import logger
+
+EXPORT_META_DATA_KEY = "export"
+READ_CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class CsvExportArtifact:
+    path: str
+    etag: str
+    size_bytes: int
+    created_at: str
+
+    @property
+    def last_modified(self) -> datetime:
+        return datetime.fromisoformat(self.created_at)
+
+
+class CsvExportArtifactService:
+    """
+    a finished job's output never changes, so its csv export is written once as a gzip file and
+    served from disk afterwards, the artifact's metadata lives in the job's METADATA column
+    """
+
+    @classmethod
+    def get_export_directory(cls) -> str:
+        project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        return os.getenv("EXPORT_ARTIFACT_PATH", os.path.join(project_root, "exports"))
+
+    @classmethod
+    def get_artifact_path(cls, csv_file_id: str) -> str:
+        return os.path.join(cls.get_export_directory(), f"{csv_file_id}.csv.gz")
+
+    @classmethod
+    def materialize(cls, csv_job: CsvJobModel, csv_chunks: Iterator[bytes]) -> CsvExportArtifact:
+        """
+        gzips the csv chunks to disk and records the artifact on the job
+        the file is written under a temporary name and renamed, so readers never see half of it
+        """
+        os.makedirs(cls.get_export_directory(), exist_ok=True)
+        artifact_path = cls.get_artifact_path(csv_job.csv_file_id)
+        temporary_path = f"{artifact_path}.{os.getpid()}.tmp"
+
+        with open(temporary_path, "wb") as artifact_file:
+            # mtime=0 keeps the bytes, and so the etag, the same for the same products
+            with gzip.GzipFile(fileobj=artifact_file, mode="wb", mtime=0) as gzip_file:
+                for csv_chunk in csv_chunks:
+                    gzip_file.write(csv_chunk)
+            artifact_file.flush()
+            os.fsync(artifact_file.fileno())
+
+        content_hash = hashlib.sha256()
+        with open(temporary_path, "rb") as artifact_file:
+            for chunk in iter(lambda: artifact_file.read(READ_CHUNK_SIZE), b""):
+                content_hash.update(chunk)
+
+        os.replace(temporary_path, artifact_path)
+
+        artifact = CsvExportArtifact(
+            path=artifact_path,
+            etag=content_hash.hexdigest(),
+            size_bytes=os.path.getsize(artifact_path),
+            created_at=datetime.now().replace(microsecond=0).isoformat(),
+        )
+        cls.save_artifact_meta_data(csv_job=csv_job, export_meta_data=asdict(artifact))
+        return artifact
+
+    @classmethod
+    def save_artifact_meta_data(
+        cls, csv_job: CsvJobModel, export_meta_data: Optional[Dict[str, Any]]
+    ) -> None:
+        meta_data = dict(csv_job.meta_data or {})
+        if export_meta_data is None:
+            meta_data.pop(EXPORT_META_DATA_KEY, None)
+        else:
+            meta_data[EXPORT_META_DATA_KEY] = export_meta_data
+
+        query_manager.update_with_filter(
+            model=CsvJobModel,
+            filters=CsvJobModel.id == csv_job.id,
+            values={"meta_data": meta_data, "updated_at": datetime.now()},
+        )
+        csv_job.meta_data = meta_data
+
+    @classmethod
+    def invalidate(cls, csv_job: CsvJobModel) -> None:
+        """
+        called before a job is (re)processed, the old export no longer describes the products
+        """
+        try:
+            os.remove(cls.get_artifact_path(csv_job.csv_file_id))
+        except FileNotFoundError:
+            pass
+
+        if EXPORT_META_DATA_KEY in (csv_job.meta_data or {}):
+            cls.save_artifact_meta_data(csv_job=csv_job, export_meta_data=None)
+
+    @classmethod
+    def get_artifact(cls, csv_job: Optional[CsvJobModel]) -> Optional[CsvExportArtifact]:
+        """
+        returns the artifact of a completed job, or None when downloads must be generated live
+        """
+        if csv_job is None or csv_job.status != CsvJobStatus.COMPLETED.value:
+            return None
+
+        export_meta_data = (csv_job.meta_data or {}).get(EXPORT_META_DATA_KEY)
+        if not export_meta_data:
+            return None
+
+        artifact = CsvExportArtifact(**export_meta_data)
+        if not os.path.exists(artifact.path):
+            logger.error(f"export artifact {artifact.path} of csv job {csv_job.id} is missing")
+            return None
+
+        return artifact
+
+    @classmethod
+    def iter_decompressed(cls, artifact: CsvExportArtifact) -> Iterator[bytes]:
+        """
+        for clients that do not accept gzip, the artifact is inflated on the fly
+        """
+        with gzip.open(artifact.path, "rb") as gzip_file:
+            for chunk in iter(lambda: gzip_file.read(READ_CHUNK_SIZE), b""):
+                yield chunk
@@ -0,0 +1,138 @@
+import os
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass
+from operator import itemgetter
+from typing import Any, Callable, Deque, Iterable, List, Optional, Tuple
+from app.image_processing.image_backend import ImageProcessingError
+from app.image_processing.image_processor import get_image_processor
+from app.metrics import ingestion_rows, ingestion_stage_seconds
+from app.services.csv_error_report_service import CsvErrorReportService
+from app.services.csv_job_service import CsvJobFailed
+from app.services.csv_row_validator import CsvHeaderMapping, CsvRowError
+
+
+@dataclass
+class ImageBatch:
+    """
+    a batch of products whose images are processed before it is written, see
+    CsvIngestionService.write_image_batches
+    """
+
+    products: List[Any]
+    # the data row number of every product
+    row_numbers: List[int]
+    failed_rows: List[Tuple[int, CsvRowError]]
+    # rows of the batch that are processed without being written
+    unchanged_count: int = 0
+
+
+class CsvIngestionService:
+    """
+    settings, row errors and the image pipeline shared by the ingestion of plain files and of
+    delta uploads
+    """
+
+    @classmethod
+    def get_header_mapping(cls, header_row: Optional[List[str]]) -> CsvHeaderMapping:
+        """
+        headers are checked on upload, a file stored before that whose header cannot be mapped
+        fails its job at once instead of on every attempt
+        """
+        try:
+            return CsvHeaderMapping.from_header_row(header_row or [])
+        except ValueError as e:
+            raise CsvJobFailed(str(e)) from e
+
+    @classmethod
+    def get_product_insert_batch_size(cls) -> int:
+        return int(os.getenv("PRODUCT_INSERT_BATCH_SIZE", "1000"))
+
+    @classmethod
+    def get_max_image_batches_in_flight(cls) -> int:
+        return int(os.getenv("IMAGE_MAX_BATCHES_IN_FLIGHT", "4"))
+
+    @classmethod
+    def build_duplicate_row_error(cls, s_no: str, csv_row: List[str]) -> CsvRowError:
+        return CsvRowError(
+            field="s_no", message=f"duplicate s_no {s_no}, an earlier row has it", csv_row=csv_row
+        )
+
+    @classmethod
+    def build_image_row_error(cls, error: ImageProcessingError, csv_row: List[str]) -> CsvRowError:
+        return CsvRowError(field="input_image_urls", message=str(error), csv_row=csv_row)
+
+    @classmethod
+    def write_image_batches(
+        cls,
+        image_batches: Iterable[ImageBatch],
+        write_batch: Callable[[ImageBatch, List[Any]], None],
+        csv_file_id: str,
+        get_field: Callable[[Any, str], Any] = getattr,
+        set_field: Callable[[Any, str, Any], None] = setattr,
+    ) -> None:
+        """
+        sends the images of every batch to the image processor and writes each batch as soon as
+        its images are done, while the next batches are still being read, at most
+        IMAGE_MAX_BATCHES_IN_FLIGHT batches at a time. batches are written in the order they came in
+        a product one of whose images failed joins the failed rows of its batch, write_batch gets
+        the batch and the products to write, once it returns the failed rows are added to the
+        file's error report
+        :param get_field: reads a field of a product, set_field sets its output image urls,
+        getattr and setattr for objects, operator.getitem and setitem for dicts
+        """
+        image_processor = get_image_processor()
+        max_batches_in_flight = cls.get_max_image_batches_in_flight()
+        in_flight: Deque[Tuple[ImageBatch, Future]] = deque()
+
+        def write_oldest_batch() -> None:
+            image_batch, output_urls_future = in_flight.popleft()
+            with ingestion_stage_seconds.time(stage="image_wait"):
+                output_urls = output_urls_future.result()
+            processed_products: List[Any] = []
+            for product, row_number, output_image_urls in zip(
+                image_batch.products, image_batch.row_numbers, output_urls
+            ):
+                if isinstance(output_image_urls, ImageProcessingError):
+                    image_batch.failed_rows.append(
+                        (
+                            row_number,
+                            cls.build_image_row_error(
+                                error=output_image_urls,
+                                csv_row=[
+                                    get_field(product, "s_no"),
+                                    get_field(product, "product_name"),
+                                    *get_field(product, "input_image_urls"),
+                                ],
+                            ),
+                        )
+                    )
+                else:
+                    set_field(product, "output_image_urls", output_image_urls)
+                    processed_products.append(product)
+            if len(processed_products) < len(image_batch.products):
+                image_batch.failed_rows.sort(key=itemgetter(0))
+
+            with ingestion_stage_seconds.time(stage="insert"):
+                write_batch(image_batch, processed_products)
+            ingestion_rows.inc(len(processed_products), outcome="processed")
+            if image_batch.unchanged_count:
+                ingestion_rows.inc(image_batch.unchanged_count, outcome="unchanged")
+
+            if image_batch.failed_rows:
+                ingestion_rows.inc(len(image_batch.failed_rows), outcome="failed")
+                CsvErrorReportService.append(
+                    csv_file_id=csv_file_id, failed_rows=image_batch.failed_rows
+                )
+
+        for image_batch in image_batches:
+            output_urls_future = image_processor.submit_batch(
+                [get_field(product, "input_image_urls") for product in image_batch.products]
+            )
+            in_flight.append((image_batch, output_urls_future))
+
+            while len(in_flight) >= max_batches_in_flight or (in_flight and in_flight[0][1].done()):
+                write_oldest_batch()
+
+        while in_flight:
+            write_oldest_batch()
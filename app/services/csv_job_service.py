@@ -0,0 +1,334 @@
+import cProfile
+import io
+import multiprocessing
+import os
+import pstats
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Type
+
+from app.database.models.csv_job_model import CsvJobModel, CsvJobStatus
+from app.database.repository.csv_job_repository import CsvJobRepository
+from app.logger import logger
+from app.metrics import csv_jobs, ingestion_stage_seconds, register_gauge
+from app.services.csv_shard_service import CsvShardService
+
+
+class CsvJobProgress:
+    """
+    handed to the job handler so it can report progress, every report also renews the lease
+    """
+
+    def __init__(self, job_id: str, lease_owner: str, lease_seconds: int):
+        self.job_id = job_id
+        self.lease_owner = lease_owner
+        self.lease_seconds = lease_seconds
+
+    def _record(self, processed_rows: int, failed_rows: int, in_flight_rows: int) -> None:
+        if not CsvJobRepository.record_progress(
+            job_id=self.job_id,
+            lease_owner=self.lease_owner,
+            lease_seconds=self.lease_seconds,
+            processed_rows=processed_rows,
+            failed_rows=failed_rows,
+            in_flight_rows=in_flight_rows,
+        ):
+            raise RuntimeError(f"lease on csv job {self.job_id} was lost by {self.lease_owner}")
+
+    def rows_started(self, row_count: int) -> None:
+        self._record(processed_rows=0, failed_rows=0, in_flight_rows=row_count)
+
+    def rows_finished(self, processed_row_count: int, failed_row_count: int = 0) -> None:
+        self._record(
+            processed_rows=processed_row_count,
+            failed_rows=failed_row_count,
+            in_flight_rows=-(processed_row_count + failed_row_count),
+        )
+
+    def commit_rows(
+        self,
+        model: Type[Any],
+        rows: List[Dict[str, Any]],
+        processed_row_count: int,
+        failed_row_count: int = 0,
+        update_columns: Optional[List[str]] = None,
+    ) -> None:
+        """
+        writes the rows of the next batch and checkpoints the job after it, see
+        CsvJobRepository.commit_batch, a worker that lost its lease writes nothing
+        """
+        if not CsvJobRepository.commit_batch(
+            job_id=self.job_id,
+            lease_owner=self.lease_owner,
+            lease_seconds=self.lease_seconds,
+            model=model,
+            rows=rows,
+            processed_rows=processed_row_count,
+            failed_rows=failed_row_count,
+            update_columns=update_columns,
+        ):
+            raise RuntimeError(f"lease on csv job {self.job_id} was lost by {self.lease_owner}")
+
+
+JobHandler = Callable[[CsvJobModel, CsvJobProgress], None]
+
+
+class CsvJobDeferred(Exception):
+    """
+    raised by a job handler that cannot run its job yet, e.g. while another job holds what it
+    needs, the job goes back to PENDING without using up an attempt and is claimed again later
+    """
+
+
+class CsvJobFailed(Exception):
+    """
+    raised by a job handler for a job that would fail the same way on every attempt, e.g. a file
+    whose header cannot be read, the job is FAILED at once with the message as its error
+    """
+
+
+# a job whose METADATA has this key set is run under cProfile
+PROFILE_META_DATA_KEY = "profile"
+
+
+class CsvJobService:
+    @classmethod
+    def get_lease_seconds(cls) -> int:
+        return int(os.getenv("CSV_JOB_LEASE_SECONDS", "300"))
+
+    @classmethod
+    def get_max_attempts(cls) -> int:
+        return int(os.getenv("CSV_JOB_MAX_ATTEMPTS", "3"))
+
+    @classmethod
+    def process_next_job(cls, worker_id: str, job_handler: JobHandler) -> bool:
+        """
+        claims one job and runs it, returns False when there was nothing to claim
+        a job the handler defers is handed back and the next claimable job is tried instead
+        """
+        lease_seconds = cls.get_lease_seconds()
+        deferred_job_ids: List[str] = []
+        while True:
+            csv_job: Optional[CsvJobModel] = CsvJobRepository.claim_next_job(
+                lease_owner=worker_id,
+                lease_seconds=lease_seconds,
+                max_attempts=cls.get_max_attempts(),
+                skip_job_ids=deferred_job_ids,
+            )
+            if csv_job is None:
+                return False
+
+            progress = CsvJobProgress(
+                job_id=csv_job.id, lease_owner=worker_id, lease_seconds=lease_seconds
+            )
+            try:
+                with ingestion_stage_seconds.time(stage="job"):
+                    cls.run_job_handler(csv_job=csv_job, progress=progress, job_handler=job_handler)
+            except CsvJobDeferred as e:
+                logger.info(f"csv job {csv_job.id} deferred, {e}")
+                CsvJobRepository.defer_job(csv_job=csv_job, lease_owner=worker_id)
+                deferred_job_ids.append(csv_job.id)
+                continue
+            except CsvJobFailed as e:
+                csv_jobs.inc(outcome="failed")
+                logger.error(f"csv job {csv_job.id} failed without a retry, {e}")
+                CsvJobRepository.finish_job(
+                    job_id=csv_job.id,
+                    lease_owner=worker_id,
+                    status=CsvJobStatus.FAILED,
+                    error=str(e),
+                )
+                return True
+            except Exception as e:
+                csv_jobs.inc(outcome="failed_attempt")
+                logger.error(
+                    f"csv job {csv_job.id} failed on attempt {csv_job.attempts}", exc_info=True
+                )
+                # back to PENDING so the job is retried, claim_next_job fails it once attempts
+                # run out
+                CsvJobRepository.finish_job(
+                    job_id=csv_job.id,
+                    lease_owner=worker_id,
+                    status=CsvJobStatus.PENDING,
+                    error=str(e),
+                )
+                return True
+
+            CsvJobRepository.finish_job(
+                job_id=csv_job.id, lease_owner=worker_id, status=CsvJobStatus.COMPLETED
+            )
+            csv_jobs.inc(outcome="completed")
+            return True
+
+    @classmethod
+    def get_profile_directory(cls) -> str:
+        project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        return os.getenv("CSV_JOB_PROFILE_PATH", os.path.join(project_root, "profiles"))
+
+    @classmethod
+    def run_job_handler(
+        cls, csv_job: CsvJobModel, progress: CsvJobProgress, job_handler: JobHandler
+    ) -> None:
+        """
+        runs the handler under cProfile when the job was queued with profiling switched on
+        the stats are dumped to <profile directory>/<job id>.pstats, e.g. for snakeviz, and the
+        slowest calls are logged. only the worker's thread is profiled, not the image loop
+        """
+        if not (csv_job.meta_data or {}).get(PROFILE_META_DATA_KEY):
+            job_handler(csv_job, progress)
+            return
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.runcall(job_handler, csv_job, progress)
+        finally:
+            os.makedirs(cls.get_profile_directory(), exist_ok=True)
+            profile_path = os.path.join(cls.get_profile_directory(), f"{csv_job.id}.pstats")
+            profiler.dump_stats(profile_path)
+
+            summary = io.StringIO()
+            pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(20)
+            logger.info(
+                f"profile of csv job {csv_job.id} written to {profile_path}\n{summary.getvalue()}"
+            )
+
+
+def run_worker_loop(
+    worker_id: str,
+    job_handler: JobHandler,
+    stop_event: Any,
+    wake_event: Any,
+    poll_interval_seconds: float,
+) -> None:
+    """
+    runs until stop_event is set, a job that is in progress is always finished first
+    this is a module level function so that process workers can pickle it
+    """
+    try:
+        while not stop_event.is_set():
+            try:
+                if CsvJobService.process_next_job(worker_id=worker_id, job_handler=job_handler):
+                    continue
+            except Exception:
+                logger.error(f"csv worker {worker_id} could not claim a job", exc_info=True)
+
+            wake_event.wait(poll_interval_seconds)
+            wake_event.clear()
+    finally:
+        CsvShardService.shutdown_parse_pool()
+
+
+class CsvJobWorkerPool:
+    """
+    fixed size pool of thread or process workers pulling jobs from the CSV_JOBS table
+    workers only coordinate through the table, so several pools (or app processes) can share it
+    """
+
+    def __init__(
+        self,
+        pool_size: int,
+        pool_kind: str = "thread",
+        poll_interval_seconds: float = 2.0,
+        shutdown_timeout_seconds: float = 30.0,
+    ):
+        if pool_kind not in ("thread", "process"):
+            raise ValueError(f"unknown csv worker pool kind = {pool_kind}")
+
+        self.pool_size = pool_size
+        self.pool_kind = pool_kind
+        self.poll_interval_seconds = poll_interval_seconds
+        self.shutdown_timeout_seconds = shutdown_timeout_seconds
+
+        if pool_kind == "process":
+            self._context: Any = multiprocessing.get_context("spawn")
+        else:
+            self._context = threading
+
+        self._stop_event = self._context.Event()
+        self._wake_event = self._context.Event()
+        self._workers: List[Any] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls) -> "CsvJobWorkerPool":
+        return cls(
+            pool_size=int(os.getenv("CSV_WORKER_POOL_SIZE", "4")),
+            pool_kind=os.getenv("CSV_WORKER_POOL_KIND", "thread"),
+            poll_interval_seconds=float(os.getenv("CSV_JOB_POLL_INTERVAL_SECONDS", "2")),
+            shutdown_timeout_seconds=float(os.getenv("CSV_WORKER_SHUTDOWN_TIMEOUT_SECONDS", "30")),
+        )
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self._workers)
+
+    def start(self, job_handler: JobHandler) -> None:
+        # spawned child processes re-import the app's main module, they must not start pools
+        if multiprocessing.current_process().name != "MainProcess":
+            return
+
+        with self._lock:
+            if self._workers:
+                return
+
+            self._stop_event.clear()
+            for index in range(self.pool_size):
+                worker_id = f"{socket.gethostname()}:{os.getpid()}:{self.pool_kind}-{index}"
+                worker_kwargs = {
+                    "worker_id": worker_id,
+                    "job_handler": job_handler,
+                    "stop_event": self._stop_event,
+                    "wake_event": self._wake_event,
+                    "poll_interval_seconds": self.poll_interval_seconds,
+                }
+                if self.pool_kind == "process":
+                    # not a daemon, so that the worker may fan out to its own parse processes
+                    worker = self._context.Process(
+                        target=run_worker_loop, kwargs=worker_kwargs, name=worker_id
+                    )
+                else:
+                    worker = threading.Thread(
+                        target=run_worker_loop, kwargs=worker_kwargs, name=worker_id, daemon=True
+                    )
+                worker.start()
+                self._workers.append(worker)
+
+            logger.info(f"started {self.pool_size} csv {self.pool_kind} workers")
+
+    def notify(self) -> None:
+        """
+        wakes idle workers so a freshly queued job does not wait for the next poll
+        """
+        self._wake_event.set()
+
+    def shutdown(self, timeout_seconds: Optional[float] = None) -> None:
+        """
+        stops claiming new jobs and waits for jobs in progress to finish
+        jobs still running after the timeout keep their lease and are recovered once it expires
+        """
+        with self._lock:
+            if not self._workers:
+                return
+
+            timeout = self.shutdown_timeout_seconds if timeout_seconds is None else timeout_seconds
+            self._stop_event.set()
+            self._wake_event.set()
+            deadline = time.monotonic() + timeout
+            for worker in self._workers:
+                worker.join(max(deadline - time.monotonic(), 0))
+                if worker.is_alive():
+                    logger.error(f"csv worker {worker.name} did not stop within {timeout} seconds")
+            self._workers = []
+
+
+csv_job_worker_pool = CsvJobWorkerPool.from_environment()
+
+register_gauge(
+    "csv_jobs_by_status",
+    "csv jobs in the CSV_JOBS table per status, PENDING is the queue depth",
+    read_values=lambda: {
+        (status,): count for status, count in CsvJobRepository.count_jobs_by_status().items()
+    },
+    label_names=("status",),
+)
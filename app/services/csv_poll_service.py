@@ -0,0 +1,48 @@
+from datetime import datetime
+from typing import List, Optional
+from app.database import query_manager
+from app.database.models.csv_job_model import CsvJobModel
+from app.database.query_models.csv_query_model import CsvPollingResponse
+
+
+class CsvPollService:
+    @classmethod
+    def get_csv_file_upload_status(cls, csv_file_id: str) -> CsvPollingResponse:
+        """
+        a single unique key lookup of the job's progress counters, nothing is counted here
+        it is served by the read engine, so polling never waits behind ingestion
+        """
+        csv_jobs: List[CsvJobModel] = query_manager.query_with_filter(
+            model=CsvJobModel,
+            filters=CsvJobModel.csv_file_id == csv_file_id,
+            read_only=True,
+        )
+        if not csv_jobs:
+            raise ValueError(f"No CsvJobModel found for csv file id = {csv_file_id}")
+        csv_job = csv_jobs[0]
+
+        rows_per_second: Optional[float] = None
+        eta_seconds: Optional[float] = None
+        if csv_job.started_at is not None:
+            elapsed_seconds = (
+                (csv_job.finished_at or datetime.now()) - csv_job.started_at
+            ).total_seconds()
+            if elapsed_seconds > 0:
+                rows_per_second = round(csv_job.processed_rows / elapsed_seconds, 2)
+            remaining_rows = max(
+                csv_job.total_rows - csv_job.processed_rows - csv_job.failed_rows, 0
+            )
+            if remaining_rows == 0:
+                eta_seconds = 0.0
+            elif rows_per_second:
+                eta_seconds = round(remaining_rows / rows_per_second, 2)
+
+        return CsvPollingResponse(
+            count_rows=csv_job.total_rows,
+            count_rows_inserted=csv_job.processed_rows,
+            count_rows_failed=csv_job.failed_rows,
+            count_rows_in_flight=csv_job.in_flight_rows,
+            status=csv_job.status,
+            rows_per_second=rows_per_second,
+            eta_seconds=eta_seconds,
+        )
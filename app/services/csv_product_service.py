@@ -0,0 +1,97 @@
+import base64
+import json
+import os
+from typing import Any, List, Optional
+from sqlalchemy import and_
+from app.database import query_manager
+from app.database.models.catalog_product_model import CatalogProductModel
+from app.database.models.product import ProductModel
+from app.database.query_models.product_query_model import ProductsPageResponse
+from app.services.csv_delta_upload_service import CsvDeltaUploadService
+
+
+class CsvProductService:
+    # fields of the products api and the columns they are read from
+    product_fields = {
+        "s_no": ProductModel.s_no,
+        "product_name": ProductModel.product_name,
+        "input_image_urls": ProductModel.input_image_urls,
+        "output_image_urls": ProductModel.output_image_urls,
+    }
+    catalog_product_fields = {
+        "s_no": CatalogProductModel.s_no,
+        "product_name": CatalogProductModel.product_name,
+        "input_image_urls": CatalogProductModel.input_image_urls,
+        "output_image_urls": CatalogProductModel.output_image_urls,
+    }
+
+    @classmethod
+    def get_max_page_size(cls) -> int:
+        return int(os.getenv("PRODUCTS_MAX_PAGE_SIZE", "1000"))
+
+    @classmethod
+    def encode_cursor(cls, s_no: str) -> str:
+        return base64.urlsafe_b64encode(json.dumps([s_no]).encode("utf-8")).decode("ascii")
+
+    @classmethod
+    def decode_cursor(cls, cursor: str) -> str:
+        try:
+            (s_no,) = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        except Exception:
+            raise ValueError(f"invalid cursor = {cursor}")
+        return str(s_no)
+
+    @classmethod
+    def get_products_page(
+        cls,
+        csv_file_id: str,
+        limit: int,
+        cursor: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+    ) -> ProductsPageResponse:
+        """
+        one page of the file's products ordered by s_no, only the requested fields are read
+        the cursor holds the last s_no of the previous page and the page seeks past it on the
+        (csv_file_id, s_no) index, so every page costs the same however deep it is
+        the products of a delta upload are the ones its supplier's catalogue has now
+        """
+        if not 0 < limit <= cls.get_max_page_size():
+            raise ValueError(f"limit must be between 1 and {cls.get_max_page_size()}")
+
+        fields = fields or list(cls.product_fields)
+        unknown_fields = [field for field in fields if field not in cls.product_fields]
+        if unknown_fields:
+            raise ValueError(f"unknown product fields = {unknown_fields}")
+
+        supplier_id = CsvDeltaUploadService.get_supplier_id_of_csv_file(csv_file_id=csv_file_id)
+        if supplier_id:
+            # a delta upload lists its supplier's catalogue, on the (supplier_id, s_no) index
+            filters: Any = and_(
+                CatalogProductModel.supplier_id == supplier_id,
+                CatalogProductModel.is_deleted.is_(False),
+            )
+            product_columns = [cls.catalog_product_fields[field] for field in fields]
+            s_no_column: Any = CatalogProductModel.s_no
+        else:
+            filters = ProductModel.csv_file_id == csv_file_id
+            product_columns = [cls.product_fields[field] for field in fields]
+            s_no_column = ProductModel.s_no
+
+        # csv_file_id, or supplier_id, is pinned by the filter, so seeking on s_no walks its index
+        product_rows = query_manager.query_columns_by_keyset(
+            filters=filters,
+            columns=product_columns + [s_no_column],
+            key_columns=[s_no_column],
+            after_key=(cls.decode_cursor(cursor),) if cursor else None,
+            limit=limit,
+            read_only=True,
+        )
+
+        next_cursor: Optional[str] = None
+        if len(product_rows) == limit:
+            next_cursor = cls.encode_cursor(product_rows[-1][-1])
+
+        return ProductsPageResponse(
+            products=[dict(zip(fields, product_row)) for product_row in product_rows],
+            next_cursor=next_cursor,
+        )
@@ -0,0 +1,212 @@
+import re
+from dataclasses import dataclass
+from itertools import chain
+from operator import itemgetter, methodcaller
+from typing import Dict, List, Optional, Union
+
+PRODUCT_FIELD_MAX_LENGTH = 255
+
+# bare hosts like amon.com are accepted, the scheme is optional
+URL_PATTERN = r"(?:https?://)?[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)+(?::[0-9]+)?(?:[/?#]\S*)?"
+url_regex = re.compile(URL_PATTERN)
+# the urls of a whole batch are joined by newlines, which no url can contain, and matched at once
+url_lines_regex = re.compile(rf"(?:{URL_PATTERN}\n)*{URL_PATTERN}")
+# found in the image cells of a batch joined by newlines, these mean blanks or empty urls
+BLANK_OR_EMPTY_URL_MARKERS = (" ", "\t", "\r", ",,", "\n,", ",\n")
+
+# header names are compared lowercased with everything but letters and digits removed
+HEADER_ALIASES = {
+    "s_no": ("sno", "slno", "serialno", "serialnumber"),
+    "product_name": ("productname", "name"),
+    "input_image_urls": ("inputimageurls", "inputimageurl", "imageurls", "imageurl", "images"),
+}
+
+
+@dataclass
+class CsvRowError:
+    field: str
+    message: str
+    csv_row: List[str]
+
+
+@dataclass(frozen=True)
+class CsvHeaderMapping:
+    """
+    positions of the product fields in the csv, the image urls run from image_urls_start up to
+    the next mapped column, or to the end of the row
+    """
+
+    s_no_index: int = 0
+    product_name_index: int = 1
+    image_urls_start: int = 2
+    image_urls_end: Optional[int] = None
+
+    @classmethod
+    def from_header_row(cls, header_row: List[str]) -> "CsvHeaderMapping":
+        normalised_names = [re.sub(r"[^a-z0-9]", "", name.lower()) for name in header_row]
+        indexes: Dict[str, int] = {}
+        for field, aliases in HEADER_ALIASES.items():
+            for index, name in enumerate(normalised_names):
+                if name in aliases:
+                    indexes[field] = index
+                    break
+
+        if not indexes:
+            # no header names we know, the columns are taken in the order of the sample csv
+            return cls()
+
+        missing_fields = [field for field in HEADER_ALIASES if field not in indexes]
+        if missing_fields:
+            raise ValueError(f"csv header {header_row} has no column for {missing_fields}")
+
+        image_urls_start = indexes["input_image_urls"]
+        later_indexes = [index for index in indexes.values() if index > image_urls_start]
+        return cls(
+            s_no_index=indexes["s_no"],
+            product_name_index=indexes["product_name"],
+            image_urls_start=image_urls_start,
+            image_urls_end=min(later_indexes) if later_indexes else None,
+        )
+
+
+class CsvRowValidator:
+    """
+    checks and normalises the rows of a csv a batch at a time, so that one malformed row is
+    reported instead of failing its job
+    every check first runs over a whole column with builtins that loop in C, like max(map(len))
+    or a single regex match over the joined urls, and only looks at the single rows of a column
+    that failed. a batch without errors costs a few passes over its columns
+    duplicate s_no depend on earlier batches and are left to the caller
+    """
+
+    def __init__(
+        self, header_mapping: CsvHeaderMapping, max_length: int = PRODUCT_FIELD_MAX_LENGTH
+    ):
+        self.header_mapping = header_mapping
+        self.max_length = max_length
+
+    def get_column(self, csv_rows: List[List[str]], index: int, min_width: int) -> List[str]:
+        if min(map(len, csv_rows)) >= min_width:
+            return list(map(str.strip, map(itemgetter(index), csv_rows)))
+        # short rows read as empty and fail the required check
+        return [csv_row[index].strip() if len(csv_row) > index else "" for csv_row in csv_rows]
+
+    def get_image_urls_column(self, csv_rows: List[List[str]]) -> List[List[str]]:
+        """
+        one cell may hold several comma separated urls, like the cells of a download, so the image
+        cells of a row are joined and split on commas. only the rows of a batch with blanks or
+        empty urls in it are stripped url by url
+        """
+        image_cells = map(
+            itemgetter(
+                slice(self.header_mapping.image_urls_start, self.header_mapping.image_urls_end)
+            ),
+            csv_rows,
+        )
+        joined_cells = list(map(",".join, image_cells))
+        batch_cells = "\n".join(joined_cells)
+        if (
+            batch_cells.count("\n") != len(joined_cells) - 1
+            or any(marker in batch_cells for marker in BLANK_OR_EMPTY_URL_MARKERS)
+            or batch_cells.startswith(",")
+            or batch_cells.endswith(",")
+        ):
+            return [
+                [url for url in map(str.strip, row_cells.split(",")) if url]
+                for row_cells in joined_cells
+            ]
+        image_urls = list(map(methodcaller("split", ","), joined_cells))
+        if "" in joined_cells:
+            # rows without any image cell
+            return [row_urls if row_urls != [""] else [] for row_urls in image_urls]
+        return image_urls
+
+    def check_required(
+        self,
+        column: List[str],
+        field: str,
+        csv_rows: List[List[str]],
+        errors: Dict[int, CsvRowError],
+    ) -> None:
+        if "" not in column:
+            return
+        for index, value in enumerate(column):
+            if not value:
+                errors.setdefault(
+                    index, CsvRowError(field, f"{field} is required", csv_rows[index])
+                )
+
+    def check_max_length(
+        self,
+        column: List[str],
+        field: str,
+        csv_rows: List[List[str]],
+        errors: Dict[int, CsvRowError],
+    ) -> None:
+        if max(map(len, column)) <= self.max_length:
+            return
+        for index, value in enumerate(column):
+            if len(value) > self.max_length:
+                errors.setdefault(
+                    index,
+                    CsvRowError(
+                        field,
+                        f"{field} is {len(value)} characters long, at most {self.max_length} fit",
+                        csv_rows[index],
+                    ),
+                )
+
+    def check_urls(
+        self,
+        image_urls: List[List[str]],
+        csv_rows: List[List[str]],
+        errors: Dict[int, CsvRowError],
+    ) -> None:
+        all_urls = "\n".join(chain.from_iterable(image_urls))
+        if not all_urls:
+            return
+        # a newline inside a url would pass as two urls
+        url_count = sum(map(len, image_urls))
+        if all_urls.count("\n") == url_count - 1 and url_lines_regex.fullmatch(all_urls):
+            return
+        for index, row_urls in enumerate(image_urls):
+            invalid_urls = [url for url in row_urls if not url_regex.fullmatch(url)]
+            if invalid_urls:
+                errors.setdefault(
+                    index,
+                    CsvRowError(
+                        "input_image_urls", f"invalid urls {invalid_urls}", csv_rows[index]
+                    ),
+                )
+
+    def validate_batch(self, csv_rows: List[List[str]]) -> List[Union[List[str], CsvRowError]]:
+        """
+        :return: one entry per row, the row normalised to [s_no, product_name, *image urls], or
+        the CsvRowError of the first check it failed
+        """
+        if not csv_rows:
+            return []
+
+        min_width = max(self.header_mapping.s_no_index, self.header_mapping.product_name_index) + 1
+        s_nos = self.get_column(csv_rows, self.header_mapping.s_no_index, min_width)
+        product_names = self.get_column(csv_rows, self.header_mapping.product_name_index, min_width)
+        image_urls = self.get_image_urls_column(csv_rows)
+
+        errors: Dict[int, CsvRowError] = {}
+        self.check_required(s_nos, "s_no", csv_rows, errors)
+        self.check_required(product_names, "product_name", csv_rows, errors)
+        self.check_max_length(s_nos, "s_no", csv_rows, errors)
+        self.check_max_length(product_names, "product_name", csv_rows, errors)
+        self.check_urls(image_urls, csv_rows, errors)
+
+        if not errors:
+            return [
+                [s_no, product_name, *row_urls]
+                for s_no, product_name, row_urls in zip(s_nos, product_names, image_urls)
+            ]
+        return [
+            errors.get(index) or [s_no, product_name, *row_urls]
+            for index, (s_no, product_name, row_urls) in enumerate(
+                zip(s_nos, product_names, image_urls)
+            )
+        ]
@@ -1,167 +1,688 @@
 import csv
-from io import StringIO
-import io
-import time
-from typing import List
+from datetime import datetime
+import os
+from functools import partial
+from itertools import chain, islice
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from sqlalchemy import and_
 from werkzeug.datastructures import FileStorage
-from app.database import query_manager
+from app.database import id_generator, query_manager
+from app.database.models.csv_batch_model import CsvBatchModel
+from app.database.models.csv_job_model import CsvJobModel, CsvJobStatus
 from app.database.models.csv_model import CsvModel
-from app.database.models.product import ProductModel
-from app.database.query_models.csv_query_model import CreateCsvQueryModel, CsvPollingResponse
-from app.database.query_models.product_query_model import CreateProductQueryModel
+from app.database.models.product import ProductInsertRow, ProductModel
+from app.database.query_models.csv_batch_query_model import (
+    CreateCsvBatchQueryModel,
+    CsvBatchFileStatus,
+    CsvBatchPollingResponse,
+)
+from app.database.query_models.csv_query_model import CreateCsvQueryModel
+from app.database.repository.csv_job_repository import CsvJobRepository
 from app.database.repository.object_repository import ObjectRepository
-import threading
+from app.image_processing.image_processor import get_image_processor
+from app.logger import logger
+from app.metrics import ingestion_stage_seconds, iter_timed
+from app.services.csv_archive_reader import ARCHIVE_READ_ERRORS, CsvArchiveReader
+from app.services.csv_delta_upload_service import CsvDeltaUploadService
+from app.services.csv_download_service import CsvDownloadService
+from app.services.csv_error_report_service import CsvErrorReportService
+from app.services.csv_export_service import CsvExportArtifactService
+from app.services.csv_ingestion_service import CsvIngestionService, ImageBatch
+from app.services.csv_job_service import PROFILE_META_DATA_KEY, CsvJobProgress, csv_job_worker_pool
+from app.services.csv_row_validator import CsvHeaderMapping, CsvRowError, CsvRowValidator
+from app.services.csv_shard_service import CsvShardService
+from app.services.csv_stream_reader import CsvStreamReader, CsvUploadStream
+from app.storage.blob_store import BlobInfo, get_blob_store
 
 
 class CsvService:
     @classmethod
-    def handle_csv(cls, csv_file: FileStorage) -> CsvModel:
+    def handle_csv(
+        cls, csv_file: FileStorage, profile: bool = False, supplier_id: Optional[str] = None
+    ) -> CsvModel:
         """
         As we get the csv_file from the api
-        we quickly store the file as a blob in db and return the id of the row
-        Asynchronously we create a new thread to process the csv file and once
-        the file is processed we mark the column is_processed as true
+        we quickly store the file in the blob store, queue a job for it and return the id of the row
+        the id is derived from the content, so uploading a file again returns the existing row and
+        job instead of processing the file twice
+        The job is picked up by the csv worker pool which processes the csv file and once
+        the file is processed marks the column is_processed as true
+        with profile=True the job is run under cProfile, see CsvJobService.run_job_handler
+        with a supplier_id the file is a delta upload to the supplier's catalogue, see
+        CsvDeltaUploadService, a file uploaded again is applied again, the catalogue may have
+        changed since
         """
-        inserted_csv: CsvModel = cls.insert_csv_to_db(csv_file=csv_file)
-        thread = threading.Thread(target=CsvUploadService.process_csv_files, args=(inserted_csv,))
-        thread.start()
+        supplier_id = CsvDeltaUploadService.normalise_supplier_id(supplier_id=supplier_id)
+        # the csv row and its job are committed together, a worker never sees one without the other
+        with query_manager.unit_of_work():
+            inserted_csv: CsvModel = cls.insert_csv_to_db(
+                csv_file=csv_file, supplier_id=supplier_id
+            )
+            CsvJobRepository.enqueue_csv_file(
+                csv_file_id=inserted_csv.id,
+                total_rows=inserted_csv.row_count,
+                meta_data={PROFILE_META_DATA_KEY: True} if profile else None,
+                requeue_completed=supplier_id is not None,
+            )
+        csv_job_worker_pool.notify()
         return inserted_csv
 
     @classmethod
-    def insert_csv_to_db(cls, csv_file: FileStorage) -> CsvModel:
+    def insert_csv_to_db(cls, csv_file: FileStorage, supplier_id: Optional[str] = None) -> CsvModel:
         """
-        this function takes in csv_file and reads the content and inserts it in db
+        this function takes in csv_file, commits its content to the blob store and inserts a row
+        pointing at the blob in db
         """
-        csv_file_content = csv_file.read()
-        create_csv_request_model: CreateCsvQueryModel = CreateCsvQueryModel(
-            csv_file=csv_file_content
+        blob_info, row_count = cls.store_csv_upload(csv_file=csv_file)
+        return cls.insert_csv_blob(
+            blob_info=blob_info, row_count=row_count, supplier_id=supplier_id
         )
-        csv_file_model: CsvModel = CsvModel(create_csv_request_model=create_csv_request_model)
-        return ObjectRepository.insert_single_object(object_to_be_inserted=csv_file_model)
 
+    @classmethod
+    def store_csv_upload(
+        cls, csv_file: FileStorage, max_bytes: Optional[int] = None
+    ) -> Tuple[BlobInfo, int]:
+        """
+        commits the content of csv_file to the blob store
+        uploads parsed by StreamedUploadRequest are already in the blob store's temporary
+        directory, hashed and counted, any other stream is copied there chunk by chunk first
+        :param max_bytes: a copied stream that grows past it raises ValueError
+        :return: the blob and the number of data rows of the csv
+        a csv whose header cannot be mapped raises ValueError, see check_csv_header, and is not
+        committed
+        """
+        is_streamed_upload = isinstance(csv_file.stream, CsvUploadStream)
+        upload_stream = (
+            csv_file.stream if is_streamed_upload else CsvUploadStream(blob_store=get_blob_store())
+        )
+        try:
+            if not is_streamed_upload:
+                for chunk in iter(
+                    lambda: csv_file.stream.read(upload_stream.blob_store.chunk_size), b""
+                ):
+                    upload_stream.write(chunk)
+                    if max_bytes is not None and upload_stream.size_bytes > max_bytes:
+                        raise ValueError(f"{csv_file.filename} is larger than {max_bytes} bytes")
+            cls.check_csv_header(upload_stream=upload_stream, file_name=csv_file.filename)
+            blob_info: BlobInfo = upload_stream.commit()
+        finally:
+            upload_stream.close()
+        return blob_info, upload_stream.data_row_count
+
+    @classmethod
+    def check_csv_header(cls, upload_stream: CsvUploadStream, file_name: Optional[str]) -> None:
+        """
+        reads the header row back from the upload and raises ValueError when it names some of
+        the product fields but not all of them, see CsvHeaderMapping.from_header_row
+        """
+        upload_stream.seek(0)
+        header_row = next(CsvStreamReader.iter_rows_from_stream(binary_stream=upload_stream), None)
+        try:
+            CsvHeaderMapping.from_header_row(header_row or [])
+        except ValueError as e:
+            raise ValueError(f"{file_name or 'csv'}: {e}")
 
-class CsvUploadService:
     @classmethod
-    def process_csv_files(cls, csv_model: CsvModel):
+    def insert_csv_blob(
+        cls, blob_info: BlobInfo, row_count: int, supplier_id: Optional[str] = None
+    ) -> CsvModel:
         """
-        we pull up all unprocessed files and start inserting data from them
+        inserts the row of a csv in the blob store, or returns the existing row of the same content,
+        and the same supplier
+        the existing row is found by its blob key and not by its id, rows moved out of the
+        csv_file column keep the ids they had before ids were computed from the blob key
         """
-        unprocessed_csv_files: List[CsvModel] = query_manager.query_with_filter(
-            model=CsvModel, filters=(CsvModel.is_processed.is_(False))
+        existing_csv_files: List[CsvModel] = query_manager.query_with_filter(
+            model=CsvModel,
+            filters=and_(CsvModel.blob_key == blob_info.key, CsvModel.supplier_id == supplier_id),
+            limit=1,
+        )
+        if existing_csv_files:
+            logger.info(f"csv file {existing_csv_files[0].id} was already uploaded")
+            return existing_csv_files[0]
+
+        create_csv_request_model: CreateCsvQueryModel = CreateCsvQueryModel(
+            blob_key=blob_info.key,
+            size_bytes=blob_info.size_bytes,
+            row_count=row_count,
+            supplier_id=supplier_id,
         )
-        for csv_record in unprocessed_csv_files:
-            csv_data: List[List[str]] = cls.get_csv_data_from_csv_model(csv_model=csv_record)
-            cls.create_products_from_csv(csv_data=csv_data, csv_file_id=csv_model.id)
+        csv_file_model: CsvModel = CsvModel(create_csv_request_model=create_csv_request_model)
+        if query_manager.count_with_filter(
+            model=CsvModel, filters=CsvModel.id == csv_file_model.id
+        ):
+            # the short id is taken by another file, this one is stored under its long id
+            logger.warning(f"csv file id {csv_file_model.id} collides, using the long id")
+            csv_file_model.id = csv_file_model.compute_and_get_long_id()
+
+        return ObjectRepository.insert_single_object(object_to_be_inserted=csv_file_model)
 
-            # once all the products are inserted into the db we update in csv model the row as is_processed=True
-            csv_model.is_processed = True
-            ObjectRepository.update_single_object(object_to_be_updated=csv_model)
 
+class CsvBatchService:
     @classmethod
-    def create_products_from_csv(cls, csv_data: List[List[str]], csv_file_id: str) -> None:
+    def get_max_batch_files(cls) -> int:
+        return int(os.getenv("CSV_BATCH_MAX_FILES", "1000"))
+
+    @classmethod
+    def get_max_archive_bytes(cls) -> int:
+        # decompressed bytes of all the files of an archive, a small archive may inflate a lot
+        return int(os.getenv("CSV_ARCHIVE_MAX_BYTES", str(10 * 1024 * 1024 * 1024)))
+
+    @classmethod
+    def handle_batch(
+        cls,
+        csv_files: List[FileStorage],
+        archive: Optional[FileStorage] = None,
+        profile: bool = False,
+    ) -> CsvBatchModel:
         """
-        this function takes in list of all rows in csv and creates product out of it
+        the csv parts of a request and the csv files of an archive are stored in the blob store
+        one after the other, archives are decompressed while they are read, see CsvArchiveReader
+        then the csv rows, the jobs of all the files and the batch are committed in one
+        transaction and the worker pool is woken once, its workers ingest the files in parallel
+        like every file, a file that was uploaded before keeps its row and job
         """
-        for row in csv_data[1:]:
-            cls.create_single_product(
-                csv_row=row,
-                csv_file_id=csv_file_id,
+        stored_files: List[Tuple[str, BlobInfo, int]] = []
+
+        def add_stored_file(csv_file: FileStorage, max_bytes: Optional[int] = None) -> BlobInfo:
+            if len(stored_files) >= cls.get_max_batch_files():
+                raise ValueError(f"a batch holds at most {cls.get_max_batch_files()} files")
+            blob_info, row_count = CsvService.store_csv_upload(
+                csv_file=csv_file, max_bytes=max_bytes
             )
-            time.sleep(10)
+            stored_files.append((csv_file.filename or blob_info.key, blob_info, row_count))
+            return blob_info
+
+        for csv_file in csv_files:
+            add_stored_file(csv_file)
+
+        if archive is not None:
+            remaining_bytes = cls.get_max_archive_bytes()
+            try:
+                for member_name, member_stream in CsvArchiveReader.iter_csv_members(
+                    archive_stream=archive.stream, archive_name=archive.filename
+                ):
+                    blob_info = add_stored_file(
+                        FileStorage(stream=member_stream, filename=member_name),
+                        max_bytes=remaining_bytes,
+                    )
+                    remaining_bytes -= blob_info.size_bytes
+            except ARCHIVE_READ_ERRORS as e:
+                raise ValueError(f"{archive.filename} could not be read, {e}")
+            finally:
+                # the archive itself is never committed to the blob store
+                archive.stream.close()
+
+        if not stored_files:
+            raise ValueError("the upload holds no csv files")
+
+        with query_manager.unit_of_work():
+            batch_files: List[Dict[str, str]] = []
+            for file_name, blob_info, row_count in stored_files:
+                inserted_csv = CsvService.insert_csv_blob(blob_info=blob_info, row_count=row_count)
+                CsvJobRepository.enqueue_csv_file(
+                    csv_file_id=inserted_csv.id,
+                    total_rows=inserted_csv.row_count,
+                    meta_data={PROFILE_META_DATA_KEY: True} if profile else None,
+                )
+                batch_files.append({"file_name": file_name, "csv_file_id": inserted_csv.id})
+
+            csv_batch = CsvBatchModel(
+                create_csv_batch_request_model=CreateCsvBatchQueryModel(csv_files=batch_files)
+            )
+            existing_batches: List[CsvBatchModel] = query_manager.query_with_filter(
+                model=CsvBatchModel, filters=CsvBatchModel.id == csv_batch.id, limit=1
+            )
+            if existing_batches and existing_batches[0].csv_files != batch_files:
+                # the short id is taken by another batch
+                csv_batch.id = csv_batch.compute_and_get_long_id()
+            ObjectRepository.insert_single_object(object_to_be_inserted=csv_batch)
+        csv_job_worker_pool.notify()
+        return csv_batch
 
     @classmethod
-    def create_single_product(cls, csv_row: List[str], csv_file_id: str) -> ProductModel:
+    def get_batch_upload_status(cls, batch_id: str) -> CsvBatchPollingResponse:
         """
-        inserts single product to db
+        the progress of every file of the batch and their totals, out of the progress counters
+        of the files' jobs, which are read with a single query
         """
-        create_product_query_model: CreateProductQueryModel = CreateProductQueryModel(
-            s_no=csv_row[0],
-            csv_file_id=csv_file_id,
-            product_name=csv_row[1],
-            input_image_urls=csv_row[2:],
-            output_image_urls=cls.add_image_to_cloud(image_urls=csv_row[2:]),
+        csv_batches: List[CsvBatchModel] = query_manager.query_with_filter(
+            model=CsvBatchModel, filters=CsvBatchModel.id == batch_id, limit=1, read_only=True
         )
-        product: ProductModel = ProductModel(
-            create_product_request_model=create_product_query_model
+        if not csv_batches:
+            raise ValueError(f"No CsvBatchModel found for batch id = {batch_id}")
+        csv_batch = csv_batches[0]
+
+        csv_file_ids = list(dict.fromkeys(csv_batch.get_csv_file_ids()))
+        job_rows = query_manager.query_columns_by_keyset(
+            filters=CsvJobModel.csv_file_id.in_(csv_file_ids),
+            columns=[
+                CsvJobModel.csv_file_id,
+                CsvJobModel.status,
+                CsvJobModel.total_rows,
+                CsvJobModel.processed_rows,
+                CsvJobModel.failed_rows,
+                CsvJobModel.in_flight_rows,
+                CsvJobModel.started_at,
+                CsvJobModel.finished_at,
+                CsvJobModel.id,
+            ],
+            key_columns=[CsvJobModel.id],
+            limit=len(csv_file_ids),
+            read_only=True,
         )
+        jobs_by_csv_file_id = {job_row[0]: job_row for job_row in job_rows}
 
-        return ObjectRepository.insert_single_object(object_to_be_inserted=product)
+        files: List[CsvBatchFileStatus] = []
+        for csv_file in csv_batch.csv_files:
+            job_row = jobs_by_csv_file_id.get(csv_file["csv_file_id"])
+            files.append(
+                CsvBatchFileStatus(
+                    file_name=csv_file["file_name"],
+                    csv_file_id=csv_file["csv_file_id"],
+                    status=job_row[1] if job_row else CsvJobStatus.PENDING.value,
+                    count_rows=job_row[2] if job_row else 0,
+                    count_rows_inserted=job_row[3] if job_row else 0,
+                    count_rows_failed=job_row[4] if job_row else 0,
+                )
+            )
+
+        # a file listed twice is counted once
+        unique_job_rows = list(jobs_by_csv_file_id.values())
+        count_files_by_status = {status.value: 0 for status in CsvJobStatus}
+        for job_row in unique_job_rows:
+            count_files_by_status[job_row[1]] += 1
+        count_files_by_status[CsvJobStatus.PENDING.value] += len(csv_file_ids) - len(
+            unique_job_rows
+        )
+
+        count_rows_inserted = sum(job_row[3] for job_row in unique_job_rows)
+        started_ats = [job_row[6] for job_row in unique_job_rows if job_row[6] is not None]
+        finished_ats = [job_row[7] for job_row in unique_job_rows if job_row[7] is not None]
+        rows_per_second: Optional[float] = None
+        if started_ats:
+            is_finished = len(finished_ats) == len(csv_file_ids)
+            elapsed_seconds = (
+                (max(finished_ats) if is_finished else datetime.now()) - min(started_ats)
+            ).total_seconds()
+            if elapsed_seconds > 0:
+                rows_per_second = round(count_rows_inserted / elapsed_seconds, 2)
+
+        return CsvBatchPollingResponse(
+            count_files=len(csv_file_ids),
+            count_files_by_status=count_files_by_status,
+            count_rows=sum(job_row[2] for job_row in unique_job_rows),
+            count_rows_inserted=count_rows_inserted,
+            count_rows_failed=sum(job_row[4] for job_row in unique_job_rows),
+            count_rows_in_flight=sum(job_row[5] for job_row in unique_job_rows),
+            status=cls.get_batch_status(
+                count_files_by_status=count_files_by_status, count_files=len(csv_file_ids)
+            ),
+            rows_per_second=rows_per_second,
+            files=files,
+        )
 
     @classmethod
-    def add_image_to_cloud(cls, image_urls: List[str]) -> List[str]:
+    def get_batch_status(cls, count_files_by_status: Dict[str, int], count_files: int) -> str:
         """
-        this function is basically a dummy function but its purpose is to upload image to cloud and return its url
+        COMPLETED once every file is, FAILED once every file is done and one of them failed,
+        PENDING while no file was picked up and RUNNING in between
         """
+        completed = count_files_by_status[CsvJobStatus.COMPLETED.value]
+        failed = count_files_by_status[CsvJobStatus.FAILED.value]
+        if completed == count_files:
+            return CsvJobStatus.COMPLETED.value
+        if completed + failed == count_files:
+            return CsvJobStatus.FAILED.value
+        if count_files_by_status[CsvJobStatus.PENDING.value] == count_files:
+            return CsvJobStatus.PENDING.value
+        return CsvJobStatus.RUNNING.value
 
-        return [image_url + "output" for image_url in image_urls]
 
+class CsvUploadService:
     @classmethod
-    def get_csv_data_from_csv_model(cls, csv_model: CsvModel) -> List[List[str]]:
-        csv_content = csv_model.csv_file
-        decoded_content = csv_content.decode("utf-8").splitlines()
-        csv_reader = csv.reader(decoded_content)
-        csv_data = [row for row in csv_reader]
-        return csv_data
+    def process_csv_job(cls, csv_job: CsvJobModel, progress: CsvJobProgress) -> None:
+        """
+        job handler run by the csv worker pool, inserts the products of the job's csv file
+        progress is reported after every committed batch, which also keeps the job's lease
+        every batch moves the job's checkpoint along in its own transaction, so a retried job
+        skips the rows a previous attempt already committed
+        a delta upload is applied to its supplier's catalogue instead, while the job holds it
+        """
+        csv_record: CsvModel = ObjectRepository.get_object_by_id(
+            model=CsvModel, object_id=csv_job.csv_file_id
+        )
+
+        with CsvDeltaUploadService.hold_catalog(csv_model=csv_record, csv_job=csv_job):
+            CsvExportArtifactService.invalidate(csv_job=csv_job)
 
+            skip_rows = csv_job.checkpoint_rows
+            if skip_rows > 0:
+                logger.info(f"csv job {csv_job.id} resumes after row {skip_rows}")
+            else:
+                CsvErrorReportService.delete(csv_file_id=csv_record.id)
+
+            try:
+                if csv_record.supplier_id:
+                    CsvDeltaUploadService.apply_csv_to_catalog(
+                        csv_model=csv_record, progress=progress, skip_rows=skip_rows
+                    )
+                elif CsvShardService.should_parse_in_parallel(size_bytes=csv_record.size_bytes):
+                    cls.create_products_from_csv_in_parallel(
+                        csv_model=csv_record, progress=progress, skip_rows=skip_rows
+                    )
+                else:
+                    csv_rows: Iterator[List[str]] = CsvStreamReader.iter_rows_from_csv_model(
+                        csv_model=csv_record
+                    )
+                    cls.create_products_from_csv(
+                        csv_rows=csv_rows,
+                        csv_file_id=csv_record.id,
+                        progress=progress,
+                        skip_rows=skip_rows,
+                    )
+            finally:
+                # the image results of the job are stored even when it failed part way
+                get_image_processor().flush()
+
+            # the output of a finished job never changes, so the export is built once here, for a
+            # delta upload it is the catalogue as this file left it
+            with ingestion_stage_seconds.time(stage="export"):
+                CsvExportArtifactService.materialize(
+                    csv_job=csv_job,
+                    csv_chunks=CsvDownloadService.download_uploaded_csv(
+                        csv_file_id=csv_record.id, read_only=False
+                    ),
+                )
+
+        # once all the products are inserted into the db we update in csv model the row as is_processed=True
+        csv_record.is_processed = True
+        ObjectRepository.update_single_object(object_to_be_updated=csv_record)
 
-class CsvPollService:
     @classmethod
-    def get_csv_file_upload_status(cls, csv_file_id: str) -> CsvPollingResponse:
-        csv_file_model: CsvModel = ObjectRepository.get_object_by_id(
-            model=CsvModel, object_id=csv_file_id
+    def create_products_from_csv(
+        cls,
+        csv_rows: Iterator[List[str]],
+        csv_file_id: str,
+        progress: Optional[CsvJobProgress] = None,
+        skip_rows: int = 0,
+    ) -> None:
+        """
+        this function takes in the rows of the csv, header first, and creates products out of them
+        rows are consumed lazily in batches of PRODUCT_INSERT_BATCH_SIZE
+        the first skip_rows data rows are only parsed, they were committed by an earlier attempt
+        """
+        batch_size = CsvIngestionService.get_product_insert_batch_size()
+
+        row_validator = CsvRowValidator(
+            header_mapping=CsvIngestionService.get_header_mapping(next(csv_rows, None))
         )
-        csv_rows: List[List[str]] = CsvUploadService.get_csv_data_from_csv_model(
-            csv_model=csv_file_model
+        csv_rows = islice(csv_rows, skip_rows, None)
+
+        product_batches = (
+            cls.build_product_insert_rows(
+                csv_rows=rows_batch, csv_file_id=csv_file_id, row_validator=row_validator
+            )
+            for rows_batch in CsvStreamReader.iter_batches(csv_rows, batch_size=batch_size)
         )
-        products_inserted: List[ProductModel] = query_manager.query_with_filter(
-            model=ProductModel, filters=ProductModel.csv_file_id == csv_file_id
+        cls.write_product_batches(
+            product_batches=product_batches,
+            csv_file_id=csv_file_id,
+            progress=progress,
+            skip_rows=skip_rows,
         )
 
-        return CsvPollingResponse(
-            count_rows=len(csv_rows) - 1, count_rows_inserted=len(products_inserted)
+    @classmethod
+    def create_products_from_csv_in_parallel(
+        cls, csv_model: CsvModel, progress: Optional[CsvJobProgress] = None, skip_rows: int = 0
+    ) -> None:
+        """
+        opt-in multi-core path for large files, shards of the csv are parsed, validated and turned
+        into insert rows by a process pool while this thread stays the single writer
+        """
+        batch_size = CsvIngestionService.get_product_insert_batch_size()
+
+        csv_rows = CsvStreamReader.iter_rows_from_csv_model(csv_model=csv_model)
+        try:
+            header_row = next(csv_rows, None) or []
+        finally:
+            csv_rows.close()
+        row_validator = CsvRowValidator(
+            header_mapping=CsvIngestionService.get_header_mapping(header_row)
         )
 
+        # the workers mmap the blob straight from the blob store
+        product_rows = chain.from_iterable(
+            CsvShardService.iter_transformed_shards(
+                csv_path=get_blob_store().get_path(csv_model.blob_key),
+                csv_file_id=csv_model.id,
+                rows_transformer=partial(
+                    cls.build_product_insert_rows, row_validator=row_validator
+                ),
+            )
+        )
+        product_batches = CsvStreamReader.iter_batches(
+            islice(product_rows, skip_rows, None), batch_size=batch_size
+        )
+        cls.write_product_batches(
+            product_batches=product_batches,
+            csv_file_id=csv_model.id,
+            progress=progress,
+            skip_rows=skip_rows,
+        )
 
-class CsvDownloadService:
     @classmethod
-    def download_uploaded_csv(cls, csv_file_id: str) -> None:
-        products_inserted: List[ProductModel] = query_manager.query_with_filter(
-            model=ProductModel, filters=ProductModel.csv_file_id == csv_file_id
+    def get_existing_product_identifiers(cls, product_ids: List[str]) -> Dict[str, Tuple[str, str]]:
+        """
+        :return: s_no and csv_file_id of the products in the db with one of the ids, by id
+        """
+        if not product_ids:
+            return {}
+        product_rows = query_manager.query_columns_by_keyset(
+            filters=ProductModel.id.in_(product_ids),
+            columns=[ProductModel.id, ProductModel.s_no, ProductModel.csv_file_id],
+            key_columns=[ProductModel.id],
+            limit=len(product_ids),
         )
-        csv_data = cls.convert_products_to_csv(products=products_inserted)
-        return csv_data
+        return {product_id: (s_no, csv_file_id) for product_id, s_no, csv_file_id in product_rows}
+
+    @classmethod
+    def resolve_product_id_collisions(
+        cls,
+        insert_rows: List[ProductInsertRow],
+        known_identifiers: Dict[str, Tuple[str, str]],
+    ) -> List[str]:
+        """
+        gives the long id to every product whose short id is already known, in known_identifiers
+        or from an earlier product of insert_rows, for another s_no or csv file
+        :return: the long ids given out
+        """
+        long_product_ids: List[str] = []
+        for insert_row in insert_rows:
+            identifiers = insert_row.get_identifiers()
+            if id_generator.is_collision(
+                known_identifiers.setdefault(insert_row.id, identifiers), identifiers
+            ):
+                insert_row.id = ProductModel.get_long_id_for_product(*identifiers)
+                long_product_ids.append(insert_row.id)
+        if long_product_ids:
+            logger.warning(f"{len(long_product_ids)} product ids collided, using their long ids")
+        return long_product_ids
 
     @classmethod
-    def convert_products_to_csv(cls, products: List[ProductModel]):
+    def split_product_batch(
+        cls,
+        product_batch: List[Union[ProductInsertRow, CsvRowError]],
+        first_row_number: int,
+        pending_product_identifiers: Dict[str, Tuple[str, str]],
+    ) -> Tuple[List[ProductInsertRow], List[Tuple[int, CsvRowError]]]:
         """
-        Converts a list of ProductModel instances into a CSV string.
+        separates the products to insert from the rows that failed, numbered from first_row_number
+        the products to insert keep their row number, the order downloads list them in
+        the id of a product is derived from its s_no, so a product whose id was already seen in
+        this batch, in one of the batches that are not committed yet or in the db repeats the
+        s_no of an earlier row and fails, the first row with the s_no is kept
+        short ids that collide are replaced first, see resolve_product_id_collisions
         """
-        headers = [
-            "PRODUCT_SL_NO",
-            "PRODUCT_NAME",
-            "INPUT_PRODUCT_IMAGE_URLS",
-            "OUTPUT_PRODUCT_IMAGE_URLS",
+        product_rows = [
+            product_row
+            for product_row in product_batch
+            if isinstance(product_row, ProductInsertRow)
         ]
+        product_ids = [product_row.id for product_row in product_rows]
+        existing_identifiers = cls.get_existing_product_identifiers(product_ids=product_ids)
+        known_identifiers = {
+            product_id: pending_product_identifiers[product_id]
+            for product_id in product_ids
+            if product_id in pending_product_identifiers
+        }
+        known_identifiers.update(existing_identifiers)
+        long_product_ids = cls.resolve_product_id_collisions(
+            insert_rows=product_rows, known_identifiers=dict(known_identifiers)
+        )
 
-        csv_output = StringIO()
-        csv_writer = csv.DictWriter(csv_output, fieldnames=headers)
-
-        csv_writer.writeheader()
-        for product in products:
-            csv_writer.writerow(
-                {
-                    "PRODUCT_SL_NO": product.s_no,
-                    "PRODUCT_NAME": product.product_name,
-                    "INPUT_PRODUCT_IMAGE_URLS": (
-                        ", ".join(product.input_image_urls) if product.input_image_urls else ""
-                    ),
-                    "OUTPUT_PRODUCT_IMAGE_URLS": (
-                        ", ".join(product.output_image_urls) if product.output_image_urls else ""
-                    ),
-                }
+        seen_product_ids = set(known_identifiers)
+        seen_product_ids.update(
+            product_id
+            for product_id in long_product_ids
+            if product_id in pending_product_identifiers
+        )
+        seen_product_ids.update(cls.get_existing_product_identifiers(product_ids=long_product_ids))
+
+        insert_rows: List[ProductInsertRow] = []
+        failed_rows: List[Tuple[int, CsvRowError]] = []
+        for row_number, product_row in enumerate(product_batch, start=first_row_number):
+            if isinstance(product_row, CsvRowError):
+                failed_rows.append((row_number, product_row))
+            elif product_row.id in seen_product_ids:
+                failed_rows.append(
+                    (
+                        row_number,
+                        CsvIngestionService.build_duplicate_row_error(
+                            s_no=product_row.s_no,
+                            csv_row=[
+                                product_row.s_no,
+                                product_row.product_name,
+                                *product_row.input_image_urls,
+                            ],
+                        ),
+                    )
+                )
+            else:
+                seen_product_ids.add(product_row.id)
+                product_row.row_number = row_number
+                insert_rows.append(product_row)
+        return insert_rows, failed_rows
+
+    @classmethod
+    def write_product_batches(
+        cls,
+        product_batches: Iterator[List[Union[ProductInsertRow, CsvRowError]]],
+        csv_file_id: str,
+        progress: Optional[CsvJobProgress] = None,
+        skip_rows: int = 0,
+    ) -> None:
+        """
+        sends the images of every batch to the image processor and writes each batch with a single
+        multi-row upsert as soon as its images are done, see CsvIngestionService.write_image_batches
+        a batch holds one entry per csv row, the ProductInsertRow of its product or the
+        CsvRowError of a row that failed validation, see split_product_batch for duplicates
+        rows are reported as in flight when their images are submitted and as processed or failed
+        once their batch is committed, together with the job's checkpoint. the failed rows, and
+        the products one of whose images failed, are then added to the file's error report
+        """
+        # s_no and csv_file_id of the products of the batches that are not committed yet, by id
+        pending_product_identifiers: Dict[str, Tuple[str, str]] = {}
+
+        def iter_image_batches() -> Iterator[ImageBatch]:
+            next_row_number = skip_rows + 1
+            # parse covers reading, decoding and validating the csv up to a full batch
+            for product_batch in iter_timed(iter(product_batches), stage="parse"):
+                if progress is not None:
+                    progress.rows_started(row_count=len(product_batch))
+
+                insert_rows, failed_rows = cls.split_product_batch(
+                    product_batch=product_batch,
+                    first_row_number=next_row_number,
+                    pending_product_identifiers=pending_product_identifiers,
+                )
+                next_row_number += len(product_batch)
+                pending_product_identifiers.update(
+                    (insert_row.id, insert_row.get_identifiers()) for insert_row in insert_rows
+                )
+                yield ImageBatch(
+                    products=insert_rows,
+                    row_numbers=[insert_row.row_number for insert_row in insert_rows],
+                    failed_rows=failed_rows,
+                )
+
+        def write_batch(image_batch: ImageBatch, insert_rows: List[ProductInsertRow]) -> None:
+            for insert_row in image_batch.products:
+                pending_product_identifiers.pop(insert_row.id, None)
+            insert_parameters = [insert_row.to_insert_parameters() for insert_row in insert_rows]
+            if progress is None:
+                query_manager.upsert_rows(model=ProductModel, rows=insert_parameters)
+            else:
+                progress.commit_rows(
+                    model=ProductModel,
+                    rows=insert_parameters,
+                    processed_row_count=len(insert_rows),
+                    failed_row_count=len(image_batch.failed_rows),
+                )
+
+        CsvIngestionService.write_image_batches(
+            image_batches=iter_image_batches(), write_batch=write_batch, csv_file_id=csv_file_id
+        )
+
+    @classmethod
+    def build_product_insert_rows(
+        cls, csv_rows: List[List[str]], csv_file_id: str, row_validator: CsvRowValidator
+    ) -> List[Union[ProductInsertRow, CsvRowError]]:
+        """
+        validates a batch of csv rows and builds the products of the valid ones, a row that
+        failed keeps its place as its CsvRowError
+        the rows of a batch share one created_at and their ids are generated together
+        """
+        current_time = datetime.now()
+        validated_rows = row_validator.validate_batch(csv_rows)
+        product_ids = iter(
+            ProductModel.get_ids_for_products(
+                (validated_row[0], csv_file_id)
+                for validated_row in validated_rows
+                if not isinstance(validated_row, CsvRowError)
+            )
+        )
+        return [
+            (
+                validated_row
+                if isinstance(validated_row, CsvRowError)
+                else cls.build_product_insert_row(
+                    csv_row=validated_row,
+                    csv_file_id=csv_file_id,
+                    created_at=current_time,
+                    product_id=next(product_ids),
+                )
             )
+            for validated_row in validated_rows
+        ]
 
-        output = io.BytesIO()
-        output.write(csv_output.getvalue().encode("utf-8"))
-        output.seek(0)  # Reset pointer to the beginning of the stream
-        return output
+    @classmethod
+    def build_product_insert_row(
+        cls,
+        csv_row: List[str],
+        csv_file_id: str,
+        created_at: datetime,
+        product_id: Optional[str] = None,
+    ) -> ProductInsertRow:
+        """
+        builds a single product out of a row normalised by CsvRowValidator, output image urls
+        are left empty, they are filled in by write_product_batches
+        """
+        return ProductInsertRow(
+            s_no=csv_row[0],
+            csv_file_id=csv_file_id,
+            product_name=csv_row[1],
+            input_image_urls=csv_row[2:],
+            created_at=created_at,
+            product_id=product_id,
+        )
@@ -0,0 +1,201 @@
+import csv
+import io
+import mmap
+import multiprocessing
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Deque, Iterator, List, Optional, Tuple
+
+# turns the csv rows of a shard into one entry each, e.g. the insert parameters of a product,
+# must be picklable
+RowsTransformer = Callable[[List[List[str]], str], List[Any]]
+
+QUOTE_COUNT_WINDOW_BYTES = 1024 * 1024
+# a record ends on \r\n, \n or a lone \r, like the lines of CsvStreamReader.iter_decoded_lines
+record_end_regex = re.compile(rb"\r\n?|\n")
+# the parse pool of each job worker thread, see CsvShardService.get_parse_pool
+parse_pools = threading.local()
+
+
+class CsvShardService:
+    """
+    splits a csv file into byte ranges that start and end on record boundaries so that
+    worker processes can parse and transform the ranges independently of each other
+    """
+
+    @classmethod
+    def get_parallel_parse_workers(cls) -> int:
+        # 0 keeps parsing in the job worker itself
+        return int(os.getenv("CSV_PARALLEL_PARSE_WORKERS", "0"))
+
+    @classmethod
+    def get_parallel_parse_min_bytes(cls) -> int:
+        return int(os.getenv("CSV_PARALLEL_PARSE_MIN_BYTES", str(64 * 1024 * 1024)))
+
+    @classmethod
+    def get_shard_bytes(cls) -> int:
+        return int(os.getenv("CSV_PARSE_SHARD_BYTES", str(8 * 1024 * 1024)))
+
+    @classmethod
+    def should_parse_in_parallel(cls, size_bytes: int) -> bool:
+        return (
+            cls.get_parallel_parse_workers() > 0
+            and size_bytes >= cls.get_parallel_parse_min_bytes()
+        )
+
+    @classmethod
+    def count_quotes(cls, csv_buffer: Any, start: int, end: int) -> int:
+        quotes = 0
+        for window_start in range(start, end, QUOTE_COUNT_WINDOW_BYTES):
+            window_end = min(window_start + QUOTE_COUNT_WINDOW_BYTES, end)
+            quotes += csv_buffer[window_start:window_end].count(b'"')
+        return quotes
+
+    @classmethod
+    def find_record_boundary(
+        cls, csv_buffer: Any, position: int, quotes_before_position: int
+    ) -> Tuple[int, int]:
+        """
+        :return: offset right after the first line ending at or after position that is not inside
+        a quoted field, along with the number of quotes before that offset
+
+        escaped quotes come in pairs, so a line ending is a record boundary exactly when the
+        number of quotes before it is even
+        a position between the \r and the \n of a \r\n finds the boundary right after the \n
+        """
+        quotes = quotes_before_position
+        while True:
+            line_end = record_end_regex.search(csv_buffer, position)
+            if line_end is None:
+                return len(csv_buffer), quotes + cls.count_quotes(
+                    csv_buffer, position, len(csv_buffer)
+                )
+
+            quotes += cls.count_quotes(csv_buffer, position, line_end.start())
+            if quotes % 2 == 0:
+                return line_end.end(), quotes
+            position = line_end.end()
+
+    @classmethod
+    def compute_shards(cls, csv_buffer: Any, shard_bytes: int) -> List[Tuple[int, int]]:
+        """
+        splits everything after the header row into (start, end) byte ranges of about shard_bytes
+        """
+        size = len(csv_buffer)
+        start, quotes = cls.find_record_boundary(csv_buffer, 0, 0)
+
+        shards: List[Tuple[int, int]] = []
+        while start < size:
+            target = min(start + shard_bytes, size)
+            quotes += cls.count_quotes(csv_buffer, start, target)
+            end = size
+            if target < size:
+                end, quotes = cls.find_record_boundary(csv_buffer, target, quotes)
+            shards.append((start, end))
+            start = end
+
+        return shards
+
+    @classmethod
+    def transform_shard(
+        cls,
+        csv_path: str,
+        start: int,
+        end: int,
+        csv_file_id: str,
+        rows_transformer: RowsTransformer,
+    ) -> List[Any]:
+        """
+        runs in a worker process, parses one shard and returns its transformed rows
+        """
+        with open(csv_path, "rb") as csv_file:
+            with mmap.mmap(csv_file.fileno(), 0, access=mmap.ACCESS_READ) as csv_buffer:
+                shard_text = csv_buffer[start:end].decode("utf-8")
+
+        return rows_transformer(list(csv.reader(io.StringIO(shard_text, newline=""))), csv_file_id)
+
+    @classmethod
+    def iter_transformed_shards(
+        cls, csv_path: str, csv_file_id: str, rows_transformer: RowsTransformer
+    ) -> Iterator[List[Any]]:
+        """
+        fans the shards of the file out to the worker's parse pool and yields their transformed
+        rows in file order, one entry per csv row, at most two shards per worker are in flight so a slow
+        writer bounds memory
+        """
+        workers = cls.get_parallel_parse_workers()
+
+        with open(csv_path, "rb") as csv_file:
+            if os.fstat(csv_file.fileno()).st_size == 0:
+                return
+            with mmap.mmap(csv_file.fileno(), 0, access=mmap.ACCESS_READ) as csv_buffer:
+                shards = cls.compute_shards(csv_buffer, shard_bytes=cls.get_shard_bytes())
+
+        executor = cls.get_parse_pool()
+        pending_shards = iter(shards)
+        in_flight: Deque[Future] = deque()
+
+        def submit_next_shard() -> None:
+            shard = next(pending_shards, None)
+            if shard is not None:
+                in_flight.append(
+                    executor.submit(
+                        cls.transform_shard,
+                        csv_path,
+                        shard[0],
+                        shard[1],
+                        csv_file_id,
+                        rows_transformer,
+                    )
+                )
+
+        try:
+            for _ in range(workers * 2):
+                submit_next_shard()
+
+            while in_flight:
+                transformed_rows = in_flight.popleft().result()
+                submit_next_shard()
+                yield transformed_rows
+        except BrokenProcessPool:
+            # a parse process died, the next file starts a fresh pool
+            cls.shutdown_parse_pool()
+            raise
+        finally:
+            # the pool outlives the file, shards of a file that is given up on are not parsed
+            for future in in_flight:
+                future.cancel()
+
+    @classmethod
+    def get_parse_pool(cls) -> ProcessPoolExecutor:
+        """
+        every job worker keeps one pool of parse processes for all the files it parses, so the
+        processes are spawned once per worker rather than once per file
+        the pool is replaced when CSV_PARALLEL_PARSE_WORKERS changes
+        """
+        workers = cls.get_parallel_parse_workers()
+        executor: Optional[ProcessPoolExecutor] = getattr(parse_pools, "executor", None)
+        if executor is not None and parse_pools.workers != workers:
+            cls.shutdown_parse_pool()
+            executor = None
+        if executor is None:
+            executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            parse_pools.executor = executor
+            parse_pools.workers = workers
+        return executor
+
+    @classmethod
+    def shutdown_parse_pool(cls) -> None:
+        """
+        stops the parse processes of the calling worker, if it started any
+        """
+        executor: Optional[ProcessPoolExecutor] = getattr(parse_pools, "executor", None)
+        if executor is not None:
+            parse_pools.executor = None
+            executor.shutdown(cancel_futures=True)
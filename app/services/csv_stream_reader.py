@@ -0,0 +1,141 @@
+import codecs
+import csv
+import re
+from itertools import islice
+from typing import BinaryIO, Iterable, Iterator, List, TypeVar
+
+from app.database.models.csv_model import CsvModel
+from app.storage.blob_store import BlobStore, BlobWriter, get_blob_store
+
+T = TypeVar("T")
+
+DEFAULT_READ_CHUNK_SIZE = 64 * 1024
+# a line with its ending, \r\n, \n or a lone \r, like the universal newlines of open()
+line_regex = re.compile(r"[^\r\n]*(?:\r\n?|\n)")
+
+
+class CsvRecordCounter:
+    """
+    counts csv records in chunks fed one after the other, newlines inside quoted fields are
+    not counted. splitting a chunk on quotes leaves segments that alternate between outside and
+    inside a quoted field, so only newlines of the outside segments end a record
+    a record ends on \r\n, \n or a lone \r, like the lines of CsvStreamReader.iter_decoded_lines
+    """
+
+    def __init__(self) -> None:
+        self.complete_records = 0
+        self.in_quotes = False
+        self.last_byte = b"\n"
+
+    def feed(self, chunk: bytes) -> None:
+        if not chunk:
+            return
+
+        if not self.in_quotes and self.last_byte == b"\r" and chunk.startswith(b"\n"):
+            # the \r\n was split between the chunks and its \r already ended the record
+            self.complete_records -= 1
+        for index, segment in enumerate(chunk.split(b'"')):
+            if index > 0:
+                self.in_quotes = not self.in_quotes
+            if not self.in_quotes:
+                self.complete_records += (
+                    segment.count(b"\n") + segment.count(b"\r") - segment.count(b"\r\n")
+                )
+        self.last_byte = chunk[-1:]
+
+    @property
+    def record_count(self) -> int:
+        # the last record does not need a trailing newline
+        return self.complete_records + (1 if self.last_byte not in (b"\n", b"\r") else 0)
+
+
+class CsvUploadStream(BlobWriter):
+    """
+    blob writer that also counts the csv records written to it
+    """
+
+    def __init__(self, blob_store: BlobStore):
+        self.record_counter = CsvRecordCounter()
+        super().__init__(blob_store=blob_store, on_chunk=self.record_counter.feed)
+
+    @property
+    def data_row_count(self) -> int:
+        # the header is not a data row
+        return max(self.record_counter.record_count - 1, 0)
+
+
+class CsvStreamReader:
+    @classmethod
+    def iter_decoded_lines(
+        cls, binary_stream: BinaryIO, chunk_size: int = DEFAULT_READ_CHUNK_SIZE
+    ) -> Iterator[str]:
+        """
+        reads the stream chunk by chunk through an incremental utf-8 decoder and yields lines
+        with their line endings kept, so the csv reader can still join quoted multi-line fields
+        lines end on \r\n, \n or a lone \r, the line endings open() translates with newline=""
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        pending = ""
+
+        while True:
+            chunk = binary_stream.read(chunk_size)
+            pending += decoder.decode(chunk, final=not chunk)
+
+            line_end = 0
+            for line_match in line_regex.finditer(pending):
+                if chunk and line_match.end() == len(pending) and pending.endswith("\r"):
+                    # the \n of a \r\n may still be in the next chunk
+                    break
+                yield line_match.group()
+                line_end = line_match.end()
+            pending = pending[line_end:]
+
+            if not chunk:
+                break
+
+        if pending:
+            yield pending
+
+    @classmethod
+    def count_records(
+        cls, binary_stream: BinaryIO, chunk_size: int = DEFAULT_READ_CHUNK_SIZE
+    ) -> int:
+        """
+        counts csv records without parsing them, see CsvRecordCounter
+        """
+        record_counter = CsvRecordCounter()
+        for chunk in iter(lambda: binary_stream.read(chunk_size), b""):
+            record_counter.feed(chunk)
+        return record_counter.record_count
+
+    @classmethod
+    def iter_rows_from_stream(
+        cls, binary_stream: BinaryIO, chunk_size: int = DEFAULT_READ_CHUNK_SIZE
+    ) -> Iterator[List[str]]:
+        """
+        yields parsed csv rows one at a time, the header row included
+        the stream can be anything file like, e.g. a spooled temp file
+        """
+        return csv.reader(
+            cls.iter_decoded_lines(binary_stream=binary_stream, chunk_size=chunk_size)
+        )
+
+    @classmethod
+    def iter_rows_from_csv_model(cls, csv_model: CsvModel) -> Iterator[List[str]]:
+        """
+        yields parsed csv rows read straight from the csv model's blob in the blob store
+        """
+        with get_blob_store().open(csv_model.blob_key) as blob_file:
+            yield from cls.iter_rows_from_stream(binary_stream=blob_file)
+
+    @classmethod
+    def iter_batches(cls, items: Iterable[T], batch_size: int) -> Iterator[List[T]]:
+        """
+        groups any iterable into lists of at most batch_size items
+        """
+        iterator = iter(items)
+        while True:
+            batch = list(islice(iterator, batch_size))
+            if not batch:
+                return
+            yield batch
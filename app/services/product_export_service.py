@@ -0,0 +1,245 @@
+import importlib.util
+import io
+import json
+from enum import Enum
+from functools import lru_cache
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+from app.exceptions.not_acceptable_error import NotAcceptableError
+
+
+class ProductExportFormat(str, Enum):
+    CSV = "csv"
+    NDJSON = "ndjson"
+    ARROW = "arrow"
+    PARQUET = "parquet"
+
+
+EXPORT_MEDIA_TYPES: Dict[ProductExportFormat, str] = {
+    ProductExportFormat.CSV: "text/csv",
+    ProductExportFormat.NDJSON: "application/x-ndjson",
+    ProductExportFormat.ARROW: "application/vnd.apache.arrow.stream",
+    ProductExportFormat.PARQUET: "application/vnd.apache.parquet",
+}
+PYARROW_EXPORT_FORMATS = (ProductExportFormat.ARROW, ProductExportFormat.PARQUET)
+
+
+@lru_cache(maxsize=None)
+def is_pyarrow_installed() -> bool:
+    # looked up once without importing pyarrow, it is only imported when an export needs it
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+class ExportChunkSink(io.RawIOBase):
+    """
+    write only file the arrow and parquet writers write into, drain returns what was written
+    since the last drain so that the export is streamed a record batch at a time
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: Any) -> int:
+        chunk = bytes(data)
+        self._chunks.append(chunk)
+        self._position += len(chunk)
+        return len(chunk)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        chunk = b"".join(self._chunks)
+        self._chunks.clear()
+        return chunk
+
+
+class ProductExportService:
+    """
+    the products of a file as newline delimited json, an arrow ipc stream or parquet, next to
+    the csv download. image urls stay lists, list<string> columns in arrow and parquet
+    every format is written a page of products at a time, one record batch, or parquet row group,
+    per page, while the pages are still being read
+    arrow and parquet need the pyarrow package, which is only imported when they are asked for,
+    without it they are not offered at all
+    """
+
+    @classmethod
+    def get_supported_formats(cls) -> List[ProductExportFormat]:
+        if is_pyarrow_installed():
+            return list(ProductExportFormat)
+        return [
+            export_format
+            for export_format in ProductExportFormat
+            if export_format not in PYARROW_EXPORT_FORMATS
+        ]
+
+    @classmethod
+    def negotiate_format(
+        cls, format_name: Optional[str], accept_header: Optional[str]
+    ) -> ProductExportFormat:
+        """
+        an explicit format wins, otherwise the best match of the Accept header, csv by default
+        a known format that cannot be written here, or an Accept header that only matches such
+        formats, raises NotAcceptableError
+        """
+        supported_formats = cls.get_supported_formats()
+        if format_name:
+            try:
+                export_format = ProductExportFormat(format_name.lower())
+            except ValueError:
+                raise ValueError(
+                    f"unknown export format = {format_name}, expected one of "
+                    f"{[export_format.value for export_format in ProductExportFormat]}"
+                )
+            if export_format not in supported_formats:
+                raise cls.build_not_acceptable_error(
+                    f"the {export_format.value} export is not available",
+                    supported_formats=supported_formats,
+                )
+            return export_format
+
+        accepted_media_types = parse_accept_header(accept_header or "", MIMEAccept)
+        # the csv media type comes first, so */* and a missing Accept header keep the csv
+        best_media_type = accepted_media_types.best_match(
+            [EXPORT_MEDIA_TYPES[export_format] for export_format in supported_formats]
+        )
+        for export_format in supported_formats:
+            if EXPORT_MEDIA_TYPES[export_format] == best_media_type:
+                return export_format
+        if accepted_media_types.best_match(list(EXPORT_MEDIA_TYPES.values())):
+            raise cls.build_not_acceptable_error(
+                f"no available export format matches Accept = {accept_header}",
+                supported_formats=supported_formats,
+            )
+        return ProductExportFormat.CSV
+
+    @classmethod
+    def build_not_acceptable_error(
+        cls, message: str, supported_formats: List[ProductExportFormat]
+    ) -> NotAcceptableError:
+        supported_values = [export_format.value for export_format in supported_formats]
+        return NotAcceptableError(
+            f"{message}, expected one of {supported_values}", supported_formats=supported_values
+        )
+
+    @classmethod
+    def get_media_type(cls, export_format: ProductExportFormat) -> str:
+        return EXPORT_MEDIA_TYPES[export_format]
+
+    @classmethod
+    def get_download_name(cls, export_format: ProductExportFormat) -> str:
+        return f"output.{export_format.value}"
+
+    @classmethod
+    def iter_pages(cls, product_rows: Iterable[Any], page_size: int) -> Iterator[List[Any]]:
+        product_rows = iter(product_rows)
+        return iter(lambda: list(islice(product_rows, page_size)), [])
+
+    @classmethod
+    def iter_export(
+        cls, export_format: ProductExportFormat, product_rows: Iterable[Any], page_size: int
+    ) -> Iterator[bytes]:
+        """
+        :param product_rows: s_no, product_name, input_image_urls and output_image_urls of every
+        product, further columns are ignored
+        """
+        product_pages = cls.iter_pages(product_rows=product_rows, page_size=page_size)
+        # pyarrow is imported here, before the response starts, so that its absence is an error
+        # response and not a truncated download
+        if export_format == ProductExportFormat.NDJSON:
+            export_chunks = cls.iter_ndjson(product_pages)
+        elif export_format == ProductExportFormat.ARROW:
+            export_chunks = cls.iter_arrow_stream(cls.import_pyarrow(export_format), product_pages)
+        elif export_format == ProductExportFormat.PARQUET:
+            export_chunks = cls.iter_parquet(cls.import_pyarrow(export_format), product_pages)
+        else:
+            raise ValueError(f"{export_format.value} is not exported by ProductExportService")
+        # a writer that buffers a page yields nothing for it
+        return filter(None, export_chunks)
+
+    @classmethod
+    def iter_ndjson(cls, product_pages: Iterator[List[Any]]) -> Iterator[bytes]:
+        for product_page in product_pages:
+            yield "".join(
+                json.dumps(
+                    {
+                        "s_no": s_no,
+                        "product_name": product_name,
+                        "input_image_urls": input_image_urls or [],
+                        "output_image_urls": output_image_urls or [],
+                    }
+                )
+                + "\n"
+                for s_no, product_name, input_image_urls, output_image_urls, *_ in product_page
+            ).encode("utf-8")
+
+    @classmethod
+    def import_pyarrow(cls, export_format: ProductExportFormat) -> Any:
+        try:
+            import pyarrow
+            import pyarrow.ipc
+        except ImportError as e:
+            raise RuntimeError(f"the {export_format.value} export needs the pyarrow package") from e
+        return pyarrow
+
+    @classmethod
+    def get_arrow_schema(cls, pyarrow: Any) -> Any:
+        return pyarrow.schema(
+            [
+                pyarrow.field("s_no", pyarrow.string(), nullable=False),
+                pyarrow.field("product_name", pyarrow.string(), nullable=False),
+                pyarrow.field("input_image_urls", pyarrow.list_(pyarrow.string()), nullable=False),
+                pyarrow.field("output_image_urls", pyarrow.list_(pyarrow.string()), nullable=False),
+            ]
+        )
+
+    @classmethod
+    def build_record_batch(cls, pyarrow: Any, schema: Any, product_page: List[Any]) -> Any:
+        # one column at a time, arrow builds each array from a plain list in C
+        columns = list(zip(*product_page))
+        return pyarrow.RecordBatch.from_arrays(
+            [
+                pyarrow.array(columns[0], type=pyarrow.string()),
+                pyarrow.array(columns[1], type=pyarrow.string()),
+                pyarrow.array(
+                    [urls or [] for urls in columns[2]], type=pyarrow.list_(pyarrow.string())
+                ),
+                pyarrow.array(
+                    [urls or [] for urls in columns[3]], type=pyarrow.list_(pyarrow.string())
+                ),
+            ],
+            schema=schema,
+        )
+
+    @classmethod
+    def iter_arrow_stream(cls, pyarrow: Any, product_pages: Iterator[List[Any]]) -> Iterator[bytes]:
+        schema = cls.get_arrow_schema(pyarrow)
+        sink = ExportChunkSink()
+        with pyarrow.ipc.new_stream(sink, schema) as stream_writer:
+            for product_page in product_pages:
+                stream_writer.write_batch(cls.build_record_batch(pyarrow, schema, product_page))
+                yield sink.drain()
+        yield sink.drain()
+
+    @classmethod
+    def iter_parquet(cls, pyarrow: Any, product_pages: Iterator[List[Any]]) -> Iterator[bytes]:
+        from pyarrow import parquet
+
+        schema = cls.get_arrow_schema(pyarrow)
+        sink = ExportChunkSink()
+        with parquet.ParquetWriter(sink, schema, compression="snappy") as parquet_writer:
+            for product_page in product_pages:
+                parquet_writer.write_batch(cls.build_record_batch(pyarrow, schema, product_page))
+                yield sink.drain()
+        # the footer with the row group offsets is written when the writer closes
+        yield sink.drain()
@@ -0,0 +1,177 @@
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, Iterator, Optional
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class BlobInfo:
+    key: str
+    size_bytes: int
+
+
+class BlobStore:
+    """
+    local content addressed store, a blob's key is the sha256 of its content and the blob lives
+    at <root>/<key[0:2]>/<key[2:4]>/<key>
+    blobs are written and read in chunks of chunk_size and never held in memory as a whole,
+    storing the same content twice keeps a single copy
+    """
+
+    def __init__(self, root_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.root_path = root_path
+        self.chunk_size = chunk_size
+        self.temporary_path = os.path.join(root_path, "tmp")
+        os.makedirs(self.temporary_path, exist_ok=True)
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.root_path, key[0:2], key[2:4], key)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.get_path(key))
+
+    def open_writer(self, on_chunk: Optional[Callable[[bytes], None]] = None) -> "BlobWriter":
+        return BlobWriter(blob_store=self, on_chunk=on_chunk)
+
+    def put_stream(
+        self, stream: BinaryIO, on_chunk: Optional[Callable[[bytes], None]] = None
+    ) -> BlobInfo:
+        """
+        copies the stream into the store chunk by chunk, see BlobWriter
+        """
+        with self.open_writer(on_chunk=on_chunk) as blob_writer:
+            for chunk in iter(lambda: stream.read(self.chunk_size), b""):
+                blob_writer.write(chunk)
+            return blob_writer.commit()
+
+    def commit_file(self, temporary_file_path: str, key: str) -> None:
+        blob_path = self.get_path(key)
+        if os.path.exists(blob_path):
+            os.remove(temporary_file_path)
+        else:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(temporary_file_path, blob_path)
+
+    def open(self, key: str) -> BinaryIO:
+        try:
+            return open(self.get_path(key), "rb")
+        except FileNotFoundError:
+            raise ValueError(f"No blob found for key = {key}")
+
+    def iter_chunks(self, key: str) -> Iterator[bytes]:
+        with self.open(key) as blob_file:
+            for chunk in iter(lambda: blob_file.read(self.chunk_size), b""):
+                yield chunk
+
+    @contextmanager
+    def open_mmap(self, key: str) -> Iterator[mmap.mmap]:
+        with self.open(key) as blob_file:
+            with mmap.mmap(blob_file.fileno(), 0, access=mmap.ACCESS_READ) as blob_buffer:
+                yield blob_buffer
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.get_path(key))
+        except FileNotFoundError:
+            pass
+
+
+class BlobWriter:
+    """
+    file like object that writes a new blob to a temporary file, hashing and counting the bytes
+    as they are written, on_chunk sees every written chunk so callers can compute more on the
+    same single pass
+    it can be read back and seeked like the temporary file it wraps, so it also works as the
+    stream werkzeug parses an uploaded file into
+    commit fsyncs the file before renaming it into place, so a returned key is durable
+    a writer closed without a commit leaves nothing behind
+    """
+
+    def __init__(self, blob_store: BlobStore, on_chunk: Optional[Callable[[bytes], None]] = None):
+        self.blob_store = blob_store
+        self.on_chunk = on_chunk
+        self.size_bytes = 0
+        self.blob_info: Optional[BlobInfo] = None
+
+        self._content_hash = hashlib.sha256()
+        handle, self._temporary_file_path = tempfile.mkstemp(dir=blob_store.temporary_path)
+        self._file = os.fdopen(handle, "w+b")
+
+    def write(self, chunk: bytes) -> int:
+        if self.blob_info is not None:
+            raise RuntimeError(f"blob {self.blob_info.key} is already committed")
+        self._content_hash.update(chunk)
+        self.size_bytes += len(chunk)
+        if self.on_chunk is not None:
+            self.on_chunk(chunk)
+        return self._file.write(chunk)
+
+    def read(self, size: int = -1) -> bytes:
+        return self._file.read(size)
+
+    def readline(self, size: int = -1) -> bytes:
+        return self._file.readline(size)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self._file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def readable(self) -> bool:
+        return True
+
+    def writable(self) -> bool:
+        return self.blob_info is None
+
+    def seekable(self) -> bool:
+        return True
+
+    def commit(self) -> BlobInfo:
+        if self.blob_info is None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            key = self._content_hash.hexdigest()
+            self.blob_store.commit_file(temporary_file_path=self._temporary_file_path, key=key)
+            self.blob_info = BlobInfo(key=key, size_bytes=self.size_bytes)
+        return self.blob_info
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+        if self.blob_info is None and os.path.exists(self._temporary_file_path):
+            os.remove(self._temporary_file_path)
+
+    @property
+    def closed(self) -> bool:
+        return self._file.closed
+
+    def __enter__(self) -> "BlobWriter":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
+_blob_store: Optional[BlobStore] = None
+_blob_store_lock = threading.Lock()
+
+
+def get_blob_store() -> BlobStore:
+    global _blob_store
+    with _blob_store_lock:
+        if _blob_store is None:
+            project_root = os.path.dirname(
+                os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            )
+            _blob_store = BlobStore(
+                root_path=os.getenv("BLOB_STORE_PATH", os.path.join(project_root, "blobs")),
+                chunk_size=int(os.getenv("BLOB_STORE_CHUNK_SIZE", str(DEFAULT_CHUNK_SIZE))),
+            )
+        return _blob_store
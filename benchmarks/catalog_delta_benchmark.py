@@ -0,0 +1,120 @@
+"""
+Cost of a delta upload against the full ingest of the same catalogue.
+
+Generates a catalogue of --rows products and a copy of it with --changed-percent of the products
+renamed, applies the catalogue to an empty supplier catalogue, the full ingest, and then applies
+the copy, the delta, both through CsvDeltaUploadService.apply_csv_to_catalog on a throwaway
+sqlite database. The plain ingest of the catalogue, into PRODUCTS, is timed as well. The image
+processor runs in process, --image-latency-ms stands in for the round trip of a real one.
+
+    python -m benchmarks.catalog_delta_benchmark --rows 200000 --changed-percent 1
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+
+BENCHMARK_DIRECTORY = tempfile.mkdtemp(prefix="catalog_delta_benchmark_")
+# query_manager creates its engine on import, the benchmark gets a database of its own
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(BENCHMARK_DIRECTORY, 'benchmark.db')}"
+os.environ.setdefault("BLOB_STORE_PATH", os.path.join(BENCHMARK_DIRECTORY, "blobs"))
+os.environ.setdefault("CSV_ERROR_REPORT_PATH", os.path.join(BENCHMARK_DIRECTORY, "errors"))
+# every image is processed, the results of the full ingest are not served from the cache
+os.environ.setdefault("IMAGE_CACHE_ENABLED", "false")
+
+from werkzeug.datastructures import FileStorage  # noqa: E402
+
+from app.database import query_manager  # noqa: E402
+from app.database.models.catalog_product_model import CatalogProductModel  # noqa: E402
+from app.services.csv_delta_upload_service import CsvDeltaUploadService  # noqa: E402
+from app.services.csv_service import CsvService, CsvUploadService  # noqa: E402
+from app.services.csv_stream_reader import CsvStreamReader  # noqa: E402
+
+SUPPLIER_ID = "benchmark"
+
+
+def generate_csv(row_count: int, changed_every: int = 0) -> bytes:
+    csv_output = io.StringIO()
+    writer = csv.writer(csv_output)
+    writer.writerow(["S.No", "Product Name", "Input Image Urls"])
+    for row_number in range(row_count):
+        is_changed = changed_every and row_number % changed_every == 0
+        writer.writerow(
+            [
+                row_number,
+                f"product {row_number}{' v2' if is_changed else ''}",
+                f"https://images.example.com/{row_number}/front.jpg",
+            ]
+        )
+    return csv_output.getvalue().encode("utf-8")
+
+
+def count_rows_written_since(written_after: datetime) -> int:
+    # a re-upload keeps the id of its file, so the rows it wrote are told apart by updated_at
+    return query_manager.count_with_filter(
+        filters=CatalogProductModel.updated_at >= written_after, model=CatalogProductModel
+    )
+
+
+def measure_delta(csv_content: bytes) -> Dict[str, Any]:
+    csv_model = CsvService.insert_csv_to_db(
+        csv_file=FileStorage(io.BytesIO(csv_content), "catalogue.csv"), supplier_id=SUPPLIER_ID
+    )
+    applied_at = datetime.now()
+    started_at = time.perf_counter()
+    CsvDeltaUploadService.apply_csv_to_catalog(csv_model=csv_model)
+    elapsed = time.perf_counter() - started_at
+    return {
+        "seconds": round(elapsed, 3),
+        "rows_written": count_rows_written_since(applied_at),
+    }
+
+
+def measure_plain(csv_content: bytes) -> Dict[str, Any]:
+    csv_model = CsvService.insert_csv_to_db(
+        csv_file=FileStorage(io.BytesIO(csv_content), "catalogue.csv")
+    )
+    started_at = time.perf_counter()
+    CsvUploadService.create_products_from_csv(
+        csv_rows=CsvStreamReader.iter_rows_from_csv_model(csv_model=csv_model),
+        csv_file_id=csv_model.id,
+    )
+    return {"seconds": round(time.perf_counter() - started_at, 3)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--changed-percent", type=float, default=1.0)
+    parser.add_argument("--image-latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    os.environ["IMAGE_IN_PROCESS_LATENCY_SECONDS"] = str(args.image_latency_ms / 1000)
+
+    changed_every = max(round(100 / args.changed_percent), 1)
+    catalogue = generate_csv(args.rows)
+    changed_catalogue = generate_csv(args.rows, changed_every=changed_every)
+
+    results: Dict[str, Any] = {
+        "rows": args.rows,
+        "changed_rows": len(range(0, args.rows, changed_every)),
+    }
+    results["plain_ingest"] = measure_plain(catalogue)
+    results["delta_full_ingest"] = measure_delta(catalogue)
+    results["delta_changed"] = measure_delta(changed_catalogue)
+    results["delta_unchanged"] = measure_delta(changed_catalogue)
+    results["delta_changed_cost_of_full_ingest"] = round(
+        results["delta_changed"]["seconds"] / results["delta_full_ingest"]["seconds"], 4
+    )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+"""
+End-to-end benchmark of the csv api: upload, ingestion, polling, product pages and download.
+
+For every combination of --rows, --image-urls and --duplicate-rates a synthetic catalogue csv is
+generated from a fixed seed and run against the flask app in a child process of its own, with a
+fresh SQLite database (a temp file, or in memory with --database memory), blob store and export
+directory. The child reports per endpoint the throughput, p50/p99 latency and the peak RSS seen
+while that endpoint was being called, plus the end-to-end ingestion time of the upload.
+
+A duplicate rate of 0.2 makes one row in five repeat an earlier row, SNO and image urls included.
+Results are written as JSON, --compare prints the change against an earlier results file.
+
+    python -m benchmarks.csv_api_benchmark --rows 10000 100000 --output results.json
+    python -m benchmarks.csv_api_benchmark --rows 1000000 --image-urls 1 4 --compare results.json
+"""
+
+import argparse
+import csv
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+SEED = 20240601
+RSS_SAMPLE_INTERVAL_SECONDS = 0.01
+
+
+def generate_catalogue_csv(
+    path: str, row_count: int, image_urls_per_row: int, duplicate_rate: float
+) -> None:
+    generator = random.Random(SEED)
+    written_rows: List[List[str]] = []
+    with open(path, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["SNO", "Product_Name", "Input_image_urls"])
+        for row_number in range(1, row_count + 1):
+            if written_rows and generator.random() < duplicate_rate:
+                writer.writerow(generator.choice(written_rows))
+                continue
+
+            row = [str(row_number), f"product {row_number}"] + [
+                f"https://images.example.com/{row_number}/{image_number}.jpg"
+                for image_number in range(image_urls_per_row)
+            ]
+            writer.writerow(row)
+            # a bounded reservoir of earlier rows keeps 10M row files from living in memory
+            if len(written_rows) < 10000:
+                written_rows.append(row)
+            else:
+                written_rows[generator.randrange(len(written_rows))] = row
+
+
+def current_rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RssSampler:
+    """
+    samples the RSS of the process in a thread, ru_maxrss only knows the peak of the whole run
+    """
+
+    def __init__(self) -> None:
+        self.peak_bytes = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self.peak_bytes = max(self.peak_bytes, current_rss_bytes())
+            self._stopped.wait(RSS_SAMPLE_INTERVAL_SECONDS)
+
+    def __enter__(self) -> "RssSampler":
+        self.peak_bytes = current_rss_bytes()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._stopped.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, current_rss_bytes())
+
+
+def percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def measure_endpoint(call: Callable[[], int], request_count: int) -> Dict[str, Any]:
+    """
+    calls the endpoint request_count times, call returns the number of rows the request covered
+    """
+    latencies: List[float] = []
+    rows = 0
+    with RssSampler() as rss_sampler:
+        started_at = time.perf_counter()
+        for _ in range(request_count):
+            request_started_at = time.perf_counter()
+            rows += call()
+            latencies.append(time.perf_counter() - request_started_at)
+        elapsed = time.perf_counter() - started_at
+
+    latencies.sort()
+    return {
+        "requests": request_count,
+        "rows": rows,
+        "seconds": round(elapsed, 4),
+        "requests_per_second": round(request_count / elapsed, 2) if elapsed else None,
+        "rows_per_second": round(rows / elapsed, 2) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+        "peak_rss_bytes": rss_sampler.peak_bytes,
+    }
+
+
+def configure_environment(working_directory: str, database: str) -> None:
+    database_path = os.path.join(working_directory, "benchmark.db")
+    os.environ.update(
+        DATABASE_URL="sqlite:///:memory:" if database == "memory" else f"sqlite:///{database_path}",
+        BLOB_STORE_PATH=os.path.join(working_directory, "blobs"),
+        EXPORT_ARTIFACT_PATH=os.path.join(working_directory, "exports"),
+        CSV_JOB_PROFILE_PATH=os.path.join(working_directory, "profiles"),
+        CSV_JOB_POLL_INTERVAL_SECONDS=os.getenv("CSV_JOB_POLL_INTERVAL_SECONDS", "0.05"),
+        ACCESS_LOG_SAMPLE_RATE=os.getenv("ACCESS_LOG_SAMPLE_RATE", "0"),
+    )
+
+
+def run_scenario(scenario: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    runs in the child process, app.main is only imported once the environment points it at the
+    scenario's own database and directories
+    """
+    configure_environment(scenario["working_directory"], scenario["database"])
+    from app.main import app
+
+    client = app.test_client()
+    with open(scenario["csv_path"], "rb") as csv_file:
+        csv_content = csv_file.read()
+
+    def upload() -> str:
+        response = client.post(
+            "/csv",
+            data={"csv": (io.BytesIO(csv_content), "catalogue.csv")},
+            content_type="multipart/form-data",
+        )
+        if response.status_code != 201:
+            raise RuntimeError(f"upload failed with {response.status_code}: {response.data[:200]}")
+        return response.json["fileId"]
+
+    def poll(csv_file_id: str) -> Dict[str, Any]:
+        return client.get(f"/csv/{csv_file_id}").json["data"]
+
+    results: Dict[str, Any] = {}
+
+    # end to end: from the start of the upload until the job reports COMPLETED
+    with RssSampler() as rss_sampler:
+        started_at = time.perf_counter()
+        csv_file_id = upload()
+        upload_seconds = time.perf_counter() - started_at
+        while True:
+            status = poll(csv_file_id)
+            if status["status"] == "COMPLETED":
+                break
+            if status["status"] == "FAILED":
+                raise RuntimeError(f"ingestion failed: {status}")
+            if time.perf_counter() - started_at > scenario["ingest_timeout_seconds"]:
+                raise RuntimeError(f"ingestion did not finish in time: {status}")
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - started_at
+
+    results["ingest"] = {
+        "rows": status["count_rows"],
+        "rows_inserted": status["count_rows_inserted"],
+        "rows_failed": status["count_rows_failed"],
+        "upload_seconds": round(upload_seconds, 4),
+        "seconds": round(elapsed, 4),
+        "rows_per_second": round(status["count_rows"] / elapsed, 2) if elapsed else None,
+        "peak_rss_bytes": rss_sampler.peak_bytes,
+    }
+
+    request_count = scenario["requests"]
+    # the same content again, which is streamed, hashed and answered with the existing file
+    results["upload"] = measure_endpoint(lambda: upload() and 0, max(1, request_count // 10))
+    results["poll"] = measure_endpoint(lambda: poll(csv_file_id) and 0, request_count)
+
+    page_size = scenario["page_size"]
+    products_cursor: Dict[str, Optional[str]] = {"next_cursor": None}
+
+    def get_products_page() -> int:
+        query = f"limit={page_size}"
+        if products_cursor["next_cursor"] is not None:
+            query += f"&cursor={products_cursor['next_cursor']}"
+        page = client.get(f"/csv/{csv_file_id}/products?{query}").json["data"]
+        # start over from the first page once the last one was read
+        products_cursor["next_cursor"] = page["next_cursor"]
+        return len(page["products"])
+
+    results["products"] = measure_endpoint(get_products_page, request_count)
+
+    def download() -> int:
+        response = client.get(f"/csvdownload/{csv_file_id}")
+        if response.status_code != 200:
+            raise RuntimeError(f"download failed with {response.status_code}")
+        return status["count_rows_inserted"]
+
+    results["download"] = measure_endpoint(download, max(1, request_count // 10))
+    results["process_peak_rss_bytes"] = peak_rss_bytes()
+    return results
+
+
+def get_git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], check=True, capture_output=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def iter_scenarios(args: argparse.Namespace) -> Iterator[Dict[str, Any]]:
+    for row_count, image_urls_per_row, duplicate_rate in itertools.product(
+        args.rows, args.image_urls, args.duplicate_rates
+    ):
+        yield {
+            "rows": row_count,
+            "image_urls_per_row": image_urls_per_row,
+            "duplicate_rate": duplicate_rate,
+            "database": args.database,
+            "requests": args.requests,
+            "page_size": args.page_size,
+            "ingest_timeout_seconds": args.ingest_timeout_seconds,
+        }
+
+
+def get_scenario_name(scenario: Dict[str, Any]) -> str:
+    return (
+        f"rows={scenario['rows']},image_urls={scenario['image_urls_per_row']},"
+        f"duplicate_rate={scenario['duplicate_rate']},database={scenario['database']}"
+    )
+
+
+def run_scenario_in_child_process(scenario: Dict[str, Any]) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory(prefix="csv_api_benchmark_") as working_directory:
+        csv_path = os.path.join(working_directory, "catalogue.csv")
+        generate_catalogue_csv(
+            path=csv_path,
+            row_count=scenario["rows"],
+            image_urls_per_row=scenario["image_urls_per_row"],
+            duplicate_rate=scenario["duplicate_rate"],
+        )
+        child_scenario = {
+            **scenario,
+            "csv_path": csv_path,
+            "working_directory": working_directory,
+        }
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.csv_api_benchmark"]
+            + ["--scenario", json.dumps(child_scenario)],
+            check=True,
+            # the child's logs and errors go straight to the terminal
+            stdout=subprocess.PIPE,
+            text=True,
+        ).stdout
+        return {
+            "csv_size_bytes": os.path.getsize(csv_path),
+            **json.loads(output.strip().splitlines()[-1]),
+        }
+
+
+def compare_results(previous: Dict[str, Any], current: Dict[str, Any]) -> List[str]:
+    lines = []
+    compared_metrics = ("rows_per_second", "requests_per_second", "p50_ms", "p99_ms")
+    for scenario_name, scenario_results in current["scenarios"].items():
+        previous_results = previous.get("scenarios", {}).get(scenario_name)
+        if previous_results is None:
+            lines.append(f"{scenario_name}: not in the previous run")
+            continue
+        for endpoint, endpoint_results in scenario_results.items():
+            if not isinstance(endpoint_results, dict):
+                continue
+            for metric in compared_metrics + ("peak_rss_bytes",):
+                before = previous_results.get(endpoint, {}).get(metric)
+                after = endpoint_results.get(metric)
+                if not before or after is None:
+                    continue
+                lines.append(
+                    f"{scenario_name} {endpoint} {metric}: {before} -> {after} "
+                    f"({(after - before) / before * 100:+.1f}%)"
+                )
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000])
+    parser.add_argument("--image-urls", type=int, nargs="+", default=[2])
+    parser.add_argument("--duplicate-rates", type=float, nargs="+", default=[0.0])
+    parser.add_argument("--database", choices=["file", "memory"], default="file")
+    parser.add_argument("--requests", type=int, default=200, help="calls per read endpoint")
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--ingest-timeout-seconds", type=float, default=3600)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        print(json.dumps(run_scenario(json.loads(args.scenario))))
+        # the app's worker pool and image processor are not waited for
+        sys.stdout.flush()
+        os._exit(0)
+
+    results: Dict[str, Any] = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "git_revision": get_git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": SEED,
+        "scenarios": {},
+    }
+    for scenario in iter_scenarios(args):
+        scenario_name = get_scenario_name(scenario)
+        print(f"running {scenario_name}", file=sys.stderr)
+        results["scenarios"][scenario_name] = run_scenario_in_child_process(scenario)
+
+    rendered = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(rendered + "\n")
+    print(rendered)
+
+    if args.compare:
+        with open(args.compare) as previous_file:
+            previous = json.load(previous_file)
+        print("\n".join(compare_results(previous, results)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
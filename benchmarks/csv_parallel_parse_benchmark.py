@@ -0,0 +1,133 @@
+"""
+Throughput of parsing a large csv in the job worker versus in its pool of parse processes.
+
+Generates a catalogue csv of the requested size (256 MB by default) and turns it into product
+insert rows, parsing, validating and building the rows the way ingestion does but without
+writing them, first in the calling process like a file below CSV_PARALLEL_PARSE_MIN_BYTES and
+then through CsvShardService.iter_transformed_shards with each of the --workers counts. The
+parse pool of a worker outlives its files, so every count is run once to start its pool, which
+is reported as pool_start_seconds, before it is timed over --repeat runs.
+
+    python -m benchmarks.csv_parallel_parse_benchmark --size-mb 256 --workers 1 2 4 8
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from functools import partial
+from typing import Any, Dict, List
+
+# query_manager creates its engine on import, the benchmark never touches the database
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+
+from app.services.csv_row_validator import CsvHeaderMapping, CsvRowValidator  # noqa: E402
+from app.services.csv_service import CsvUploadService  # noqa: E402
+from app.services.csv_shard_service import CsvShardService  # noqa: E402
+from app.services.csv_stream_reader import CsvStreamReader  # noqa: E402
+from benchmarks.csv_stream_memory_benchmark import generate_csv  # noqa: E402
+
+CSV_FILE_ID = "csv_0123456789"
+BATCH_SIZE = 1000
+
+
+def get_row_validator(path: str) -> CsvRowValidator:
+    with open(path, "rb") as csv_file:
+        header_row = next(CsvStreamReader.iter_rows_from_stream(binary_stream=csv_file))
+    return CsvRowValidator(header_mapping=CsvHeaderMapping.from_header_row(header_row))
+
+
+def run_serial(path: str) -> int:
+    row_validator = get_row_validator(path)
+    rows = 0
+    with open(path, "rb") as csv_file:
+        csv_rows = CsvStreamReader.iter_rows_from_stream(binary_stream=csv_file)
+        next(csv_rows, None)
+        for rows_batch in CsvStreamReader.iter_batches(csv_rows, batch_size=BATCH_SIZE):
+            rows += len(
+                CsvUploadService.build_product_insert_rows(
+                    csv_rows=rows_batch, csv_file_id=CSV_FILE_ID, row_validator=row_validator
+                )
+            )
+    return rows
+
+
+def run_parallel(path: str) -> int:
+    rows_transformer = partial(
+        CsvUploadService.build_product_insert_rows, row_validator=get_row_validator(path)
+    )
+    return sum(
+        len(product_rows)
+        for product_rows in CsvShardService.iter_transformed_shards(
+            csv_path=path, csv_file_id=CSV_FILE_ID, rows_transformer=rows_transformer
+        )
+    )
+
+
+def time_runs(run: Any, path: str, repeat: int) -> Dict[str, Any]:
+    timings: List[float] = []
+    rows = 0
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        rows = run(path)
+        timings.append(time.perf_counter() - started_at)
+    seconds = min(timings)
+    return {
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds) if seconds else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--path", help="reuse an existing csv instead of generating one")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--shard-mb", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    os.environ["CSV_PARSE_SHARD_BYTES"] = str(args.shard_mb * 1024 * 1024)
+    path = args.path
+    generated = False
+    if path is None:
+        handle, path = tempfile.mkstemp(suffix=".csv")
+        os.close(handle)
+        generate_csv(path, args.size_mb * 1024 * 1024)
+        generated = True
+
+    results: Dict[str, Any] = {"file_size_bytes": os.path.getsize(path), "cpus": os.cpu_count()}
+    try:
+        serial = time_runs(run_serial, path, args.repeat)
+        results["serial"] = serial
+        results["parallel"] = []
+        for workers in args.workers:
+            os.environ["CSV_PARALLEL_PARSE_WORKERS"] = str(workers)
+            started_at = time.perf_counter()
+            run_parallel(path)
+            pool_start_seconds = time.perf_counter() - started_at
+            parallel = time_runs(run_parallel, path, args.repeat)
+            results["parallel"].append(
+                {
+                    "workers": workers,
+                    **parallel,
+                    "pool_start_seconds": round(pool_start_seconds - parallel["seconds"], 3),
+                    "speedup": (
+                        round(serial["seconds"] / parallel["seconds"], 2)
+                        if parallel["seconds"]
+                        else None
+                    ),
+                }
+            )
+            CsvShardService.shutdown_parse_pool()
+    finally:
+        if generated:
+            os.remove(path)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Peak memory benchmark for the streaming csv reader.
+
+Generates a catalogue csv of the requested size (1 GB by default) and parses it in a child
+process, once with the streaming reader feeding fixed-size batches and optionally once the old
+way (decode, splitlines and materialise List[List[str]]). Every mode runs in its own process so
+that its peak RSS can be read back from ru_maxrss without the other mode polluting it.
+
+    python -m benchmarks.csv_stream_memory_benchmark --size-mb 1024
+    python -m benchmarks.csv_stream_memory_benchmark --size-mb 256 --compare-materialised
+"""
+
+import argparse
+import csv
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from app.services.csv_stream_reader import CsvStreamReader
+
+BATCH_SIZE = 1000
+
+
+def generate_csv(path: str, size_bytes: int) -> int:
+    row_count = 0
+    with open(path, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["SNO", "Product_Name", "Input_image_urls"])
+        while csv_file.tell() < size_bytes:
+            for _ in range(BATCH_SIZE):
+                row_count += 1
+                writer.writerow(
+                    [
+                        row_count,
+                        f"product {row_count}",
+                        f"https://images.example.com/{row_count % 5000}/front.jpg",
+                        f"https://images.example.com/{row_count % 5000}/back.jpg",
+                    ]
+                )
+    return row_count
+
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_streaming(path: str) -> int:
+    rows = 0
+    with open(path, "rb") as csv_file:
+        csv_rows = CsvStreamReader.iter_rows_from_stream(binary_stream=csv_file)
+        next(csv_rows, None)
+        for rows_batch in CsvStreamReader.iter_batches(csv_rows, batch_size=BATCH_SIZE):
+            rows += len(rows_batch)
+    return rows
+
+
+def run_materialised(path: str) -> int:
+    with open(path, "rb") as csv_file:
+        csv_content = csv_file.read()
+    decoded_content = csv_content.decode("utf-8").splitlines()
+    csv_data = [row for row in csv.reader(decoded_content)]
+    return len(csv_data) - 1
+
+
+def run_mode(mode: str, path: str) -> None:
+    started_at = time.perf_counter()
+    rows = run_streaming(path) if mode == "stream" else run_materialised(path)
+    elapsed = time.perf_counter() - started_at
+    print(
+        json.dumps(
+            {
+                "mode": mode,
+                "rows": rows,
+                "seconds": round(elapsed, 3),
+                "rows_per_second": round(rows / elapsed) if elapsed else None,
+                "peak_rss_bytes": peak_rss_bytes(),
+            }
+        )
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size-mb", type=int, default=1024)
+    parser.add_argument("--path", help="reuse an existing csv instead of generating one")
+    parser.add_argument("--compare-materialised", action="store_true")
+    parser.add_argument("--mode", choices=["stream", "materialised"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.path)
+        return
+
+    path = args.path
+    generated = False
+    if path is None:
+        handle, path = tempfile.mkstemp(suffix=".csv")
+        os.close(handle)
+        generate_csv(path, args.size_mb * 1024 * 1024)
+        generated = True
+
+    modes = ["stream"] + (["materialised"] if args.compare_materialised else [])
+    results = {"file_size_bytes": os.path.getsize(path), "runs": []}
+    try:
+        for mode in modes:
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.csv_stream_memory_benchmark"]
+                + ["--mode", mode, "--path", path],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            results["runs"].append(json.loads(output.strip().splitlines()[-1]))
+    finally:
+        if generated:
+            os.remove(path)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
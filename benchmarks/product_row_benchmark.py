@@ -0,0 +1,149 @@
+"""
+Per row CPU and memory of building products for insertion.
+
+Compares the ORM path the ingestion used to take, a ProductModel built through
+CreateProductQueryModel and turned into insert parameters by get_column_values_of_object, with
+ProductInsertRow and its to_insert_parameters. The time is measured over --rows rows, the memory
+as the blocks and bytes tracemalloc sees allocated, and still held, by one batch of products.
+The ids alone are timed one row at a time and a batch at a time, with every ID_HASH_ALGORITHM.
+
+    python -m benchmarks.product_row_benchmark --rows 100000
+"""
+
+import argparse
+import gc
+import json
+import os
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+# query_manager creates its engine on import, the benchmark never touches the database
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+
+from app.database import id_generator, query_manager  # noqa: E402
+from app.database.models.product import ProductInsertRow, ProductModel  # noqa: E402
+from app.database.query_models.product_query_model import CreateProductQueryModel  # noqa: E402
+from app.services.csv_service import CsvUploadService  # noqa: E402
+
+CSV_FILE_ID = "csv_0123456789"
+BATCH_SIZE = 1000
+
+
+def build_single_product(csv_row: List[str]) -> ProductModel:
+    """
+    the product model the ingestion used to build for every csv row
+    """
+    create_product_query_model = CreateProductQueryModel(
+        s_no=csv_row[0],
+        csv_file_id=CSV_FILE_ID,
+        product_name=csv_row[1],
+        input_image_urls=csv_row[2:],
+        output_image_urls=[],
+    )
+    return ProductModel(create_product_request_model=create_product_query_model)
+
+
+def build_orm_row(csv_row: List[str]) -> Dict[str, Any]:
+    return query_manager.get_column_values_of_object(build_single_product(csv_row))
+
+
+def build_insert_row(csv_row: List[str]) -> ProductInsertRow:
+    return CsvUploadService.build_product_insert_row(
+        csv_row=csv_row, csv_file_id=CSV_FILE_ID, created_at=datetime.now()
+    )
+
+
+def build_insert_parameters(csv_row: List[str]) -> Dict[str, Any]:
+    return build_insert_row(csv_row).to_insert_parameters()
+
+
+def generate_rows(row_count: int) -> List[List[str]]:
+    return [
+        [
+            str(row_number),
+            f"product {row_number}",
+            f"https://images.example.com/{row_number}/front.jpg",
+            f"https://images.example.com/{row_number}/back.jpg",
+        ]
+        for row_number in range(row_count)
+    ]
+
+
+def measure(build: Callable[[List[str]], Any], csv_rows: List[List[str]]) -> Dict[str, Any]:
+    gc.collect()
+    started_at = time.perf_counter()
+    for csv_row in csv_rows:
+        build(csv_row)
+    elapsed = time.perf_counter() - started_at
+
+    batch = csv_rows[:BATCH_SIZE]
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    built_rows = [build(csv_row) for csv_row in batch]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocations = after.compare_to(before, "filename")
+    del built_rows
+
+    return {
+        "rows": len(csv_rows),
+        "seconds": round(elapsed, 4),
+        "microseconds_per_row": round(elapsed / len(csv_rows) * 1_000_000, 3),
+        "held_bytes_per_row": round(
+            sum(statistic.size_diff for statistic in allocations) / len(batch), 1
+        ),
+        "held_blocks_per_row": round(
+            sum(statistic.count_diff for statistic in allocations) / len(batch), 2
+        ),
+    }
+
+
+def measure_ids(csv_rows: List[List[str]]) -> Dict[str, Any]:
+    results = {}
+    for algorithm in id_generator.ID_HASH_ALGORITHMS:
+        os.environ["ID_HASH_ALGORITHM"] = algorithm
+        id_generator.get_hash_algorithm.cache_clear()
+        started_at = time.perf_counter()
+        for csv_row in csv_rows:
+            ProductModel.get_id_for_product(s_no=csv_row[0], csv_file_id=CSV_FILE_ID)
+        per_row_elapsed = time.perf_counter() - started_at
+
+        started_at = time.perf_counter()
+        for batch_start in range(0, len(csv_rows), BATCH_SIZE):
+            ProductModel.get_ids_for_products(
+                (csv_row[0], CSV_FILE_ID)
+                for csv_row in csv_rows[batch_start : batch_start + BATCH_SIZE]
+            )
+        batch_elapsed = time.perf_counter() - started_at
+
+        results[algorithm] = {
+            "per_row_microseconds_per_id": round(per_row_elapsed / len(csv_rows) * 1_000_000, 3),
+            "batch_microseconds_per_id": round(batch_elapsed / len(csv_rows) * 1_000_000, 3),
+        }
+    os.environ.pop("ID_HASH_ALGORITHM")
+    id_generator.get_hash_algorithm.cache_clear()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    csv_rows = generate_rows(args.rows)
+    results = {
+        "orm_model": measure(build_orm_row, csv_rows),
+        "product_insert_row": measure(build_insert_row, csv_rows),
+        "product_insert_row_to_insert_parameters": measure(build_insert_parameters, csv_rows),
+        "ids": measure_ids(csv_rows),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+from app.asgi import application
+
+if __name__ == "__main__":
+    try:
+        import uvicorn
+    except ImportError as e:
+        raise RuntimeError("serving the asgi application needs an ASGI server, e.g. uvicorn") from e
+
+    uvicorn.run(application, port=4000)
@@ -0,0 +1,58 @@
+import os
+import tempfile
+
+# query_manager creates its engine and tables on import, so the environment is set up before
+# any app module is imported
+TEST_DIRECTORY = tempfile.mkdtemp(prefix="csv_tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(TEST_DIRECTORY, 'test.db')}"
+os.environ["BLOB_STORE_PATH"] = os.path.join(TEST_DIRECTORY, "blobs")
+os.environ["CSV_ERROR_REPORT_PATH"] = os.path.join(TEST_DIRECTORY, "error_reports")
+os.environ["EXPORT_ARTIFACT_PATH"] = os.path.join(TEST_DIRECTORY, "exports")
+os.environ["IMAGE_CACHE_ENABLED"] = "false"
+# importing app.main starts the worker pool, tests run their jobs themselves
+os.environ["CSV_WORKER_POOL_SIZE"] = "0"
+
+import io  # noqa: E402
+from typing import Callable, Iterator, Optional  # noqa: E402
+
+import pytest  # noqa: E402
+from flask.testing import FlaskClient  # noqa: E402
+from werkzeug.datastructures import FileStorage  # noqa: E402
+
+from app.database.models.base import Base  # noqa: E402
+from app.database.models.csv_model import CsvModel  # noqa: E402
+from app.database.query_manager import database_engine  # noqa: E402
+from app.services.csv_service import CsvService  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def empty_database() -> Iterator[None]:
+    """
+    every test starts from empty tables, jobs left by one test are never claimed by the next
+    """
+    yield
+    with database_engine.begin() as connection:
+        for table in reversed(Base.metadata.sorted_tables):
+            connection.execute(table.delete())
+
+
+@pytest.fixture
+def store_csv() -> Callable[..., CsvModel]:
+    """
+    stores csv content the way an upload does, without queueing a job for it
+    """
+
+    def store(content: str, supplier_id: Optional[str] = None) -> CsvModel:
+        return CsvService.insert_csv_to_db(
+            csv_file=FileStorage(io.BytesIO(content.encode("utf-8")), "test.csv"),
+            supplier_id=supplier_id,
+        )
+
+    return store
+
+
+@pytest.fixture
+def client() -> FlaskClient:
+    from app.main import app
+
+    return app.test_client()
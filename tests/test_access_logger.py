@@ -0,0 +1,137 @@
+import io
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+import pytest
+from flask.testing import FlaskClient
+
+from app import access_logger as access_logger_module
+from app.access_logger import AccessLogger, access_logger
+
+
+@pytest.mark.parametrize(
+    "mimetype, content_length, data, logged_body",
+    [
+        ("application/json", 13, b'{"s_no": "1"}', '{"s_no": "1"}'),
+        # capped at max_body_bytes, the full size is kept
+        (
+            "application/json",
+            40,
+            b'{"product_name": "a long name"}',
+            '{"product_name":... <40 bytes>',
+        ),
+        ("multipart/form-data", 2048, b"--boundary", "<2048 bytes of multipart/form-data>"),
+        ("text/csv", 30, b"s_no,product_name", "<30 bytes of text/csv>"),
+        ("application/octet-stream", 9, b"\x00\x01", "<9 bytes of application/octet-stream>"),
+        ("image/png", 100, b"\x89PNG", "<100 bytes of image/png>"),
+        ("video/mp4", 100, b"\x00", "<100 bytes of video/mp4>"),
+        # a body that could not be read without buffering it
+        ("application/json", 5000, None, "<5000 bytes of application/json>"),
+        ("application/json", None, None, "<0 bytes of application/json>"),
+    ],
+)
+def test_bodies_are_capped_and_files_are_left_out(
+    mimetype: str, content_length: Optional[int], data: Optional[bytes], logged_body: str
+) -> None:
+    access_logger = AccessLogger(sample_rate=1, max_body_bytes=16)
+
+    body = access_logger.get_body(mimetype=mimetype, content_length=content_length, data=data)
+
+    assert str(body) == logged_body
+
+
+def test_no_body_is_logged_when_the_cap_is_zero() -> None:
+    access_logger = AccessLogger(sample_rate=1, max_body_bytes=0)
+
+    body = access_logger.get_body(mimetype="application/json", content_length=2, data=b"{}")
+
+    assert str(body) == "<2 bytes of application/json>"
+
+
+def test_a_sample_of_the_requests_is_logged_and_every_server_error(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    access_logger = AccessLogger(sample_rate=0.25, max_body_bytes=1024)
+
+    monkeypatch.setattr(access_logger_module.random, "random", lambda: 0.2)
+    assert access_logger.should_log(200)
+    monkeypatch.setattr(access_logger_module.random, "random", lambda: 0.3)
+    assert not access_logger.should_log(200)
+    assert not access_logger.should_log(404)
+    assert access_logger.should_log(500)
+
+    monkeypatch.setattr(access_logger_module.logger, "isEnabledFor", lambda level: False)
+    assert not access_logger.should_log(500)
+
+
+class ReadCountingStream(io.BytesIO):
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.reads = 0
+
+    def read(self, *args: Any) -> bytes:
+        self.reads += 1
+        return super().read(*args)
+
+
+@pytest.fixture
+def get_access_records(
+    monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> Callable[[], List[Dict[str, Any]]]:
+    monkeypatch.setattr(access_logger, "sample_rate", 1.0)
+    monkeypatch.setattr(access_logger, "max_body_bytes", 16)
+    caplog.set_level(logging.INFO, logger=access_logger_module.logger.name)
+
+    def get() -> List[Dict[str, Any]]:
+        # the access record is the single argument of its log line
+        return [
+            record.args  # type: ignore[misc]
+            for record in caplog.records
+            if record.getMessage().startswith("Access:")
+        ]
+
+    return get
+
+
+def test_a_request_body_of_unknown_length_is_never_read(
+    client: FlaskClient, get_access_records: Callable[[], List[Dict[str, Any]]]
+) -> None:
+    request_stream = ReadCountingStream(b'{"s_no": "1"}')
+
+    response = client.post(
+        "/csv/csv_unknown",
+        input_stream=request_stream,
+        headers={"Content-Type": "application/json", "Transfer-Encoding": "chunked"},
+    )
+
+    assert response.status_code == 405
+    assert request_stream.reads == 0
+    assert "request_body" not in get_access_records()[-1]
+
+
+def test_a_small_request_body_and_the_response_are_logged(
+    client: FlaskClient, get_access_records: Callable[[], List[Dict[str, Any]]]
+) -> None:
+    response = client.post("/csv/csv_unknown", json={"s_no": "1"})
+
+    assert response.status_code == 405
+    access_record = get_access_records()[-1]
+    assert (access_record["method"], access_record["status_code"]) == ("POST", 405)
+    assert str(access_record["request_body"]) == '{"s_no": "1"}'
+    # the response is longer than the cap
+    assert str(access_record["response_body"]).endswith(f"... <{len(response.data)} bytes>")
+
+
+def test_a_large_request_body_is_not_read_for_the_log(
+    client: FlaskClient, get_access_records: Callable[[], List[Dict[str, Any]]]
+) -> None:
+    request_stream = ReadCountingStream(b"x" * 100)
+
+    client.post(
+        "/csv/csv_unknown",
+        input_stream=request_stream,
+        headers={"Content-Type": "application/json", "Content-Length": "100"},
+    )
+
+    assert request_stream.reads == 0
+    assert str(get_access_records()[-1]["request_body"]) == "<100 bytes of application/json>"
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import io
+from typing import Any, Callable, Dict, List, Tuple
+
+import pytest
+from flask.testing import FlaskClient
+from werkzeug.test import EnvironBuilder
+
+from app.database.models.csv_model import CsvModel
+from app.metrics import http_request_seconds
+from app.services.csv_job_service import CsvJobService
+from app.services.csv_service import CsvUploadService
+
+pytest.importorskip("asgiref")
+
+from app.asgi import application  # noqa: E402
+
+CSV_CONTENT = "S. No.,Product Name,Input Image Urls\n" + "".join(
+    f"{s_no},product {s_no},a.com/{s_no}.jpg\n" for s_no in range(1, 6)
+)
+# the headers both stacks must agree on, the others, like Date, may differ
+COMPARED_HEADERS = ["Content-Type", "Content-Encoding", "Content-Range", "ETag", "Vary"]
+
+Response = Tuple[int, Dict[str, str], bytes]
+
+
+def call_asgi(method: str, path: str, headers: Dict[str, str], body: bytes) -> Response:
+    path, _, query_string = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode("utf-8"),
+        "query_string": query_string.encode("utf-8"),
+        "root_path": "",
+        "headers": [
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in {
+                "Host": "localhost",
+                **({"Content-Length": str(len(body))} if body else {}),
+                **headers,
+            }.items()
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("localhost", 80),
+    }
+    # the body arrives in small pieces, like a slow upload
+    messages: List[Dict[str, Any]] = [
+        {"type": "http.request", "body": body[start : start + 100], "more_body": True}
+        for start in range(0, len(body), 100)
+    ] + [{"type": "http.request", "body": b"", "more_body": False}]
+    sent: List[Dict[str, Any]] = []
+
+    async def receive() -> Dict[str, Any]:
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message: Dict[str, Any]) -> None:
+        sent.append(message)
+
+    asyncio.run(application(scope, receive, send))
+
+    start = sent[0]
+    return (
+        start["status"],
+        {name.decode("latin-1"): value.decode("latin-1") for name, value in start["headers"]},
+        b"".join(message.get("body", b"") for message in sent[1:]),
+    )
+
+
+def call_wsgi(
+    client: FlaskClient, method: str, path: str, headers: Dict[str, str], body: bytes
+) -> Response:
+    response = client.open(path, method=method, headers=headers, data=body)
+    return response.status_code, dict(response.headers), response.get_data()
+
+
+def build_upload(content: str) -> Tuple[Dict[str, str], bytes]:
+    environ = EnvironBuilder(
+        method="POST", data={"csv": (io.BytesIO(content.encode("utf-8")), "products.csv")}
+    ).get_environ()
+    return {"Content-Type": environ["CONTENT_TYPE"]}, environ["wsgi.input"].read()
+
+
+def assert_same_response(
+    client: FlaskClient, method: str, path: str, headers: Dict[str, str], body: bytes = b""
+) -> Response:
+    asgi_response = call_asgi(method, path, headers, body)
+    wsgi_response = call_wsgi(client, method, path, headers, body)
+
+    assert asgi_response[0] == wsgi_response[0]
+    assert asgi_response[2] == wsgi_response[2]
+    for header in COMPARED_HEADERS:
+        assert {name.lower(): value for name, value in asgi_response[1].items()}.get(
+            header.lower()
+        ) == wsgi_response[1].get(header)
+    return asgi_response
+
+
+@pytest.fixture
+def uploaded_csv_id(client: FlaskClient) -> str:
+    headers, body = build_upload(CSV_CONTENT)
+
+    # the same file sent through either stack is the same upload
+    status, _, response_body = assert_same_response(client, "POST", "/csv", headers, body)
+    assert status == 201
+    assert CsvJobService.process_next_job(
+        worker_id="worker-a", job_handler=CsvUploadService.process_csv_job
+    )
+    return json.loads(response_body)["fileId"]
+
+
+@pytest.mark.parametrize(
+    "path, headers",
+    [
+        ("/csv/{csv_file_id}", {}),
+        ("/csv/{csv_file_id}/products?limit=2&fields=s_no,product_name", {}),
+        ("/csv/{csv_file_id}/products?limit=0", {}),
+        ("/csvdownload/{csv_file_id}", {}),
+        ("/csvdownload/{csv_file_id}", {"Accept-Encoding": "gzip"}),
+        ("/csvdownload/{csv_file_id}", {"Accept-Encoding": "gzip", "Range": "bytes=5-24"}),
+        ("/csvdownload/{csv_file_id}?format=ndjson", {}),
+        ("/csvdownload/{csv_file_id}", {"Accept": "application/x-ndjson"}),
+        ("/csv/csv_unknown", {}),
+        ("/csv/{csv_file_id}/no-such-route", {}),
+    ],
+)
+def test_both_stacks_answer_a_request_the_same(
+    client: FlaskClient, uploaded_csv_id: str, path: str, headers: Dict[str, str]
+) -> None:
+    assert_same_response(client, "GET", path.format(csv_file_id=uploaded_csv_id), headers)
+
+
+def test_both_stacks_agree_on_conditional_downloads(
+    client: FlaskClient, uploaded_csv_id: str
+) -> None:
+    path = f"/csvdownload/{uploaded_csv_id}"
+    _, headers, _ = call_asgi("GET", path, {"Accept-Encoding": "gzip"}, b"")
+
+    status, _, _ = assert_same_response(
+        client, "GET", path, {"Accept-Encoding": "gzip", "If-None-Match": headers["etag"]}
+    )
+
+    assert status == 304
+
+
+def test_an_upload_that_is_not_a_csv_is_rejected_by_both_stacks(client: FlaskClient) -> None:
+    headers, body = build_upload("S. No.,Description\n1,first\n")
+
+    status, _, _ = assert_same_response(client, "POST", "/csv", headers, body)
+
+    assert status == 400
+
+
+def test_requests_through_the_adapter_are_measured_by_route(
+    store_csv: Callable[..., CsvModel],
+) -> None:
+    csv_model = store_csv(CSV_CONTENT)
+
+    call_asgi("GET", f"/csv/{csv_model.id}/products", {}, b"")
+
+    assert any(
+        'route="/csv/<csv_file_id>/products"' in sample
+        for sample in http_request_seconds.render_samples()
+    )
@@ -0,0 +1,68 @@
+import gzip
+import io
+import tarfile
+import zipfile
+from typing import Dict, List, Tuple
+
+import pytest
+
+from app.services.csv_archive_reader import CsvArchiveReader
+
+MEMBERS: List[Tuple[str, bytes]] = [
+    ("first.csv", b"S. No.,Product Name,Input Image Urls\n1,first,a.com/1.jpg\n"),
+    ("nested/second.CSV", b"S. No.,Product Name,Input Image Urls\r2,second,a.com/2.jpg\r"),
+    ("readme.txt", b"not a csv"),
+    ("__MACOSX/._first.csv", b"resource fork"),
+    ("nested/.hidden.csv", b"editor leftovers"),
+]
+CSV_MEMBERS = {name: content for name, content in MEMBERS[:2]}
+
+
+def build_zip() -> bytes:
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zip_archive:
+        for name, content in MEMBERS:
+            zip_archive.writestr(name, content)
+    return archive.getvalue()
+
+
+def build_tar(mode: str) -> bytes:
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode=mode) as tar_archive:
+        for name, content in MEMBERS:
+            member = tarfile.TarInfo(name)
+            member.size = len(content)
+            tar_archive.addfile(member, io.BytesIO(content))
+    return archive.getvalue()
+
+
+def read_members(archive: bytes, archive_name: str) -> Dict[str, bytes]:
+    return {
+        name: member_stream.read()
+        for name, member_stream in CsvArchiveReader.iter_csv_members(
+            io.BytesIO(archive), archive_name=archive_name
+        )
+    }
+
+
+@pytest.mark.parametrize(
+    "archive, archive_name",
+    [
+        (build_zip(), "upload.zip"),
+        (build_tar("w"), "upload.tar"),
+        (build_tar("w:gz"), "upload.tar.gz"),
+    ],
+)
+def test_only_the_csv_files_of_an_archive_are_read(archive: bytes, archive_name: str) -> None:
+    assert read_members(archive, archive_name) == CSV_MEMBERS
+
+
+def test_a_gzip_file_holds_a_single_csv() -> None:
+    content = MEMBERS[0][1]
+
+    assert read_members(gzip.compress(content), "products.csv.gz") == {"products.csv": content}
+
+
+def test_anything_else_is_not_an_archive() -> None:
+    with pytest.raises(ValueError):
+        read_members(MEMBERS[0][1], "products.csv")
@@ -0,0 +1,147 @@
+from typing import Callable, Dict, List
+
+import pytest
+
+from app.database import query_manager
+from app.database.models.catalog_product_model import CatalogProductModel
+from app.database.models.csv_job_model import CsvJobStatus
+from app.database.models.csv_model import CsvModel
+from app.database.repository.csv_job_repository import CsvJobRepository
+from app.image_processing.image_backend import ImageBackend
+from app.image_processing.image_processor import AsyncImageProcessingEngine
+from app.services import csv_ingestion_service, csv_service
+from app.services.csv_error_report_service import CsvErrorReportService
+from app.services.csv_job_service import CsvJobService
+from app.services.csv_service import CsvUploadService
+
+SUPPLIER_ID = "acme"
+SUPPLIER_IDS = [None, SUPPLIER_ID, "globex"]
+DAY_ONE_ROWS = [f"{s_no},product {s_no},a.com/{s_no}.jpg" for s_no in range(1, 6)]
+
+
+class BrokenImageBackend(ImageBackend):
+    async def process_image(self, image_url: str) -> str:
+        if "broken" in image_url:
+            raise ValueError("404")
+        return image_url + "output"
+
+
+def build_csv(rows: List[str]) -> str:
+    return "S. No.,Product Name,Input Image Urls\n" + "".join(f"{row}\n" for row in rows)
+
+
+def apply_upload(store_csv: Callable[..., CsvModel], rows: List[str]) -> CsvModel:
+    """
+    uploads the rows as the supplier's catalogue and runs the job that applies them
+    """
+    csv_model = store_csv(build_csv(rows), supplier_id=SUPPLIER_ID)
+    CsvJobRepository.enqueue_csv_file(
+        csv_file_id=csv_model.id, total_rows=csv_model.row_count, requeue_completed=True
+    )
+    assert CsvJobService.process_next_job(
+        worker_id="worker-a", job_handler=CsvUploadService.process_csv_job
+    )
+    csv_job = CsvJobRepository.get_job_for_csv_file(csv_file_id=csv_model.id)
+    assert csv_job is not None and csv_job.status == CsvJobStatus.COMPLETED.value
+    return csv_model
+
+
+def get_catalog() -> Dict[str, CatalogProductModel]:
+    return {
+        catalog_product.s_no: catalog_product
+        for catalog_product in query_manager.query_with_filter(
+            model=CatalogProductModel, filters=CatalogProductModel.supplier_id == SUPPLIER_ID
+        )
+    }
+
+
+def test_products_missing_from_the_next_upload_are_tombstoned(
+    store_csv: Callable[..., CsvModel],
+) -> None:
+    day_one = apply_upload(store_csv, DAY_ONE_ROWS)
+    day_one_catalog = get_catalog()
+    assert sorted(day_one_catalog) == ["1", "2", "3", "4", "5"]
+    assert not any(catalog_product.is_deleted for catalog_product in day_one_catalog.values())
+
+    # product 2 is renamed and product 4 is gone
+    day_two = apply_upload(
+        store_csv,
+        ["1,product 1,a.com/1.jpg", "2,renamed 2,a.com/2.jpg", "3,product 3,a.com/3.jpg"]
+        + ["5,product 5,a.com/5.jpg"],
+    )
+
+    catalog = get_catalog()
+    assert catalog["4"].is_deleted
+    assert catalog["4"].csv_file_id == day_two.id
+    assert catalog["2"].product_name == "renamed 2"
+    assert catalog["2"].csv_file_id == day_two.id
+    assert catalog["2"].created_at == day_one_catalog["2"].created_at
+    # unchanged products are not written
+    for s_no in ("1", "3", "5"):
+        assert not catalog[s_no].is_deleted
+        assert catalog[s_no].csv_file_id == day_one.id
+
+
+def test_a_tombstoned_product_comes_back_when_it_is_uploaded_again(
+    store_csv: Callable[..., CsvModel],
+) -> None:
+    apply_upload(store_csv, DAY_ONE_ROWS)
+    apply_upload(store_csv, DAY_ONE_ROWS[:3])
+    assert get_catalog()["4"].is_deleted
+
+    apply_upload(store_csv, DAY_ONE_ROWS)
+
+    catalog = get_catalog()
+    assert not any(catalog_product.is_deleted for catalog_product in catalog.values())
+    assert catalog["4"].product_name == "product 4"
+
+
+def test_an_unchanged_upload_writes_nothing(store_csv: Callable[..., CsvModel]) -> None:
+    apply_upload(store_csv, DAY_ONE_ROWS)
+    updated_at = {s_no: product.updated_at for s_no, product in get_catalog().items()}
+
+    apply_upload(store_csv, DAY_ONE_ROWS)
+
+    assert {s_no: product.updated_at for s_no, product in get_catalog().items()} == updated_at
+
+
+def test_the_same_file_is_one_upload_per_supplier(store_csv: Callable[..., CsvModel]) -> None:
+    content = build_csv(DAY_ONE_ROWS)
+
+    csv_models = [store_csv(content, supplier_id=supplier_id) for supplier_id in SUPPLIER_IDS]
+
+    assert len({csv_model.id for csv_model in csv_models}) == len(SUPPLIER_IDS)
+    assert len({csv_model.blob_key for csv_model in csv_models}) == 1
+    assert [csv_model.supplier_id for csv_model in csv_models] == SUPPLIER_IDS
+    # uploading it again finds the upload of the same supplier
+    assert [store_csv(content, supplier_id=supplier_id).id for supplier_id in SUPPLIER_IDS] == [
+        csv_model.id for csv_model in csv_models
+    ]
+    assert query_manager.count_with_filter(
+        model=CsvModel, filters=CsvModel.blob_key == csv_models[0].blob_key
+    ) == len(SUPPLIER_IDS)
+
+
+def test_a_product_whose_images_failed_keeps_its_catalogue_row(
+    store_csv: Callable[..., CsvModel], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    apply_upload(store_csv, DAY_ONE_ROWS)
+    day_one_catalog = get_catalog()
+    engine = AsyncImageProcessingEngine(backend=BrokenImageBackend())
+    for service_module in (csv_ingestion_service, csv_service):
+        monkeypatch.setattr(service_module, "get_image_processor", lambda: engine)
+
+    try:
+        day_two = apply_upload(
+            store_csv, DAY_ONE_ROWS[:1] + ["2,renamed 2,a.com/broken.jpg"] + DAY_ONE_ROWS[2:]
+        )
+    finally:
+        engine.shutdown()
+
+    catalog = get_catalog()
+    assert catalog["2"].product_name == "product 2"
+    assert catalog["2"].csv_file_id == day_one_catalog["2"].csv_file_id
+    assert not catalog["2"].is_deleted
+    with CsvErrorReportService.open(csv_file_id=day_two.id) as report_file:
+        report = report_file.read().decode("utf-8")
+    assert "renamed 2" in report
@@ -0,0 +1,170 @@
+import csv
+import gzip
+import io
+from typing import Callable, Iterator, List
+
+import pytest
+from flask.testing import FlaskClient
+
+from app.database.models.csv_model import CsvModel
+from app.database.repository.csv_job_repository import CsvJobRepository
+from app.image_processing.image_backend import ImageBackend
+from app.image_processing.image_processor import AsyncImageProcessingEngine
+from app.services import csv_ingestion_service, csv_service
+from app.services.csv_job_service import CsvJobService
+from app.services.csv_download_service import CsvDownloadService
+from app.services.csv_service import CsvUploadService
+
+CSV_CONTENT = "S. No.,Product Name,Input Image Urls\n" + "".join(
+    f"{s_no},product {s_no},a.com/{s_no}.jpg\n" for s_no in range(1, 6)
+)
+
+
+class VersionedImageBackend(ImageBackend):
+    def __init__(self, version: str):
+        self.version = version
+
+    async def process_image(self, image_url: str) -> str:
+        return f"{image_url}/{self.version}"
+
+
+@pytest.fixture
+def use_image_version(monkeypatch: pytest.MonkeyPatch) -> Iterator[Callable[[str], None]]:
+    engines: List[AsyncImageProcessingEngine] = []
+
+    def use(version: str) -> None:
+        engines.append(AsyncImageProcessingEngine(backend=VersionedImageBackend(version)))
+        # the images are sent by the ingestion pipeline, the job flushes the processor
+        for service_module in (csv_ingestion_service, csv_service):
+            monkeypatch.setattr(service_module, "get_image_processor", lambda: engines[-1])
+
+    yield use
+    for engine in engines:
+        engine.shutdown()
+
+
+@pytest.fixture
+def ingested_csv(
+    store_csv: Callable[..., CsvModel], use_image_version: Callable[[str], None]
+) -> CsvModel:
+    use_image_version("v1")
+    csv_model = store_csv(CSV_CONTENT)
+    CsvJobRepository.enqueue_csv_file(csv_file_id=csv_model.id, total_rows=csv_model.row_count)
+    run_job()
+    return csv_model
+
+
+def run_job() -> None:
+    assert CsvJobService.process_next_job(
+        worker_id="worker-a", job_handler=CsvUploadService.process_csv_job
+    )
+
+
+def read_csv(body: bytes) -> List[List[str]]:
+    return list(csv.reader(io.StringIO(body.decode("utf-8"), newline="")))
+
+
+def download(client: FlaskClient, csv_model: CsvModel, **headers: str):
+    return client.get(f"/csvdownload/{csv_model.id}", headers=headers)
+
+
+def test_a_finished_job_is_downloaded_as_its_gzip_artifact(
+    client: FlaskClient, ingested_csv: CsvModel
+) -> None:
+    artifact = CsvDownloadService.get_export_artifact(csv_file_id=ingested_csv.id)
+    assert artifact is not None
+
+    response = download(client, ingested_csv, **{"Accept-Encoding": "gzip"})
+
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["ETag"] == f'"{artifact.etag}"'
+    assert "Accept-Encoding" in response.headers["Vary"]
+    rows = read_csv(gzip.decompress(response.data))
+    assert rows[0] == CsvDownloadService.headers
+    assert [row[0] for row in rows[1:]] == ["1", "2", "3", "4", "5"]
+    assert rows[1][3] == "a.com/1.jpg/v1"
+
+
+def test_a_client_without_gzip_gets_the_inflated_csv_under_its_own_etag(
+    client: FlaskClient, ingested_csv: CsvModel
+) -> None:
+    gzip_response = download(client, ingested_csv, **{"Accept-Encoding": "gzip"})
+
+    response = download(client, ingested_csv)
+
+    assert response.status_code == 200
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["ETag"] == f'"{gzip_response.headers["ETag"][1:-1]}-identity"'
+    assert response.data == gzip.decompress(gzip_response.data)
+
+
+def test_a_matching_etag_is_not_modified(client: FlaskClient, ingested_csv: CsvModel) -> None:
+    gzip_etag = download(client, ingested_csv, **{"Accept-Encoding": "gzip"}).headers["ETag"]
+    identity_etag = download(client, ingested_csv).headers["ETag"]
+
+    gzip_response = download(
+        client, ingested_csv, **{"Accept-Encoding": "gzip", "If-None-Match": gzip_etag}
+    )
+    identity_response = download(client, ingested_csv, **{"If-None-Match": identity_etag})
+    # the etag of one representation never matches the other
+    other_response = download(
+        client, ingested_csv, **{"Accept-Encoding": "gzip", "If-None-Match": identity_etag}
+    )
+
+    assert (gzip_response.status_code, gzip_response.data) == (304, b"")
+    assert (identity_response.status_code, identity_response.data) == (304, b"")
+    assert other_response.status_code == 200
+
+
+def test_a_range_of_the_gzip_artifact_is_sent_partially(
+    client: FlaskClient, ingested_csv: CsvModel
+) -> None:
+    full_body = download(client, ingested_csv, **{"Accept-Encoding": "gzip"}).data
+
+    response = download(client, ingested_csv, **{"Accept-Encoding": "gzip", "Range": "bytes=10-19"})
+
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes 10-19/{len(full_body)}"
+    assert response.data == full_body[10:20]
+
+
+def test_a_job_run_again_never_serves_the_etag_of_its_last_run(
+    client: FlaskClient,
+    store_csv: Callable[..., CsvModel],
+    use_image_version: Callable[[str], None],
+) -> None:
+    # a catalogue upload is applied again when it is uploaded again, the catalogue may have
+    # changed in between
+    use_image_version("v1")
+    first_csv = store_csv(CSV_CONTENT, supplier_id="acme")
+    CsvJobRepository.enqueue_csv_file(csv_file_id=first_csv.id, total_rows=first_csv.row_count)
+    run_job()
+    stale_etag = download(client, first_csv, **{"Accept-Encoding": "gzip"}).headers["ETag"]
+    second_csv = store_csv(CSV_CONTENT.replace("product 1,", "renamed 1,"), supplier_id="acme")
+    CsvJobRepository.enqueue_csv_file(csv_file_id=second_csv.id, total_rows=second_csv.row_count)
+    run_job()
+
+    CsvJobRepository.enqueue_csv_file(
+        csv_file_id=first_csv.id, total_rows=first_csv.row_count, requeue_completed=True
+    )
+
+    # while the job is queued the catalogue is streamed live, without an etag
+    response = download(
+        client, first_csv, **{"Accept-Encoding": "gzip", "If-None-Match": stale_etag}
+    )
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
+    assert "Content-Encoding" not in response.headers
+
+    use_image_version("v2")
+    run_job()
+
+    response = download(
+        client, first_csv, **{"Accept-Encoding": "gzip", "If-None-Match": stale_etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != stale_etag
+    rows = read_csv(gzip.decompress(response.data))
+    # the renamed product is changed back and processed again, the others are left as they were
+    assert [row[3] for row in rows[1:3]] == ["a.com/1.jpg/v2", "a.com/2.jpg/v1"]
@@ -0,0 +1,65 @@
+import csv
+import io
+from typing import Callable, List
+
+import pytest
+
+from app.database.models.csv_model import CsvModel
+from app.services.csv_error_report_service import CsvErrorReportService
+from app.services.csv_row_validator import CsvRowError
+from app.services.csv_service import CsvUploadService
+from app.services.csv_stream_reader import CsvStreamReader
+
+
+def read_report(csv_file_id: str) -> List[List[str]]:
+    with CsvErrorReportService.open(csv_file_id=csv_file_id) as report_file:
+        return list(csv.reader(io.TextIOWrapper(report_file, encoding="utf-8", newline="")))
+
+
+def test_the_failed_rows_of_every_batch_are_reported_by_record_number(
+    store_csv: Callable[..., CsvModel], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("PRODUCT_INSERT_BATCH_SIZE", "2")
+    csv_model = store_csv(
+        "S. No.,Product Name,Input Image Urls\n"
+        "1,first,a.com/1.jpg\n"
+        ",no s_no,a.com/2.jpg\n"
+        "3,third,not a url\n"
+        "1,again,a.com/4.jpg\n"
+        "5,fifth,a.com/5.jpg\n"
+        "6,,a.com/6.jpg\n"
+    )
+
+    CsvUploadService.create_products_from_csv(
+        csv_rows=CsvStreamReader.iter_rows_from_csv_model(csv_model=csv_model),
+        csv_file_id=csv_model.id,
+    )
+
+    # the header is record 1
+    assert read_report(csv_model.id) == [
+        ["RECORD_NUMBER", "FIELD", "ERROR", "ROW"],
+        ["3", "s_no", "s_no is required", "", "no s_no", "a.com/2.jpg"],
+        ["4", "input_image_urls", "invalid urls ['not a url']", "3", "third", "not a url"],
+        ["5", "s_no", "duplicate s_no 1, an earlier row has it", "1", "again", "a.com/4.jpg"],
+        ["7", "product_name", "product_name is required", "6", "", "a.com/6.jpg"],
+    ]
+
+
+def test_a_report_is_started_over_and_can_be_missing() -> None:
+    csv_row = ["1", "", "a.com/1.jpg"]
+    row_error = CsvRowError("product_name", "product_name is required", csv_row)
+
+    CsvErrorReportService.append(csv_file_id="csv_a", failed_rows=[(1, row_error)])
+    CsvErrorReportService.append(csv_file_id="csv_a", failed_rows=[])
+    CsvErrorReportService.append(csv_file_id="csv_a", failed_rows=[(4, row_error)])
+
+    assert read_report("csv_a") == [
+        ["RECORD_NUMBER", "FIELD", "ERROR", "ROW"],
+        ["2", "product_name", "product_name is required", *csv_row],
+        ["5", "product_name", "product_name is required", *csv_row],
+    ]
+
+    CsvErrorReportService.delete(csv_file_id="csv_a")
+    CsvErrorReportService.delete(csv_file_id="csv_a")
+    with pytest.raises(ValueError, match="No error report found"):
+        CsvErrorReportService.open(csv_file_id="csv_a")
@@ -0,0 +1,197 @@
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+import pytest
+
+from app.database import query_manager
+from app.database.models.csv_job_model import CsvJobModel, CsvJobStatus
+from app.database.models.csv_model import CsvModel
+from app.database.models.product import ProductInsertRow, ProductModel
+from app.database.repository.csv_job_repository import CsvJobRepository
+from app.services.csv_job_service import CsvJobProgress
+
+CSV_CONTENT = "S. No.,Product Name,Input Image Urls\n1,first,a.com/1.jpg\n2,second,a.com/2.jpg\n"
+
+
+def enqueue(store_csv: Callable[..., CsvModel]) -> CsvModel:
+    csv_model = store_csv(CSV_CONTENT)
+    CsvJobRepository.enqueue_csv_file(csv_file_id=csv_model.id, total_rows=csv_model.row_count)
+    return csv_model
+
+
+def get_job(csv_file_id: str) -> CsvJobModel:
+    csv_job = CsvJobRepository.get_job_for_csv_file(csv_file_id=csv_file_id)
+    assert csv_job is not None
+    return csv_job
+
+
+def build_product_rows(csv_file_id: str) -> List[Dict[str, Any]]:
+    return [
+        ProductInsertRow(
+            s_no=str(s_no),
+            csv_file_id=csv_file_id,
+            product_name=f"product {s_no}",
+            input_image_urls=[f"a.com/{s_no}.jpg"],
+            created_at=datetime.now(),
+        ).to_insert_parameters()
+        for s_no in (1, 2)
+    ]
+
+
+def count_products(csv_file_id: str) -> int:
+    return query_manager.count_with_filter(
+        model=ProductModel, filters=ProductModel.csv_file_id == csv_file_id
+    )
+
+
+def test_a_job_is_claimed_by_one_worker_only(store_csv: Callable[..., CsvModel]) -> None:
+    csv_model = enqueue(store_csv)
+
+    claimed_job = CsvJobRepository.claim_next_job(
+        lease_owner="worker-a", lease_seconds=300, max_attempts=3
+    )
+
+    assert claimed_job is not None
+    assert claimed_job.csv_file_id == csv_model.id
+    assert claimed_job.status == CsvJobStatus.RUNNING.value
+    assert claimed_job.attempts == 1
+    assert (
+        CsvJobRepository.claim_next_job(lease_owner="worker-b", lease_seconds=300, max_attempts=3)
+        is None
+    )
+
+
+def test_a_batch_is_committed_with_its_checkpoint(store_csv: Callable[..., CsvModel]) -> None:
+    csv_model = enqueue(store_csv)
+    CsvJobRepository.claim_next_job(lease_owner="worker-a", lease_seconds=300, max_attempts=3)
+
+    committed = CsvJobRepository.commit_batch(
+        job_id=get_job(csv_model.id).id,
+        lease_owner="worker-a",
+        lease_seconds=300,
+        model=ProductModel,
+        rows=build_product_rows(csv_model.id),
+        processed_rows=2,
+    )
+
+    assert committed
+    assert count_products(csv_model.id) == 2
+    csv_job = get_job(csv_model.id)
+    assert (csv_job.checkpoint_rows, csv_job.processed_rows) == (2, 2)
+
+
+def test_a_worker_that_lost_its_lease_cannot_touch_the_job(
+    store_csv: Callable[..., CsvModel],
+) -> None:
+    csv_model = enqueue(store_csv)
+    # the lease of worker-a expires at once, as if it stalled mid-job, and worker-b takes over
+    CsvJobRepository.claim_next_job(lease_owner="worker-a", lease_seconds=-1, max_attempts=3)
+    csv_job = CsvJobRepository.claim_next_job(
+        lease_owner="worker-b", lease_seconds=300, max_attempts=3
+    )
+    assert csv_job is not None
+    assert (csv_job.lease_owner, csv_job.attempts) == ("worker-b", 2)
+
+    progress = CsvJobProgress(job_id=csv_job.id, lease_owner="worker-a", lease_seconds=300)
+    with pytest.raises(RuntimeError, match="was lost"):
+        progress.rows_started(row_count=2)
+    assert not CsvJobRepository.finish_job(
+        job_id=csv_job.id, lease_owner="worker-a", status=CsvJobStatus.COMPLETED
+    )
+
+    csv_job = get_job(csv_model.id)
+    assert (csv_job.status, csv_job.lease_owner) == (CsvJobStatus.RUNNING.value, "worker-b")
+    assert csv_job.in_flight_rows == 0
+
+
+def test_a_worker_that_lost_its_lease_commits_nothing(store_csv: Callable[..., CsvModel]) -> None:
+    csv_model = enqueue(store_csv)
+    CsvJobRepository.claim_next_job(lease_owner="worker-a", lease_seconds=-1, max_attempts=3)
+    csv_job = CsvJobRepository.claim_next_job(
+        lease_owner="worker-b", lease_seconds=300, max_attempts=3
+    )
+    assert csv_job is not None
+
+    committed = CsvJobRepository.commit_batch(
+        job_id=csv_job.id,
+        lease_owner="worker-a",
+        lease_seconds=300,
+        model=ProductModel,
+        rows=build_product_rows(csv_model.id),
+        processed_rows=2,
+    )
+
+    assert not committed
+    progress = CsvJobProgress(job_id=csv_job.id, lease_owner="worker-a", lease_seconds=300)
+    with pytest.raises(RuntimeError, match="was lost"):
+        progress.commit_rows(
+            model=ProductModel, rows=build_product_rows(csv_model.id), processed_row_count=2
+        )
+    assert count_products(csv_model.id) == 0
+    assert get_job(csv_model.id).checkpoint_rows == 0
+
+
+def test_a_deferred_job_gives_its_attempt_back(store_csv: Callable[..., CsvModel]) -> None:
+    csv_model = enqueue(store_csv)
+    csv_job = CsvJobRepository.claim_next_job(
+        lease_owner="worker-a", lease_seconds=300, max_attempts=3
+    )
+    assert csv_job is not None
+
+    assert CsvJobRepository.defer_job(csv_job=csv_job, lease_owner="worker-a")
+
+    deferred_job = get_job(csv_model.id)
+    assert deferred_job.status == CsvJobStatus.PENDING.value
+    assert deferred_job.attempts == 0
+    assert deferred_job.lease_owner is None
+    assert deferred_job.started_at is None
+    assert (
+        CsvJobRepository.claim_next_job(
+            lease_owner="worker-a",
+            lease_seconds=300,
+            max_attempts=3,
+            skip_job_ids=[deferred_job.id],
+        )
+        is None
+    )
+
+
+def test_a_job_out_of_attempts_fails(store_csv: Callable[..., CsvModel]) -> None:
+    csv_model = enqueue(store_csv)
+    for _ in range(2):
+        CsvJobRepository.claim_next_job(lease_owner="worker-a", lease_seconds=-1, max_attempts=2)
+
+    assert (
+        CsvJobRepository.claim_next_job(lease_owner="worker-a", lease_seconds=300, max_attempts=2)
+        is None
+    )
+    assert get_job(csv_model.id).status == CsvJobStatus.FAILED.value
+
+
+def test_a_failed_job_is_queued_again_from_its_checkpoint(
+    store_csv: Callable[..., CsvModel],
+) -> None:
+    csv_model = enqueue(store_csv)
+    csv_job = CsvJobRepository.claim_next_job(
+        lease_owner="worker-a", lease_seconds=300, max_attempts=3
+    )
+    assert csv_job is not None
+    CsvJobRepository.commit_batch(
+        job_id=csv_job.id,
+        lease_owner="worker-a",
+        lease_seconds=300,
+        model=ProductModel,
+        rows=build_product_rows(csv_model.id)[:1],
+        processed_rows=1,
+    )
+    CsvJobRepository.finish_job(
+        job_id=csv_job.id, lease_owner="worker-a", status=CsvJobStatus.FAILED, error="boom"
+    )
+
+    requeued_job = CsvJobRepository.enqueue_csv_file(
+        csv_file_id=csv_model.id, total_rows=csv_model.row_count
+    )
+
+    assert requeued_job.status == CsvJobStatus.PENDING.value
+    assert (requeued_job.attempts, requeued_job.error) == (0, None)
+    assert requeued_job.checkpoint_rows == 1
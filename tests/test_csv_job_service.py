@@ -0,0 +1,123 @@
+from typing import Any, Callable, List
+
+import pytest
+
+from app.database import query_manager
+from app.database.models.csv_job_model import CsvJobModel, CsvJobStatus
+from app.database.models.csv_model import CsvModel
+from app.database.models.product import ProductModel
+from app.database.repository.csv_job_repository import CsvJobRepository
+from app.services.csv_job_service import CsvJobProgress, CsvJobService
+from app.services.csv_service import CsvService, CsvUploadService
+
+ROW_COUNT = 10
+BATCH_SIZE = 3
+
+
+def build_csv() -> str:
+    return "S. No.,Product Name,Input Image Urls\n" + "".join(
+        f"{s_no},product {s_no},a.com/{s_no}.jpg\n" for s_no in range(1, ROW_COUNT + 1)
+    )
+
+
+def get_job(csv_file_id: str) -> CsvJobModel:
+    csv_job = CsvJobRepository.get_job_for_csv_file(csv_file_id=csv_file_id)
+    assert csv_job is not None
+    return csv_job
+
+
+def test_a_failed_attempt_is_retried(store_csv: Callable[..., CsvModel]) -> None:
+    csv_model = store_csv(build_csv())
+    CsvJobRepository.enqueue_csv_file(csv_file_id=csv_model.id, total_rows=csv_model.row_count)
+    attempts: List[int] = []
+
+    def fail_first_attempt(csv_job: CsvJobModel, progress: CsvJobProgress) -> None:
+        attempts.append(csv_job.attempts)
+        if csv_job.attempts == 1:
+            raise RuntimeError("worker crashed")
+
+    assert CsvJobService.process_next_job(worker_id="worker-a", job_handler=fail_first_attempt)
+    csv_job = get_job(csv_model.id)
+    assert (csv_job.status, csv_job.error) == (CsvJobStatus.PENDING.value, "worker crashed")
+    assert csv_job.lease_owner is None
+
+    assert CsvJobService.process_next_job(worker_id="worker-b", job_handler=fail_first_attempt)
+    csv_job = get_job(csv_model.id)
+    assert (csv_job.status, csv_job.error) == (CsvJobStatus.COMPLETED.value, None)
+    assert csv_job.finished_at is not None
+    assert attempts == [1, 2]
+
+    assert not CsvJobService.process_next_job(worker_id="worker-a", job_handler=fail_first_attempt)
+
+
+def test_a_retried_job_resumes_from_its_checkpoint(
+    store_csv: Callable[..., CsvModel], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("PRODUCT_INSERT_BATCH_SIZE", str(BATCH_SIZE))
+    csv_model = store_csv(build_csv())
+    CsvJobRepository.enqueue_csv_file(csv_file_id=csv_model.id, total_rows=csv_model.row_count)
+
+    committed_s_nos: List[List[str]] = []
+    # the first attempt crashes on its second batch
+    crash_on_batch = [2]
+    commit_rows = CsvJobProgress.commit_rows
+
+    def commit_rows_then_crash(progress: CsvJobProgress, **kwargs: Any) -> None:
+        if len(committed_s_nos) + 1 == crash_on_batch[0]:
+            raise RuntimeError("worker crashed")
+        committed_s_nos.append([row["s_no"] for row in kwargs["rows"]])
+        commit_rows(progress, **kwargs)
+
+    monkeypatch.setattr(CsvJobProgress, "commit_rows", commit_rows_then_crash)
+
+    assert CsvJobService.process_next_job(
+        worker_id="worker-a", job_handler=CsvUploadService.process_csv_job
+    )
+
+    csv_job = get_job(csv_model.id)
+    assert csv_job.status == CsvJobStatus.PENDING.value
+    assert csv_job.error == "worker crashed"
+    assert (csv_job.checkpoint_rows, csv_job.processed_rows) == (BATCH_SIZE, BATCH_SIZE)
+    assert committed_s_nos == [["1", "2", "3"]]
+
+    crash_on_batch[0] = 0
+    assert CsvJobService.process_next_job(
+        worker_id="worker-b", job_handler=CsvUploadService.process_csv_job
+    )
+
+    csv_job = get_job(csv_model.id)
+    assert csv_job.status == CsvJobStatus.COMPLETED.value
+    assert csv_job.attempts == 2
+    assert (csv_job.checkpoint_rows, csv_job.processed_rows) == (ROW_COUNT, ROW_COUNT)
+    # the rows of the first batch are not committed again
+    assert [s_no for s_nos in committed_s_nos for s_no in s_nos] == [
+        str(s_no) for s_no in range(1, ROW_COUNT + 1)
+    ]
+    products = query_manager.query_with_filter(
+        model=ProductModel, filters=ProductModel.csv_file_id == csv_model.id
+    )
+    assert sorted(product.row_number for product in products) == list(range(1, ROW_COUNT + 1))
+
+
+def test_a_job_whose_header_cannot_be_mapped_fails_without_a_retry(
+    store_csv: Callable[..., CsvModel], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # a file stored before headers were checked on upload
+    monkeypatch.setattr(CsvService, "check_csv_header", lambda **kwargs: None)
+    csv_model = store_csv("S. No.,Description\n1,first\n")
+    CsvJobRepository.enqueue_csv_file(csv_file_id=csv_model.id, total_rows=csv_model.row_count)
+
+    assert CsvJobService.process_next_job(
+        worker_id="worker-a", job_handler=CsvUploadService.process_csv_job
+    )
+
+    csv_job = get_job(csv_model.id)
+    assert csv_job.status == CsvJobStatus.FAILED.value
+    assert csv_job.attempts == 1
+    assert "has no column for ['product_name', 'input_image_urls']" in csv_job.error
+    assert not CsvJobService.process_next_job(
+        worker_id="worker-a", job_handler=CsvUploadService.process_csv_job
+    )
+    assert not query_manager.count_with_filter(
+        model=ProductModel, filters=ProductModel.csv_file_id == csv_model.id
+    )
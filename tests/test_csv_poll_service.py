@@ -0,0 +1,61 @@
+from typing import Callable
+
+import pytest
+
+from app.database.models.csv_job_model import CsvJobStatus
+from app.database.models.csv_model import CsvModel
+from app.database.repository.csv_job_repository import CsvJobRepository
+from app.services.csv_job_service import CsvJobProgress
+from app.services.csv_poll_service import CsvPollService
+
+# lone \r line endings, as old spreadsheet exports write them
+CSV_CONTENT = "S. No.,Product Name,Input Image Urls\r" + "".join(
+    f'{s_no},"product\r{s_no}",a.com/{s_no}.jpg\r' for s_no in range(1, 5)
+)
+
+
+def test_the_rows_of_a_file_are_counted_once_on_upload(store_csv: Callable[..., CsvModel]) -> None:
+    csv_model = store_csv(CSV_CONTENT)
+
+    assert csv_model.row_count == 4
+
+
+def test_polling_reads_the_progress_counters_of_the_job(
+    store_csv: Callable[..., CsvModel],
+) -> None:
+    csv_model = store_csv(CSV_CONTENT)
+    CsvJobRepository.enqueue_csv_file(csv_file_id=csv_model.id, total_rows=csv_model.row_count)
+
+    polling_response = CsvPollService.get_csv_file_upload_status(csv_file_id=csv_model.id)
+    assert (polling_response.status, polling_response.count_rows) == (
+        CsvJobStatus.PENDING.value,
+        4,
+    )
+    assert polling_response.eta_seconds is None
+
+    csv_job = CsvJobRepository.claim_next_job(
+        lease_owner="worker-a", lease_seconds=300, max_attempts=3
+    )
+    assert csv_job is not None
+    progress = CsvJobProgress(job_id=csv_job.id, lease_owner="worker-a", lease_seconds=300)
+    progress.rows_started(row_count=4)
+
+    polling_response = CsvPollService.get_csv_file_upload_status(csv_file_id=csv_model.id)
+    assert polling_response.status == CsvJobStatus.RUNNING.value
+    assert polling_response.count_rows_in_flight == 4
+    assert polling_response.count_rows_inserted == 0
+
+    progress.rows_finished(processed_row_count=3, failed_row_count=1)
+
+    polling_response = CsvPollService.get_csv_file_upload_status(csv_file_id=csv_model.id)
+    assert (
+        polling_response.count_rows_inserted,
+        polling_response.count_rows_failed,
+        polling_response.count_rows_in_flight,
+    ) == (3, 1, 0)
+    assert polling_response.eta_seconds == 0
+
+
+def test_polling_an_unknown_file_fails() -> None:
+    with pytest.raises(ValueError):
+        CsvPollService.get_csv_file_upload_status(csv_file_id="csv_unknown")
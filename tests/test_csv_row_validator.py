@@ -0,0 +1,103 @@
+import re
+from typing import List, Union
+
+import pytest
+
+from app.services.csv_row_validator import CsvHeaderMapping, CsvRowError, CsvRowValidator
+
+TWO_URLS_ROW = ["1", "name", "a.com/1.jpg", "a.com:8080/2.jpg?size=2"]
+
+
+@pytest.mark.parametrize(
+    "header_row, header_mapping",
+    [
+        (["S. No.", "Product Name", "Input Image Urls"], CsvHeaderMapping()),
+        (["sno", "name", "images"], CsvHeaderMapping()),
+        (["Serial Number", "PRODUCT_NAME", "Image URL"], CsvHeaderMapping()),
+        (["Sl No", "Image Urls", "Name"], CsvHeaderMapping(0, 2, 1, 2)),
+        (["Input Image Urls", "Product Name", "S No"], CsvHeaderMapping(2, 1, 0, 1)),
+        (["Images", "", "", "Serial No", "Name"], CsvHeaderMapping(3, 4, 0, 3)),
+        # no header names we know, the sample csv's order
+        (["id", "title", "pictures"], CsvHeaderMapping()),
+        ([], CsvHeaderMapping()),
+    ],
+)
+def test_header_names_are_mapped_by_their_aliases(
+    header_row: List[str], header_mapping: CsvHeaderMapping
+) -> None:
+    assert CsvHeaderMapping.from_header_row(header_row) == header_mapping
+
+
+@pytest.mark.parametrize(
+    "header_row, missing_fields",
+    [
+        (["S. No.", "Description"], "['product_name', 'input_image_urls']"),
+        (["Name", "Image Urls"], "['s_no']"),
+        (["Serial No", "Product Name", "Pictures"], "['input_image_urls']"),
+    ],
+)
+def test_a_header_that_names_only_some_fields_is_rejected(
+    header_row: List[str], missing_fields: str
+) -> None:
+    with pytest.raises(ValueError, match=re.escape(f"no column for {missing_fields}")):
+        CsvHeaderMapping.from_header_row(header_row)
+
+
+@pytest.mark.parametrize(
+    "csv_row, validated_row",
+    [
+        (["1", "name", "a.com/1.jpg"], ["1", "name", "a.com/1.jpg"]),
+        ([" 1 ", " name ", "https://a.com/1.jpg"], ["1", "name", "https://a.com/1.jpg"]),
+        # several urls in one cell, or over several cells
+        (["1", "name", "a.com/1.jpg,a.com:8080/2.jpg?size=2"], TWO_URLS_ROW),
+        (["1", "name", "a.com/1.jpg", "a.com:8080/2.jpg?size=2"], TWO_URLS_ROW),
+        (["1", "name", " a.com/1.jpg , ,a.com:8080/2.jpg?size=2 "], TWO_URLS_ROW),
+        (["1", "name"], ["1", "name"]),
+        (["1", "name", ""], ["1", "name"]),
+        (["", "name", "a.com/1.jpg"], CsvRowError("s_no", "s_no is required", [])),
+        (["1", " ", "a.com/1.jpg"], CsvRowError("product_name", "product_name is required", [])),
+        (["1"], CsvRowError("product_name", "product_name is required", [])),
+        (
+            ["1" * 11, "name", "a.com/1.jpg"],
+            CsvRowError("s_no", "s_no is 11 characters long, at most 10 fit", []),
+        ),
+        (
+            ["1", "n" * 11, "a.com/1.jpg"],
+            CsvRowError("product_name", "product_name is 11 characters long, at most 10 fit", []),
+        ),
+        (
+            ["1", "name", "a.com/1.jpg,not a url,localhost"],
+            CsvRowError("input_image_urls", "invalid urls ['not a url', 'localhost']", []),
+        ),
+        # the first check a row fails is the one reported
+        (["", "n" * 11, "localhost"], CsvRowError("s_no", "s_no is required", [])),
+    ],
+)
+def test_every_column_is_checked_and_normalised(
+    csv_row: List[str], validated_row: Union[List[str], CsvRowError]
+) -> None:
+    row_validator = CsvRowValidator(header_mapping=CsvHeaderMapping(), max_length=10)
+    if isinstance(validated_row, CsvRowError):
+        # the error carries the row as it was sent
+        validated_row = CsvRowError(validated_row.field, validated_row.message, csv_row)
+    valid_row = ["2", "other", "b.com/2.jpg"]
+
+    # alone, and in a batch whose other rows pass, which takes the fast paths
+    assert row_validator.validate_batch([csv_row]) == [validated_row]
+    assert row_validator.validate_batch([valid_row, csv_row, valid_row]) == [
+        valid_row,
+        validated_row,
+        valid_row,
+    ]
+
+
+def test_the_columns_of_a_reordered_header_are_read_from_their_positions() -> None:
+    row_validator = CsvRowValidator(
+        header_mapping=CsvHeaderMapping.from_header_row(
+            ["Images", "More images", "Serial No", "Name", "Notes"]
+        )
+    )
+
+    assert row_validator.validate_batch(
+        [["a.com/1.jpg", "a.com/2.jpg", "1", "first", "a note"], ["", "", "2", "second", ""]]
+    ) == [["1", "first", "a.com/1.jpg", "a.com/2.jpg"], ["2", "second"]]
@@ -0,0 +1,164 @@
+import csv
+import io
+from functools import partial
+from itertools import chain
+from pathlib import Path
+from typing import Callable, Iterator, List, Tuple
+
+import pytest
+
+from app.database import query_manager
+from app.database.models.csv_job_model import CsvJobStatus
+from app.database.models.csv_model import CsvModel
+from app.database.models.product import ProductModel
+from app.database.repository.csv_job_repository import CsvJobRepository
+from app.services.csv_job_service import CsvJobService
+from app.services.csv_row_validator import CsvHeaderMapping, CsvRowValidator
+from app.services.csv_service import CsvUploadService
+from app.services.csv_shard_service import CsvShardService
+
+
+def build_csv(line_ending: str, row_count: int) -> bytes:
+    rows = ["s_no,product_name,input_image_urls"]
+    for row_number in range(row_count):
+        if row_number % 3 == 0:
+            # a quoted field over several lines, with line endings a shard must not split on
+            product_name = f'"name{line_ending}{row_number}{line_ending}end"'
+        elif row_number % 3 == 1:
+            product_name = f'"escaped ""{row_number}"" {line_ending}"'
+        else:
+            product_name = f"plain {row_number}"
+        rows.append(f"{row_number},{product_name},a.com/{row_number}.jpg")
+    return (line_ending.join(rows) + line_ending).encode("utf-8")
+
+
+def parse_shards(csv_buffer: bytes, shard_bytes: int) -> List[List[str]]:
+    rows: List[List[str]] = []
+    for start, end in CsvShardService.compute_shards(csv_buffer, shard_bytes=shard_bytes):
+        rows.extend(csv.reader(io.StringIO(csv_buffer[start:end].decode("utf-8"), newline="")))
+    return rows
+
+
+@pytest.mark.parametrize("line_ending", ["\n", "\r\n", "\r"])
+@pytest.mark.parametrize("shard_bytes", [1, 5, 16, 33, 1024 * 1024])
+def test_shards_never_split_a_quoted_field(line_ending: str, shard_bytes: int) -> None:
+    csv_buffer = build_csv(line_ending, row_count=60)
+    data_rows = list(csv.reader(io.StringIO(csv_buffer.decode("utf-8"), newline="")))[1:]
+
+    assert parse_shards(csv_buffer, shard_bytes=shard_bytes) == data_rows
+
+
+def test_shards_are_contiguous_and_skip_the_header() -> None:
+    csv_buffer = build_csv("\n", row_count=60)
+
+    shards = CsvShardService.compute_shards(csv_buffer, shard_bytes=40)
+
+    assert len(shards) > 1
+    assert shards[0][0] == csv_buffer.index(b"\n") + 1
+    assert shards[-1][1] == len(csv_buffer)
+    for (_, end), (next_start, _) in zip(shards, shards[1:]):
+        assert end == next_start
+
+
+def test_a_file_with_only_a_header_has_no_shards() -> None:
+    assert CsvShardService.compute_shards(b"s_no,product_name\r", shard_bytes=4) == []
+
+
+@pytest.fixture
+def parse_in_parallel(monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    monkeypatch.setenv("CSV_PARALLEL_PARSE_WORKERS", "2")
+    monkeypatch.setenv("CSV_PARALLEL_PARSE_MIN_BYTES", "0")
+    monkeypatch.setenv("CSV_PARSE_SHARD_BYTES", "256")
+    yield
+    CsvShardService.shutdown_parse_pool()
+
+
+def build_product_rows(csv_buffer: bytes) -> List[Tuple[str, str, List[str]]]:
+    """
+    the products the serial path builds out of the file
+    """
+    csv_rows = list(csv.reader(io.StringIO(csv_buffer.decode("utf-8"), newline="")))
+    row_validator = CsvRowValidator(header_mapping=CsvHeaderMapping.from_header_row(csv_rows[0]))
+    return [
+        (product_row.s_no, product_row.product_name, product_row.input_image_urls)
+        for product_row in CsvUploadService.build_product_insert_rows(
+            csv_rows=csv_rows[1:], csv_file_id="csv_file", row_validator=row_validator
+        )
+    ]
+
+
+@pytest.mark.usefixtures("parse_in_parallel")
+def test_parse_processes_transform_the_shards_in_file_order(tmp_path: Path) -> None:
+    csv_buffer = build_csv("\r\n", row_count=200)
+    csv_path = tmp_path / "products.csv"
+    csv_path.write_bytes(csv_buffer)
+    row_validator = CsvRowValidator(
+        header_mapping=CsvHeaderMapping.from_header_row(["s_no", "product_name", "image_urls"])
+    )
+
+    transformed_shards = list(
+        CsvShardService.iter_transformed_shards(
+            csv_path=str(csv_path),
+            csv_file_id="csv_file",
+            rows_transformer=partial(
+                CsvUploadService.build_product_insert_rows, row_validator=row_validator
+            ),
+        )
+    )
+
+    assert len(transformed_shards) > 2
+    assert [
+        (product_row.s_no, product_row.product_name, product_row.input_image_urls)
+        for product_row in chain.from_iterable(transformed_shards)
+    ] == build_product_rows(csv_buffer)
+
+
+@pytest.mark.usefixtures("parse_in_parallel")
+def test_a_worker_keeps_its_parse_pool_for_the_next_file(tmp_path: Path) -> None:
+    csv_path = tmp_path / "products.csv"
+    csv_path.write_bytes(build_csv("\n", row_count=20))
+
+    parse_pools = []
+    for _ in range(2):
+        list(
+            CsvShardService.iter_transformed_shards(
+                csv_path=str(csv_path), csv_file_id="csv_file", rows_transformer=count_rows
+            )
+        )
+        parse_pools.append(CsvShardService.get_parse_pool())
+
+    assert parse_pools[0] is parse_pools[1]
+
+
+@pytest.mark.usefixtures("parse_in_parallel")
+def test_a_large_file_is_ingested_by_parse_processes(
+    store_csv: Callable[..., CsvModel], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("PRODUCT_INSERT_BATCH_SIZE", "16")
+    csv_buffer = build_csv("\r", row_count=100)
+    csv_model = store_csv(csv_buffer.decode("utf-8"))
+    CsvJobRepository.enqueue_csv_file(csv_file_id=csv_model.id, total_rows=csv_model.row_count)
+
+    assert CsvShardService.should_parse_in_parallel(size_bytes=csv_model.size_bytes)
+    assert CsvJobService.process_next_job(
+        worker_id="worker-a", job_handler=CsvUploadService.process_csv_job
+    )
+
+    csv_job = CsvJobRepository.get_job_for_csv_file(csv_file_id=csv_model.id)
+    assert csv_job is not None
+    assert (csv_job.status, csv_job.processed_rows) == (CsvJobStatus.COMPLETED.value, 100)
+    products = query_manager.query_with_filter(
+        model=ProductModel, filters=ProductModel.csv_file_id == csv_model.id
+    )
+    assert sorted(
+        (product.row_number, product.s_no, product.product_name, product.input_image_urls)
+        for product in products
+    ) == [
+        (row_number, *product_row)
+        for row_number, product_row in enumerate(build_product_rows(csv_buffer), start=1)
+    ]
+
+
+def count_rows(csv_rows: List[List[str]], csv_file_id: str) -> List[int]:
+    # module level so that the parse processes can unpickle it
+    return [len(csv_rows)]
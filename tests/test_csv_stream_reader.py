@@ -0,0 +1,80 @@
+import csv
+import io
+
+import pytest
+
+from app.services.csv_stream_reader import CsvRecordCounter, CsvStreamReader
+
+LINE_ENDINGS = ["\n", "\r\n", "\r"]
+
+
+def build_csv(line_ending: str) -> str:
+    rows = [
+        "s_no,product_name,input_image_urls",
+        "1,plain,a.com/1.jpg",
+        f'2,"quoted{line_ending}over two lines",a.com/2.jpg',
+        '3,"escaped ""quotes""",a.com/3.jpg',
+    ]
+    return line_ending.join(rows) + line_ending
+
+
+def expected_rows(content: str):
+    return list(csv.reader(io.StringIO(content, newline="")))
+
+
+@pytest.mark.parametrize("line_ending", LINE_ENDINGS)
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 64 * 1024])
+def test_rows_are_read_whatever_the_line_endings(line_ending: str, chunk_size: int) -> None:
+    content = build_csv(line_ending)
+
+    rows = list(
+        CsvStreamReader.iter_rows_from_stream(
+            binary_stream=io.BytesIO(content.encode("utf-8")), chunk_size=chunk_size
+        )
+    )
+
+    assert rows == expected_rows(content)
+    assert rows[2][1] == f"quoted{line_ending}over two lines"
+
+
+def test_a_multi_byte_character_split_between_chunks_is_decoded() -> None:
+    content = "s_no,product_name\r1,café\r"
+
+    rows = list(
+        CsvStreamReader.iter_rows_from_stream(
+            binary_stream=io.BytesIO(content.encode("utf-8")), chunk_size=1
+        )
+    )
+
+    assert rows == [["s_no", "product_name"], ["1", "café"]]
+
+
+@pytest.mark.parametrize("line_ending", LINE_ENDINGS)
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 64 * 1024])
+def test_records_are_counted_whatever_the_line_endings(line_ending: str, chunk_size: int) -> None:
+    content = build_csv(line_ending)
+
+    record_count = CsvStreamReader.count_records(
+        binary_stream=io.BytesIO(content.encode("utf-8")), chunk_size=chunk_size
+    )
+
+    assert record_count == len(expected_rows(content)) == 4
+
+
+@pytest.mark.parametrize("line_ending", LINE_ENDINGS)
+def test_the_last_record_needs_no_line_ending(line_ending: str) -> None:
+    record_counter = CsvRecordCounter()
+
+    record_counter.feed(build_csv(line_ending).rstrip(line_ending).encode("utf-8"))
+
+    assert record_counter.record_count == 4
+
+
+def test_a_crlf_split_between_chunks_ends_one_record() -> None:
+    record_counter = CsvRecordCounter()
+
+    record_counter.feed(b"header\r")
+    record_counter.feed(b"\nrow\r")
+    record_counter.feed(b"\n")
+
+    assert record_counter.record_count == 2
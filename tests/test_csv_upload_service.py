@@ -0,0 +1,78 @@
+from typing import Any, Callable, List
+
+import pytest
+
+from app.database import query_manager
+from app.database.models.csv_model import CsvModel
+from app.database.models.product import ProductModel
+from app.services.csv_service import CsvUploadService
+from app.services.csv_stream_reader import CsvStreamReader
+
+
+def build_csv(rows: List[str]) -> str:
+    return "S. No.,Product Name,Input Image Urls\n" + "".join(f"{row}\n" for row in rows)
+
+
+def create_products(csv_model: CsvModel) -> List[ProductModel]:
+    CsvUploadService.create_products_from_csv(
+        csv_rows=CsvStreamReader.iter_rows_from_csv_model(csv_model=csv_model),
+        csv_file_id=csv_model.id,
+    )
+    return query_manager.query_with_filter(
+        model=ProductModel, filters=ProductModel.csv_file_id == csv_model.id
+    )
+
+
+def test_products_are_inserted_a_batch_per_statement(
+    store_csv: Callable[..., CsvModel], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("PRODUCT_INSERT_BATCH_SIZE", "2")
+    upserted_batches: List[List[str]] = []
+    upsert_rows = query_manager.upsert_rows
+
+    def record_upsert_rows(**kwargs: Any) -> None:
+        if kwargs["model"] is ProductModel:
+            upserted_batches.append([row["s_no"] for row in kwargs["rows"]])
+        upsert_rows(**kwargs)
+
+    monkeypatch.setattr(query_manager, "upsert_rows", record_upsert_rows)
+    csv_model = store_csv(
+        build_csv(
+            [f'{s_no},product {s_no},"a.com/{s_no}.jpg,b.com/{s_no}.jpg"' for s_no in range(5)]
+        )
+    )
+
+    products = create_products(csv_model)
+
+    assert upserted_batches == [["0", "1"], ["2", "3"], ["4"]]
+    assert sorted((product.row_number, product.s_no) for product in products) == [
+        (row_number, str(row_number - 1)) for row_number in range(1, 6)
+    ]
+    for product in products:
+        assert product.id == ProductModel.get_id_for_product(
+            s_no=product.s_no, csv_file_id=csv_model.id
+        )
+        assert product.product_name == f"product {product.s_no}"
+        assert product.input_image_urls == [
+            f"a.com/{product.s_no}.jpg",
+            f"b.com/{product.s_no}.jpg",
+        ]
+        assert product.output_image_urls == [
+            f"{image_url}output" for image_url in product.input_image_urls
+        ]
+
+
+def test_a_repeated_s_no_keeps_the_first_row(
+    store_csv: Callable[..., CsvModel], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("PRODUCT_INSERT_BATCH_SIZE", "2")
+    csv_model = store_csv(
+        build_csv(["1,first,a.com/1.jpg", "2,second,a.com/2.jpg", "1,again,a.com/3.jpg"])
+    )
+
+    products = create_products(csv_model)
+
+    assert sorted((product.s_no, product.product_name) for product in products) == [
+        ("1", "first"),
+        ("2", "second"),
+    ]
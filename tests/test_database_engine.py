@@ -0,0 +1,98 @@
+from pathlib import Path
+from typing import Callable, Iterator, List, Tuple
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import StaticPool
+
+from app.database.database_engine import DatabaseEngine
+
+
+@pytest.fixture
+def create_engines(
+    monkeypatch: pytest.MonkeyPatch,
+) -> Iterator[Callable[[str], Tuple[Engine, Engine]]]:
+    """
+    builds the write and read engines of database_url, the app's own engines are left as they are
+    """
+    engines: List[Engine] = []
+
+    def create(database_url: str) -> Tuple[Engine, Engine]:
+        monkeypatch.setenv("DATABASE_URL", database_url)
+        monkeypatch.setattr(DatabaseEngine, "engine", None)
+        monkeypatch.setattr(DatabaseEngine, "read_engine", None)
+        engines.extend(
+            [DatabaseEngine.create_mysql_db_engine(), DatabaseEngine.create_read_db_engine()]
+        )
+        return engines[-2], engines[-1]
+
+    yield create
+    for engine in engines:
+        engine.dispose()
+
+
+def read_pragma(engine: Engine, pragma: str) -> object:
+    with engine.connect() as connection:
+        return connection.execute(text(f"PRAGMA {pragma}")).scalar()
+
+
+def test_the_pragmas_are_set_on_every_connection(
+    create_engines: Callable[[str], Tuple[Engine, Engine]],
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("SQLITE_BUSY_TIMEOUT_MS", "1234")
+    write_engine, read_engine = create_engines(f"sqlite:///{tmp_path / 'app.db'}")
+
+    assert write_engine is not read_engine
+    assert read_pragma(write_engine, "journal_mode") == "wal"
+    # the journal mode is kept in the file, the reader sees the one the writer set
+    assert read_pragma(read_engine, "journal_mode") == "wal"
+    for engine in (write_engine, read_engine):
+        assert read_pragma(engine, "busy_timeout") == 1234
+        assert read_pragma(engine, "synchronous") == 1  # NORMAL
+        assert read_pragma(engine, "temp_store") == 2  # MEMORY
+    assert read_pragma(write_engine, "query_only") == 0
+    assert read_pragma(read_engine, "query_only") == 1
+
+
+def test_the_read_engine_rejects_writes(
+    create_engines: Callable[[str], Tuple[Engine, Engine]], tmp_path: Path
+) -> None:
+    write_engine, read_engine = create_engines(f"sqlite:///{tmp_path / 'app.db'}")
+    with write_engine.begin() as connection:
+        connection.execute(text("CREATE TABLE products (name TEXT)"))
+        connection.execute(text("INSERT INTO products VALUES ('first')"))
+
+    with pytest.raises(OperationalError, match="readonly"):
+        with read_engine.begin() as connection:
+            connection.execute(text("INSERT INTO products VALUES ('second')"))
+
+    with read_engine.connect() as connection:
+        assert connection.execute(text("SELECT name FROM products")).scalars().all() == ["first"]
+
+
+def test_an_in_memory_database_is_one_shared_connection(
+    create_engines: Callable[[str], Tuple[Engine, Engine]],
+) -> None:
+    write_engine, read_engine = create_engines("sqlite:///:memory:")
+
+    assert isinstance(write_engine.pool, StaticPool)
+    # a second engine would open another, empty, database
+    assert read_engine is write_engine
+    with write_engine.begin() as connection:
+        connection.execute(text("CREATE TABLE products (name TEXT)"))
+    with write_engine.connect() as connection:
+        assert connection.execute(text("SELECT count(*) FROM products")).scalar() == 0
+
+
+def test_a_file_database_gets_a_pool_of_connections(tmp_path: Path) -> None:
+    options = DatabaseEngine.get_engine_options(
+        database_url=f"sqlite:///{tmp_path / 'app.db'}", pool_size=7
+    )
+
+    assert options["pool_size"] == 7
+    assert "poolclass" not in options
+    assert options["connect_args"]["check_same_thread"] is False
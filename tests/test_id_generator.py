@@ -0,0 +1,86 @@
+import hashlib
+from typing import Any, Iterator, Optional, Sequence
+
+import pytest
+
+from app.database import id_generator
+from app.database.models.image_result_model import ImageResultModel
+
+
+@pytest.fixture(params=sorted(id_generator.ID_HASH_ALGORITHMS))
+def hash_algorithm(
+    request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch
+) -> Iterator[str]:
+    monkeypatch.setenv("ID_HASH_ALGORITHM", request.param)
+    id_generator.get_hash_algorithm.cache_clear()
+    yield request.param
+    id_generator.get_hash_algorithm.cache_clear()
+
+
+def test_the_short_id_is_a_truncated_sha256_of_the_joined_identifiers() -> None:
+    assert id_generator.generate_id("product", ["1", "csv_a"]) == (
+        "product_" + hashlib.sha256(b"1|csv_a|").hexdigest()[: id_generator.ID_HASH_LENGTH]
+    )
+
+
+def test_the_long_id_keeps_the_whole_hash(hash_algorithm: str) -> None:
+    short_id = id_generator.generate_id("product", ["1", "csv_a"])
+    long_id = id_generator.get_long_id("product", ["1", "csv_a"])
+
+    assert long_id.startswith("product_")
+    assert len(long_id) == len("product_") + id_generator.LONG_ID_HASH_LENGTH
+    assert long_id != short_id
+    assert long_id == id_generator.get_long_id("product", ["1", "csv_a"])
+    assert long_id != id_generator.get_long_id("product", ["1", "csv_b"])
+    assert (
+        long_id
+        == id_generator.generate_ids(
+            "product", [["1", "csv_a"]], length=id_generator.LONG_ID_HASH_LENGTH
+        )[0]
+    )
+
+
+def test_ids_of_many_rows_are_the_ids_of_each_row(hash_algorithm: str) -> None:
+    identifier_rows = [("1", "csv_a"), ("2", "csv_a"), (3, "csv_b")]
+
+    assert id_generator.generate_ids("product", identifier_rows) == [
+        id_generator.generate_id("product", identifiers) for identifiers in identifier_rows
+    ]
+
+
+@pytest.mark.parametrize(
+    "known_identifiers, identifiers, is_collision",
+    [
+        (None, ["1", "csv_a"], False),
+        (["1", "csv_a"], ["1", "csv_a"], False),
+        # identifiers are hashed as strings
+        ([1, "csv_a"], ["1", "csv_a"], False),
+        (["1", "csv_a"], ["2", "csv_a"], True),
+        (["1", "csv_a"], ["1", "csv_b"], True),
+        (["1", "csv_a"], ["1"], True),
+    ],
+)
+def test_a_known_id_collides_only_with_other_identifiers(
+    known_identifiers: Optional[Sequence[Any]], identifiers: Sequence[Any], is_collision: bool
+) -> None:
+    assert id_generator.is_collision(known_identifiers, identifiers) is is_collision
+
+
+def test_an_unknown_hash_algorithm_is_rejected(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("ID_HASH_ALGORITHM", "md5")
+    id_generator.get_hash_algorithm.cache_clear()
+
+    with pytest.raises(ValueError, match="md5"):
+        id_generator.generate_id("product", ["1"])
+    id_generator.get_hash_algorithm.cache_clear()
+
+
+def test_image_results_are_keyed_on_the_long_id_of_their_url(hash_algorithm: str) -> None:
+    input_urls = ["a.com/1.jpg", "a.com/2.jpg"]
+
+    assert ImageResultModel.get_ids_for_input_urls(input_urls) == [
+        id_generator.get_long_id("image", [input_url]) for input_url in input_urls
+    ]
+    assert ImageResultModel.get_id_for_input_url("a.com/1.jpg") == id_generator.get_long_id(
+        "image", ["a.com/1.jpg"]
+    )
@@ -0,0 +1,260 @@
+import asyncio
+import hashlib
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Tuple
+
+import pytest
+
+from app.image_processing.image_backend import (
+    HttpImageBackend,
+    ImageBackend,
+    ImageProcessingError,
+    InProcessImageBackend,
+)
+from app.image_processing.image_processor import AsyncImageProcessingEngine, CachingImageProcessor
+from app.image_processing.image_result_cache import ImageResultCache
+
+
+class ScriptedImageBackend(ImageBackend):
+    """
+    fails the first attempts of an image with the errors scripted for it, then succeeds
+    """
+
+    def __init__(self, errors: Dict[str, List[Exception]], latency_seconds: float = 0.0):
+        self.errors = errors
+        self.latency_seconds = latency_seconds
+        self.calls: List[str] = []
+        self.in_flight: Counter = Counter()
+        self.max_in_flight: Counter = Counter()
+
+    async def process_image(self, image_url: str) -> str:
+        host = image_url.split("/")[0]
+        self.calls.append(image_url)
+        self.in_flight[host] += 1
+        self.max_in_flight[host] = max(self.max_in_flight[host], self.in_flight[host])
+        try:
+            await asyncio.sleep(self.latency_seconds)
+            if self.errors.get(image_url):
+                raise self.errors[image_url].pop(0)
+            return image_url + "output"
+        finally:
+            self.in_flight[host] -= 1
+
+
+@pytest.fixture
+def start_engine() -> Iterator[Any]:
+    engines: List[AsyncImageProcessingEngine] = []
+
+    def start(backend: ImageBackend, **kwargs: Any) -> AsyncImageProcessingEngine:
+        engine = AsyncImageProcessingEngine(
+            backend=backend, **{"retry_backoff_seconds": 0.01, **kwargs}
+        )
+        engines.append(engine)
+        return engine
+
+    yield start
+    for engine in engines:
+        engine.shutdown()
+
+
+def test_every_list_of_a_batch_gets_its_output_urls(start_engine: Any) -> None:
+    engine = start_engine(InProcessImageBackend())
+
+    output_urls = engine.submit_batch([["a.com/1.jpg", "b.com/2.jpg"], [], ["a.com/3.jpg"]])
+
+    assert output_urls.result(timeout=5) == [
+        ["a.com/1.jpgoutput", "b.com/2.jpgoutput"],
+        [],
+        ["a.com/3.jpgoutput"],
+    ]
+    assert engine.process_image_urls(["c.com/4.jpg"]) == ["c.com/4.jpgoutput"]
+
+
+def test_a_failing_image_only_fails_its_own_list(start_engine: Any) -> None:
+    backend = ScriptedImageBackend(
+        errors={
+            "a.com/flaky.jpg": [ConnectionError("reset"), asyncio.TimeoutError()],
+            "a.com/missing.jpg": [ValueError("404")],
+            "a.com/down.jpg": [ConnectionError("refused")] * 3,
+            "a.com/gone.jpg": [ValueError("404")],
+        }
+    )
+    engine = start_engine(backend, max_retries=2)
+
+    output_urls = engine.submit_batch(
+        [["a.com/1.jpg", "a.com/flaky.jpg"], ["a.com/missing.jpg"], ["a.com/down.jpg"]]
+    ).result(timeout=5)
+
+    assert output_urls[0] == ["a.com/1.jpgoutput", "a.com/flaky.jpgoutput"]
+    assert isinstance(output_urls[1], ImageProcessingError)
+    assert isinstance(output_urls[2], ImageProcessingError)
+    calls = Counter(backend.calls)
+    # an error that is not retryable fails at once, a retryable one is retried max_retries times
+    assert (calls["a.com/flaky.jpg"], calls["a.com/missing.jpg"], calls["a.com/down.jpg"]) == (
+        3,
+        1,
+        3,
+    )
+    with pytest.raises(ImageProcessingError):
+        engine.process_image_urls(["a.com/1.jpg", "a.com/gone.jpg"])
+
+
+def test_an_image_backing_off_gives_its_slot_to_the_next_image(start_engine: Any) -> None:
+    backend = ScriptedImageBackend(errors={"slow.com/1.jpg": [ConnectionError("reset")]})
+    engine = start_engine(backend, max_in_flight=1, retry_backoff_seconds=0.2)
+
+    output_urls = engine.submit_batch([["slow.com/1.jpg"], ["fast.com/2.jpg"]]).result(timeout=5)
+
+    assert output_urls == [["slow.com/1.jpgoutput"], ["fast.com/2.jpgoutput"]]
+    assert backend.calls == ["slow.com/1.jpg", "fast.com/2.jpg", "slow.com/1.jpg"]
+
+
+def test_images_are_processed_concurrently_within_the_caps(start_engine: Any) -> None:
+    backend = ScriptedImageBackend(errors={}, latency_seconds=0.02)
+    engine = start_engine(backend, max_in_flight=6, max_connections_per_host=2)
+
+    engine.submit_batch(
+        [[f"a.com/{index}.jpg", f"b.com/{index}.jpg", f"c.com/{index}.jpg"] for index in range(6)]
+    ).result(timeout=5)
+
+    assert backend.max_in_flight == Counter({"a.com": 2, "b.com": 2, "c.com": 2})
+
+
+def build_caching_processor(
+    backend: ImageBackend, start_engine: Any
+) -> Tuple[CachingImageProcessor, ImageResultCache]:
+    image_result_cache = ImageResultCache(
+        max_memory_entries=100, ttl_seconds=60, max_database_rows=100, eviction_interval_seconds=60
+    )
+    return (
+        CachingImageProcessor(
+            image_processor=start_engine(backend), image_result_cache=image_result_cache
+        ),
+        image_result_cache,
+    )
+
+
+def test_an_image_in_flight_is_processed_once(start_engine: Any) -> None:
+    backend = ScriptedImageBackend(errors={}, latency_seconds=0.2)
+    image_processor, _ = build_caching_processor(backend, start_engine)
+
+    first_batch = image_processor.submit_batch([["a.com/1.jpg", "a.com/2.jpg", "a.com/1.jpg"]])
+    second_batch = image_processor.submit_batch([["a.com/2.jpg"], ["a.com/3.jpg"]])
+
+    assert first_batch.result(timeout=5) == [
+        ["a.com/1.jpgoutput", "a.com/2.jpgoutput", "a.com/1.jpgoutput"]
+    ]
+    assert second_batch.result(timeout=5) == [["a.com/2.jpgoutput"], ["a.com/3.jpgoutput"]]
+    assert sorted(backend.calls) == ["a.com/1.jpg", "a.com/2.jpg", "a.com/3.jpg"]
+
+    assert image_processor.process_image_urls(["a.com/3.jpg"]) == ["a.com/3.jpgoutput"]
+    assert len(backend.calls) == 3
+
+
+def test_a_failed_image_is_not_cached(start_engine: Any) -> None:
+    backend = ScriptedImageBackend(errors={"a.com/1.jpg": [ValueError("404")]})
+    image_processor, image_result_cache = build_caching_processor(backend, start_engine)
+
+    output_urls = image_processor.submit_batch([["a.com/1.jpg"], ["a.com/2.jpg"]]).result(timeout=5)
+
+    assert isinstance(output_urls[0], ImageProcessingError)
+    assert output_urls[1] == ["a.com/2.jpgoutput"]
+    assert image_result_cache.get_many(["a.com/1.jpg", "a.com/2.jpg"]) == {
+        "a.com/2.jpg": "a.com/2.jpgoutput"
+    }
+    assert image_processor.process_image_urls(["a.com/1.jpg"]) == ["a.com/1.jpgoutput"]
+    assert backend.calls == ["a.com/1.jpg", "a.com/2.jpg", "a.com/1.jpg"]
+
+
+@pytest.fixture
+def image_server() -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    serves the images the http backend downloads and takes the uploads it makes
+    /busy.jpg answers 503 on its first request
+    """
+    web = pytest.importorskip("aiohttp.web")
+    served: Dict[str, Any] = {"gets": Counter(), "uploads": {}}
+
+    async def get_image(request: Any) -> Any:
+        name = request.match_info["name"]
+        served["gets"][name] += 1
+        if name == "missing.jpg" or (name == "busy.jpg" and served["gets"][name] == 1):
+            raise web.HTTPNotFound() if name == "missing.jpg" else web.HTTPServiceUnavailable()
+        return web.Response(body=f"content of {name}".encode("utf-8"))
+
+    async def put_upload(request: Any) -> Any:
+        served["uploads"][request.match_info["key"]] = await request.read()
+        return web.Response(status=201)
+
+    application = web.Application()
+    application.router.add_get("/images/{name}", get_image)
+    application.router.add_put("/uploads/{key}", put_upload)
+
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    async def start() -> Tuple[Any, int]:
+        runner = web.AppRunner(application)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        return runner, runner.addresses[0][1]
+
+    runner, port = asyncio.run_coroutine_threadsafe(start(), loop).result(timeout=5)
+    yield f"127.0.0.1:{port}", served
+    asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result(timeout=5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+
+def test_the_http_backend_downloads_and_uploads_every_image(
+    start_engine: Any, image_server: Tuple[str, Dict[str, Any]]
+) -> None:
+    host, served = image_server
+    engine = start_engine(
+        HttpImageBackend(
+            upload_base_url=f"http://{host}/uploads/",
+            max_connections=4,
+            max_connections_per_host=2,
+            timeout_seconds=5,
+        )
+    )
+    image_urls = [f"http://{host}/images/1.jpg", f"http://{host}/images/busy.jpg"]
+
+    output_urls = engine.submit_batch([image_urls, [f"http://{host}/images/missing.jpg"]]).result(
+        timeout=10
+    )
+
+    upload_keys = [
+        hashlib.sha256(image_url.encode("utf-8")).hexdigest() for image_url in image_urls
+    ]
+    assert output_urls[0] == [f"http://{host}/uploads/{upload_key}" for upload_key in upload_keys]
+    assert served["uploads"] == {
+        upload_keys[0]: b"content of 1.jpg",
+        upload_keys[1]: b"content of busy.jpg",
+    }
+    # the 503 is retried, the 404 is not
+    assert isinstance(output_urls[1], ImageProcessingError)
+    assert served["gets"] == Counter({"1.jpg": 1, "busy.jpg": 2, "missing.jpg": 1})
+
+
+def test_the_http_backend_retries_what_may_succeed_later() -> None:
+    aiohttp = pytest.importorskip("aiohttp")
+    backend = HttpImageBackend(
+        upload_base_url="http://uploads",
+        max_connections=1,
+        max_connections_per_host=1,
+        timeout_seconds=1,
+    )
+
+    def response_error(status: int) -> Exception:
+        return aiohttp.ClientResponseError(request_info=None, history=(), status=status)  # type: ignore[arg-type]
+
+    assert backend.is_retryable(response_error(503))
+    assert backend.is_retryable(response_error(429))
+    assert not backend.is_retryable(response_error(404))
+    assert backend.is_retryable(aiohttp.ClientConnectionError())
+    assert backend.is_retryable(asyncio.TimeoutError())
+    assert not backend.is_retryable(ValueError())
@@ -0,0 +1,136 @@
+import time
+from typing import Callable, Iterator
+
+import pytest
+
+from app.database import query_manager
+from app.database.models.csv_model import CsvModel
+from app.database.models.image_result_model import ImageResultModel
+from app.database.repository.csv_job_repository import CsvJobRepository
+from app.image_processing.image_backend import InProcessImageBackend
+from app.image_processing.image_processor import AsyncImageProcessingEngine, CachingImageProcessor
+from app.image_processing.image_result_cache import ImageResultCache
+from app.metrics import image_cache_lookups, registry
+from app.services import csv_ingestion_service, csv_service
+from app.services.csv_job_service import CsvJobService
+from app.services.csv_service import CsvUploadService
+
+
+def build_cache(**kwargs: int) -> ImageResultCache:
+    return ImageResultCache(
+        **{
+            "max_memory_entries": 100,
+            "ttl_seconds": 60,
+            "max_database_rows": 100,
+            "eviction_interval_seconds": 60,
+            **kwargs,
+        }
+    )
+
+
+def count_lookups(result: str) -> float:
+    prefix = f'image_result_cache_lookups_total{{result="{result}"}} '
+    return sum(
+        float(sample[len(prefix) :])
+        for sample in image_cache_lookups.render_samples()
+        if sample.startswith(prefix)
+    )
+
+
+def count_database_rows() -> int:
+    return query_manager.count_with_filter(
+        model=ImageResultModel, filters=ImageResultModel.id.isnot(None)
+    )
+
+
+def test_the_least_recently_used_result_leaves_memory_first() -> None:
+    image_result_cache = build_cache(max_memory_entries=2)
+    image_result_cache.put_many({"a.com/1.jpg": "out/1", "a.com/2.jpg": "out/2"})
+    # a lookup makes 1 the most recently used, so 2 makes room for 3
+    assert image_result_cache.get_many(["a.com/1.jpg"]) == {"a.com/1.jpg": "out/1"}
+    image_result_cache.put_many({"a.com/3.jpg": "out/3"})
+
+    assert image_result_cache.count_memory_entries() == 2
+    # nothing is flushed yet, so what left memory is gone
+    assert image_result_cache.get_many(["a.com/1.jpg", "a.com/2.jpg", "a.com/3.jpg"]) == {
+        "a.com/1.jpg": "out/1",
+        "a.com/3.jpg": "out/3",
+    }
+
+
+def test_a_result_that_left_memory_is_read_back_from_the_database() -> None:
+    image_result_cache = build_cache(max_memory_entries=1)
+    image_result_cache.put_many({"a.com/1.jpg": "out/1", "a.com/2.jpg": "out/2"})
+    image_result_cache.flush()
+    lookups = {result: count_lookups(result) for result in ("memory_hit", "database_hit", "miss")}
+
+    found = image_result_cache.get_many(["a.com/1.jpg", "a.com/2.jpg", "a.com/3.jpg"])
+
+    assert found == {"a.com/1.jpg": "out/1", "a.com/2.jpg": "out/2"}
+    assert {result: count_lookups(result) - count for result, count in lookups.items()} == {
+        "memory_hit": 1,
+        "database_hit": 1,
+        "miss": 1,
+    }
+    assert "image_result_cache_lookups_total" in registry.render()
+
+
+def test_an_expired_result_is_not_served_and_is_evicted() -> None:
+    image_result_cache = build_cache(ttl_seconds=0)
+    image_result_cache.put_many({"a.com/1.jpg": "out/1"})
+    image_result_cache.flush()
+    assert count_database_rows() == 1
+
+    assert image_result_cache.get_many(["a.com/1.jpg"]) == {}
+    assert build_cache().get_many(["a.com/1.jpg"]) == {}
+
+    image_result_cache.evict()
+    assert count_database_rows() == 0
+
+
+def test_the_oldest_rows_beyond_the_cap_are_evicted() -> None:
+    image_result_cache = build_cache(max_database_rows=2)
+    for index in range(4):
+        image_result_cache.put_many({f"a.com/{index}.jpg": f"out/{index}"})
+        image_result_cache.flush()
+        # created_at orders the rows
+        time.sleep(0.01)
+
+    image_result_cache.evict()
+
+    assert count_database_rows() == 2
+    assert build_cache().get_many([f"a.com/{index}.jpg" for index in range(4)]) == {
+        "a.com/2.jpg": "out/2",
+        "a.com/3.jpg": "out/3",
+    }
+
+
+@pytest.fixture
+def caching_image_processor(monkeypatch: pytest.MonkeyPatch) -> Iterator[CachingImageProcessor]:
+    image_processor = CachingImageProcessor(
+        image_processor=AsyncImageProcessingEngine(backend=InProcessImageBackend()),
+        image_result_cache=build_cache(),
+    )
+    for service_module in (csv_ingestion_service, csv_service):
+        monkeypatch.setattr(service_module, "get_image_processor", lambda: image_processor)
+    yield image_processor
+    image_processor.shutdown()
+
+
+@pytest.mark.usefixtures("caching_image_processor")
+def test_the_results_of_a_job_are_stored_once_it_is_done(
+    store_csv: Callable[..., CsvModel],
+) -> None:
+    csv_model = store_csv(
+        'S. No.,Product Name,Input Image Urls\n1,first,"a.com/1.jpg,a.com/2.jpg"\n'
+    )
+    CsvJobRepository.enqueue_csv_file(csv_file_id=csv_model.id, total_rows=csv_model.row_count)
+
+    assert CsvJobService.process_next_job(
+        worker_id="worker-a", job_handler=CsvUploadService.process_csv_job
+    )
+
+    assert build_cache().get_many(["a.com/1.jpg", "a.com/2.jpg"]) == {
+        "a.com/1.jpg": "a.com/1.jpgoutput",
+        "a.com/2.jpg": "a.com/2.jpgoutput",
+    }
@@ -0,0 +1,141 @@
+from typing import Callable, List
+
+import pytest
+
+from app.database.models.csv_model import CsvModel
+from app.database.repository.csv_job_repository import CsvJobRepository
+from app.metrics import (
+    Counter,
+    Gauge,
+    Histogram,
+    Metric,
+    MetricsRegistry,
+    query_manager_call_seconds,
+    query_manager_errors,
+    registry,
+    timed_query,
+)
+
+
+def find_sample(samples: List[str], prefix: str) -> float:
+    values = [float(sample[len(prefix) :]) for sample in samples if sample.startswith(prefix)]
+    return values[0] if values else 0.0
+
+
+def test_a_counter_adds_up_per_label_values() -> None:
+    counter = Counter("rows_total", "rows", label_names=("outcome",))
+
+    counter.inc(outcome="inserted")
+    counter.inc(3, outcome="inserted")
+    counter.inc(outcome="failed")
+
+    assert sorted(counter.render_samples()) == [
+        'rows_total{outcome="failed"} 1',
+        'rows_total{outcome="inserted"} 4',
+    ]
+    with pytest.raises(ValueError):
+        counter.inc(stage="parse")
+
+
+def test_a_histogram_counts_every_observation_in_its_bucket_and_those_above() -> None:
+    histogram = Histogram("seconds", "time", label_names=("stage",), buckets=(0.1, 1.0))
+
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value, stage="parse")
+
+    assert histogram.render_samples() == [
+        'seconds_bucket{stage="parse",le="0.1"} 2',
+        'seconds_bucket{stage="parse",le="1.0"} 3',
+        'seconds_bucket{stage="parse",le="+Inf"} 4',
+        'seconds_sum{stage="parse"} 2.65',
+        'seconds_count{stage="parse"} 4',
+    ]
+
+
+def test_a_histogram_times_a_block_even_when_it_raises() -> None:
+    histogram = Histogram("seconds", "time", buckets=(60.0,))
+
+    with pytest.raises(RuntimeError):
+        with histogram.time():
+            raise RuntimeError("boom")
+
+    assert histogram.render_samples()[0] == 'seconds_bucket{le="60.0"} 1'
+
+
+def test_the_registry_renders_the_prometheus_text_format() -> None:
+    metrics_registry = MetricsRegistry()
+    counter = metrics_registry.register(
+        Counter("uploads_total", "uploaded files", label_names=("name",))
+    )
+    metrics_registry.register(Gauge("queue_depth", "queued jobs", read_values=lambda: {(): 3}))
+    counter.inc(name='a "quoted"\\name\n')
+
+    assert metrics_registry.render() == (
+        "# HELP uploads_total uploaded files\n"
+        "# TYPE uploads_total counter\n"
+        'uploads_total{name="a \\"quoted\\"\\\\name\\n"} 1\n'
+        "# HELP queue_depth queued jobs\n"
+        "# TYPE queue_depth gauge\n"
+        "queue_depth 3\n"
+    )
+    with pytest.raises(ValueError):
+        metrics_registry.register(Counter("uploads_total", "uploaded files again"))
+
+
+def test_a_gauge_that_cannot_be_read_does_not_break_the_others() -> None:
+    metrics_registry = MetricsRegistry()
+
+    def read_values() -> dict:
+        raise RuntimeError("database is down")
+
+    metrics_registry.register(Gauge("broken", "broken", read_values=read_values))
+    metrics_registry.register(Gauge("working", "working", read_values=lambda: {(): 1}))
+
+    rendered = metrics_registry.render()
+
+    assert "# broken could not be read" in rendered
+    assert "working 1" in rendered
+
+
+def test_a_metric_has_to_render_its_samples() -> None:
+    class Unrenderable(Metric):
+        metric_type = "untyped"
+
+    with pytest.raises(TypeError):
+        Unrenderable("unrenderable", "no samples")  # type: ignore[abstract]
+
+
+def test_a_timed_query_records_its_duration_and_its_errors() -> None:
+    @timed_query
+    def failing_query(fail: bool) -> str:
+        if fail:
+            raise ValueError("no such table")
+        return "rows"
+
+    count_prefix = 'query_manager_call_duration_seconds_count{function="failing_query"} '
+    error_prefix = 'query_manager_errors_total{function="failing_query"} '
+    calls = find_sample(query_manager_call_seconds.render_samples(), count_prefix)
+    errors = find_sample(query_manager_errors.render_samples(), error_prefix)
+
+    assert failing_query(fail=False) == "rows"
+    with pytest.raises(ValueError):
+        failing_query(fail=True)
+
+    assert find_sample(query_manager_call_seconds.render_samples(), count_prefix) == calls + 2
+    assert find_sample(query_manager_errors.render_samples(), error_prefix) == errors + 1
+
+
+def test_the_jobs_by_status_are_counted_in_one_query(store_csv: Callable[..., CsvModel]) -> None:
+    for s_no in range(3):
+        csv_model = store_csv(f"S. No.,Product Name,Input Image Urls\n{s_no},name,a.com/1.jpg\n")
+        CsvJobRepository.enqueue_csv_file(csv_file_id=csv_model.id, total_rows=1)
+    CsvJobRepository.claim_next_job(lease_owner="worker-a", lease_seconds=300, max_attempts=3)
+    count_prefix = 'query_manager_call_duration_seconds_count{function="count_grouped_by"} '
+    calls = find_sample(query_manager_call_seconds.render_samples(), count_prefix)
+
+    rendered = registry.render()
+
+    assert 'csv_jobs_by_status{status="PENDING"} 2' in rendered
+    assert 'csv_jobs_by_status{status="RUNNING"} 1' in rendered
+    assert 'csv_jobs_by_status{status="FAILED"} 0' in rendered
+    assert find_sample(query_manager_call_seconds.render_samples(), count_prefix) == calls + 1
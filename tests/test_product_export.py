@@ -0,0 +1,187 @@
+import io
+import json
+from typing import Callable, List, Optional
+
+import pytest
+from flask.testing import FlaskClient
+
+from app.database.models.csv_model import CsvModel
+from app.database.repository.csv_job_repository import CsvJobRepository
+from app.exceptions.not_acceptable_error import NotAcceptableError
+from app.services import product_export_service
+from app.services.csv_job_service import CsvJobService
+from app.services.csv_service import CsvUploadService
+from app.services.product_export_service import ProductExportFormat, ProductExportService
+
+CSV_CONTENT = "S. No.,Product Name,Input Image Urls\n" + "".join(
+    f'{s_no},product {s_no},"a.com/{s_no}.jpg,b.com/{s_no}.jpg"\n' for s_no in range(1, 6)
+)
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+PRODUCT_ROWS = [
+    ("1", "first", ["a.com/1.jpg"], ["out/1.jpg"], 1),
+    ("2", "second", None, None, 2),
+]
+
+
+@pytest.fixture
+def without_pyarrow(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(product_export_service, "is_pyarrow_installed", lambda: False)
+
+
+@pytest.fixture
+def with_pyarrow(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(product_export_service, "is_pyarrow_installed", lambda: True)
+
+
+@pytest.fixture
+def ingested_csv(store_csv: Callable[..., CsvModel]) -> CsvModel:
+    csv_model = store_csv(CSV_CONTENT)
+    CsvJobRepository.enqueue_csv_file(csv_file_id=csv_model.id, total_rows=csv_model.row_count)
+    assert CsvJobService.process_next_job(
+        worker_id="worker-a", job_handler=CsvUploadService.process_csv_job
+    )
+    return csv_model
+
+
+@pytest.mark.usefixtures("with_pyarrow")
+@pytest.mark.parametrize(
+    "format_name, accept_header, export_format",
+    [
+        (None, None, ProductExportFormat.CSV),
+        (None, "*/*", ProductExportFormat.CSV),
+        # nothing the exports offer, the csv as before
+        (None, "text/html", ProductExportFormat.CSV),
+        (None, "application/x-ndjson", ProductExportFormat.NDJSON),
+        (None, f"text/csv;q=0.5, {ARROW_MEDIA_TYPE}", ProductExportFormat.ARROW),
+        (None, "application/vnd.apache.parquet", ProductExportFormat.PARQUET),
+        ("NDJSON", ARROW_MEDIA_TYPE, ProductExportFormat.NDJSON),
+        ("parquet", None, ProductExportFormat.PARQUET),
+    ],
+)
+def test_the_format_is_asked_for_or_negotiated(
+    format_name: Optional[str], accept_header: Optional[str], export_format: ProductExportFormat
+) -> None:
+    assert ProductExportService.negotiate_format(format_name, accept_header) == export_format
+
+
+@pytest.mark.usefixtures("without_pyarrow")
+@pytest.mark.parametrize(
+    "format_name, accept_header, export_format",
+    [
+        (None, None, ProductExportFormat.CSV),
+        (None, f"{ARROW_MEDIA_TYPE}, */*;q=0.1", ProductExportFormat.CSV),
+        (None, f"{ARROW_MEDIA_TYPE}, application/x-ndjson;q=0.5", ProductExportFormat.NDJSON),
+        (None, ARROW_MEDIA_TYPE, None),
+        (None, "application/vnd.apache.parquet", None),
+        ("arrow", None, None),
+        ("parquet", "text/csv", None),
+    ],
+)
+def test_formats_without_pyarrow_are_not_offered(
+    format_name: Optional[str],
+    accept_header: Optional[str],
+    export_format: Optional[ProductExportFormat],
+) -> None:
+    assert ProductExportService.get_supported_formats() == [
+        ProductExportFormat.CSV,
+        ProductExportFormat.NDJSON,
+    ]
+    if export_format is not None:
+        assert ProductExportService.negotiate_format(format_name, accept_header) == export_format
+        return
+
+    with pytest.raises(NotAcceptableError) as error_info:
+        ProductExportService.negotiate_format(format_name, accept_header)
+    assert error_info.value.supported_formats == ["csv", "ndjson"]
+
+
+def test_an_unknown_format_is_a_bad_request(client: FlaskClient, ingested_csv: CsvModel) -> None:
+    response = client.get(f"/csvdownload/{ingested_csv.id}?format=xlsx")
+
+    assert response.status_code == 400
+    assert "unknown export format = xlsx" in response.get_json()["message"]
+
+
+@pytest.mark.usefixtures("without_pyarrow")
+@pytest.mark.parametrize(
+    "query_string, headers",
+    [
+        ("?format=arrow", {}),
+        ("?format=parquet", {}),
+        ("", {"Accept": ARROW_MEDIA_TYPE}),
+    ],
+)
+def test_a_format_that_needs_pyarrow_is_not_acceptable_without_it(
+    client: FlaskClient, ingested_csv: CsvModel, query_string: str, headers: dict
+) -> None:
+    response = client.get(f"/csvdownload/{ingested_csv.id}{query_string}", headers=headers)
+
+    assert response.status_code == 406
+    assert response.get_json()["error"] == "NOT_ACCEPTABLE"
+    assert response.get_json()["data"] == {"supportedFormats": ["csv", "ndjson"]}
+
+
+def test_the_products_are_downloaded_as_ndjson(client: FlaskClient, ingested_csv: CsvModel) -> None:
+    response = client.get(
+        f"/csvdownload/{ingested_csv.id}", headers={"Accept": "application/x-ndjson"}
+    )
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert "filename=output.ndjson" in response.headers["Content-Disposition"]
+    assert "Accept" in response.headers["Vary"]
+    products = [json.loads(line) for line in response.data.decode("utf-8").splitlines()]
+    assert [product["s_no"] for product in products] == ["1", "2", "3", "4", "5"]
+    assert products[0] == {
+        "s_no": "1",
+        "product_name": "product 1",
+        "input_image_urls": ["a.com/1.jpg", "b.com/1.jpg"],
+        "output_image_urls": ["a.com/1.jpgoutput", "b.com/1.jpgoutput"],
+    }
+
+
+def test_ndjson_is_written_a_page_at_a_time() -> None:
+    chunks = list(
+        ProductExportService.iter_export(
+            export_format=ProductExportFormat.NDJSON, product_rows=PRODUCT_ROWS, page_size=1
+        )
+    )
+
+    assert [json.loads(chunk) for chunk in chunks] == [
+        {
+            "s_no": "1",
+            "product_name": "first",
+            "input_image_urls": ["a.com/1.jpg"],
+            "output_image_urls": ["out/1.jpg"],
+        },
+        {"s_no": "2", "product_name": "second", "input_image_urls": [], "output_image_urls": []},
+    ]
+
+
+@pytest.mark.parametrize("export_format", [ProductExportFormat.ARROW, ProductExportFormat.PARQUET])
+def test_the_columnar_formats_keep_the_image_urls_as_lists(
+    export_format: ProductExportFormat,
+) -> None:
+    pyarrow = pytest.importorskip("pyarrow")
+    from pyarrow import ipc, parquet
+
+    export = b"".join(
+        ProductExportService.iter_export(
+            export_format=export_format, product_rows=PRODUCT_ROWS, page_size=1
+        )
+    )
+
+    if export_format == ProductExportFormat.ARROW:
+        table = ipc.open_stream(pyarrow.BufferReader(export)).read_all()
+    else:
+        table = parquet.read_table(io.BytesIO(export))
+    products: List[dict] = table.to_pylist()
+    assert products == [
+        {
+            "s_no": "1",
+            "product_name": "first",
+            "input_image_urls": ["a.com/1.jpg"],
+            "output_image_urls": ["out/1.jpg"],
+        },
+        {"s_no": "2", "product_name": "second", "input_image_urls": [], "output_image_urls": []},
+    ]
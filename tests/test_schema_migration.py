@@ -0,0 +1,188 @@
+import hashlib
+import io
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Set
+
+import pytest
+from sqlalchemy import create_engine, insert, inspect, select, text
+from sqlalchemy.engine import Engine
+
+from app.database import query_manager, schema_migration
+from app.database.models.base import Base
+from app.database.models.csv_model import CsvModel
+from app.storage.blob_store import get_blob_store
+
+# the tables as the first release created them, the file was kept in CSV_FILES.csv_file
+FIRST_RELEASE_SCHEMA = [
+    """
+    CREATE TABLE "CSV_FILES" (
+        "ID" VARCHAR(100) NOT NULL,
+        csv_file BLOB,
+        is_processed BOOLEAN NOT NULL,
+        "METADATA" JSON NOT NULL,
+        "CREATED_AT" DATETIME NOT NULL,
+        "UPDATED_AT" DATETIME NOT NULL,
+        PRIMARY KEY ("ID")
+    )
+    """,
+    'CREATE INDEX "ix_CSV_FILES_ID" ON "CSV_FILES" ("ID")',
+    """
+    CREATE TABLE "PRODUCTS" (
+        "ID" VARCHAR(100) NOT NULL,
+        "CSV_FILE_ID" VARCHAR(100) NOT NULL,
+        "PRODUCT_SL_NO" VARCHAR(255) NOT NULL,
+        "PRODUCT_NAME" VARCHAR(255) NOT NULL,
+        "INPUT_PRODUCT_IMAGE_URLS" JSON NOT NULL,
+        "OUTPUT_PRODUCT_IMAGE_URLS" JSON NOT NULL,
+        "METADATA" JSON NOT NULL,
+        "CREATED_AT" DATETIME NOT NULL,
+        "UPDATED_AT" DATETIME NOT NULL,
+        PRIMARY KEY ("ID"),
+        FOREIGN KEY("CSV_FILE_ID") REFERENCES "CSV_FILES" ("ID")
+    )
+    """,
+    'CREATE INDEX "ix_PRODUCTS_CSV_FILE_ID" ON "PRODUCTS" ("CSV_FILE_ID")',
+    'CREATE INDEX "ix_PRODUCTS_ID" ON "PRODUCTS" ("ID")',
+]
+CSV_CONTENT = (
+    b'SNO,Product_Name,Input_image_urls\n1,first,a.com/1.jpg\n2,"second\nline",a.com/2.jpg'
+)
+
+
+@pytest.fixture
+def first_release_engine(tmp_path: Path) -> Engine:
+    engine = create_engine(f"sqlite:///{tmp_path / 'first_release.db'}")
+    with engine.begin() as connection:
+        for statement in FIRST_RELEASE_SCHEMA:
+            connection.execute(text(statement))
+        connection.execute(
+            text(
+                "INSERT INTO \"CSV_FILES\" VALUES (:id, :csv_file, 1, '{}', :now, :now), "
+                "(:empty_id, NULL, 0, '{}', :now, :now)"
+            ),
+            {
+                "id": "csv_9ddb0318a6",
+                "empty_id": "csv_0000000000",
+                "csv_file": CSV_CONTENT,
+                "now": datetime.now(),
+            },
+        )
+        # products were read in any order, 9 is in no row of the file
+        connection.execute(
+            text(
+                "INSERT INTO \"PRODUCTS\" VALUES (:id, 'csv_9ddb0318a6', :s_no, 'name', "
+                "'[]', '[]', '{}', :now, :now)"
+            ),
+            [
+                {"id": product_id, "s_no": s_no, "now": datetime.now()}
+                for product_id, s_no in [("product_a", "2"), ("product_b", "1"), ("product_c", "9")]
+            ],
+        )
+    return engine
+
+
+def upgrade(engine: Engine) -> None:
+    # what query_manager does on import
+    Base.metadata.create_all(engine)
+    schema_migration.migrate(engine)
+
+
+def get_column_names(engine: Engine, table_name: str) -> Set[str]:
+    return {column["name"] for column in inspect(engine).get_columns(table_name)}
+
+
+def test_the_files_of_the_first_release_are_moved_to_the_blob_store(
+    first_release_engine: Engine,
+) -> None:
+    upgrade(first_release_engine)
+
+    assert "csv_file" not in get_column_names(first_release_engine, "CSV_FILES")
+    with first_release_engine.connect() as connection:
+        csv_files = connection.execute(
+            text('SELECT "ID", "BLOB_KEY", "SIZE_BYTES", "ROW_COUNT" FROM "CSV_FILES"')
+        ).all()
+    blob_key = hashlib.sha256(CSV_CONTENT).hexdigest()
+    assert sorted(csv_files) == [
+        ("csv_0000000000", "", 0, 0),
+        ("csv_9ddb0318a6", blob_key, len(CSV_CONTENT), 2),
+    ]
+    assert b"".join(get_blob_store().iter_chunks(blob_key)) == CSV_CONTENT
+
+
+def test_an_upgraded_database_is_left_as_it_is(first_release_engine: Engine) -> None:
+    upgrade(first_release_engine)
+    with first_release_engine.connect() as connection:
+        schema = connection.execute(text("SELECT sql FROM sqlite_master ORDER BY name")).all()
+
+    upgrade(first_release_engine)
+
+    with first_release_engine.connect() as connection:
+        assert (
+            connection.execute(text("SELECT sql FROM sqlite_master ORDER BY name")).all() == schema
+        )
+    assert inspect(first_release_engine).get_indexes("CSV_FILES")
+
+
+def test_the_files_of_the_first_release_are_plain_uploads(first_release_engine: Engine) -> None:
+    upgrade(first_release_engine)
+
+    supplier_id_column = next(
+        column
+        for column in inspect(first_release_engine).get_columns("CSV_FILES")
+        if column["name"] == "SUPPLIER_ID"
+    )
+    assert supplier_id_column["nullable"]
+    with first_release_engine.begin() as connection:
+        assert connection.execute(text('SELECT "SUPPLIER_ID" FROM "CSV_FILES"')).all() == [
+            (None,),
+            (None,),
+        ]
+        # the dedup lookup of an upload runs on the upgraded table
+        assert connection.execute(
+            select(CsvModel.id).where(
+                CsvModel.blob_key == hashlib.sha256(CSV_CONTENT).hexdigest(),
+                CsvModel.supplier_id.is_(None),
+            )
+        ).scalars().all() == ["csv_9ddb0318a6"]
+
+
+def test_an_old_file_uploaded_again_is_found_by_its_content(
+    store_csv: Callable[..., CsvModel],
+) -> None:
+    blob_info = get_blob_store().put_stream(io.BytesIO(CSV_CONTENT))
+    with query_manager.database_engine.begin() as connection:
+        # a row moved out of csv_file keeps the id computed from the content
+        connection.execute(
+            insert(CsvModel).values(
+                id="csv_9ddb0318a6",
+                blob_key=blob_info.key,
+                size_bytes=blob_info.size_bytes,
+                row_count=2,
+                is_processed=True,
+                meta_data={},
+                created_at=datetime.now(),
+                updated_at=datetime.now(),
+            )
+        )
+
+    csv_model = store_csv(CSV_CONTENT.decode("utf-8"))
+
+    assert csv_model.id == "csv_9ddb0318a6"
+    assert query_manager.count_with_filter(model=CsvModel, filters=CsvModel.id.isnot(None)) == 1
+
+
+def test_the_products_of_the_first_release_are_numbered_in_file_order(
+    first_release_engine: Engine,
+) -> None:
+    upgrade(first_release_engine)
+
+    with first_release_engine.connect() as connection:
+        row_numbers = connection.execute(
+            text('SELECT "ID", "ROW_NUMBER" FROM "PRODUCTS" ORDER BY "ID"')
+        ).all()
+    assert row_numbers == [("product_a", 2), ("product_b", 1), ("product_c", 0)]
+    assert {
+        "ix_PRODUCTS_CSV_FILE_ID_ROW_NUMBER",
+        "ix_PRODUCTS_CSV_FILE_ID_PRODUCT_SL_NO",
+    } <= {index["name"] for index in inspect(first_release_engine).get_indexes("PRODUCTS")}